@@ -1,68 +1,89 @@
 import json
+import math
+import os
 
 import pandas as pd
 import requests
 import yaml
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, abort, render_template, request, jsonify
 from flask_paginate import Pagination, get_page_parameter
 
-from pyecharts import options as opts
-from pyecharts.charts import Bar, Line, Grid, Pie, Tab
-from pyecharts.commons.utils import JsCode
-from bs4 import BeautifulSoup
-from datetime import datetime
 from flask_cors import CORS
-from web3 import Web3, HTTPProvider
+from web3 import Web3
 
+from cdf_engine import CDF_SCALES, cdf_registry
+from chart_cache import chart_cache
+from downsample import DOWNSAMPLE_METHODS, downsample_indices
+from instrumentation import PROMETHEUS_CONTENT_TYPE, instrument, metrics_registry, phase
+from quantile_sketch import quantile_summary
+from rpc_client import PooledHTTPProvider, RpcClient
+from csv_cache import csv_tail_cache
+from summary_index import shorten_id, summary_index
+from summary_stream import SummaryBroadcaster
+from timeutil import NAT, duration_seconds, parse_time_scalar
+from tx_counter import TxCounter
+from txpool_tps import txpool_tps_registry
 
-client = Web3(HTTPProvider("http://localhost:8546"))
+
+# 节点访问层：连接池、相同请求合并、链头相关结果短时缓存、历史区块LRU缓存，Web3和交易计数器共用
+rpc = RpcClient("http://localhost:8546")
+client = Web3(PooledHTTPProvider(rpc))
+# 交易总数计数状态文件，进程重启后从上次统计到的高度继续
+tx_counter = TxCounter(rpc, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tx_count_state.json"))
 
 
 app = Flask(__name__, template_folder='templates', static_folder='resource', static_url_path="/")
 CORS(app, supports_credentials=True)
 
-filepath = "/Users/bethestar/Downloads/ethlog/mylog"
-config_server = "127.0.0.1:9527"
-
-# 把pyecharts自动生成的完整html文件转化成能嵌入到展示小模块的代码
-def parse_html(html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
-    chart_id = soup.find("div", {"class": "chart-container"}).get("id")
-    chart_js = soup.find_all("script")[1]
-    chart = "<div class=\"panel-draw d-flex flex-column justify-content-center align-items-center\" id=\"" + chart_id + "\"></div>"
-    return chart, chart_js
 
+# 请求计时的路由标签：/api/<metric>按指标区分，未知指标和未匹配的路径各归为一类，避免标签无限增长
+def route_label():
+    if request.url_rule is None:
+        return '<unmatched>'
+    metric = (request.view_args or {}).get('metric')
+    if metric in metric_builders:
+        return '/api/' + metric
+    return request.url_rule.rule
+
+
+instrument(app, route_label)
+metrics_registry.callback('dashboard_chart_cache_requests_total', 'Chart cache lookups by result.', 'counter',
+                          lambda: {('hit',): chart_cache.stats()['hits'], ('miss',): chart_cache.stats()['misses']},
+                          ['result'])
+metrics_registry.callback('dashboard_chart_cache_evictions_total', 'Chart cache evictions.', 'counter',
+                          lambda: {(): chart_cache.stats()['evictions']})
+metrics_registry.callback('dashboard_chart_cache_bytes', 'Bytes held by the chart cache.', 'gauge',
+                          lambda: {(): chart_cache.stats()['bytes']})
+metrics_registry.callback('dashboard_csv_cache_reads_total',
+                          'Recorder file reads by kind (hit: unchanged, tail: appended rows, full: whole file).',
+                          'counter', lambda: {(kind,): count for kind, count in csv_tail_cache.stats().items()
+                                              if kind != 'files'}, ['kind'])
 
-# 【针对有多个tab的情况】把pyecharts自动生成的完整html文件转化成能嵌入到展示小模块的代码
-def parse_html_tab(html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
-    chart = soup.body
-    return chart, ""
-
-
-# 截短过长的哈希值
-def shorten_id(node_id):
-    return "0x" + node_id[:8] + "..."
+filepath = "/Users/bethestar/Downloads/ethlog/mylog"
+config_server = "127.0.0.1:9527"
 
+# 单条序列返回给前端的点数预算
+DEFAULT_CHART_POINTS = 2000
+MIN_CHART_POINTS = 100
+MAX_CHART_POINTS = 20000
+# CDF曲线的分段数
+DEFAULT_CDF_BINS = 50
+MAX_CDF_BINS = 1000
 
 # 读取csv文件，去掉重复表头行
-def read_csv_without_duplicates(path):
-    # 暂存表头
-    header = pd.read_csv(path, nrows=0).columns.tolist()
-    # 读取CSV文件，忽略表头
-    df = pd.read_csv(path, skiprows=[0])
-    # 删除所有重复行
-    df = df.drop_duplicates(keep=False)
-    # 将原始表头添加回DataFrame
-    df.columns = header
-    return df
+# 按文件缓存已读内容，只增量解析上次读取之后追加的部分；columns为需要的列，默认全部，
+# ns中的时间列只用于计算时间差，读成int64纳秒时间戳
+def read_csv_without_duplicates(path, columns=None, ns=()):
+    with phase('load'):
+        return csv_tail_cache.read(path, columns, ns)
 
 # 根据格式化好的时间计算duration（返回的时间不带's'结尾）
 def calculate_duration(end_time, start_time):
-    formatted_time = "%Y-%m-%d %H:%M:%S.%f"
-    end_time = datetime.strptime(end_time, formatted_time)
-    start_time = datetime.strptime(start_time, formatted_time)
-    return (end_time - start_time).total_seconds()
+    end_ns = parse_time_scalar(end_time)
+    start_ns = parse_time_scalar(start_time)
+    if end_ns == NAT or start_ns == NAT:
+        raise ValueError("time format error: " + end_time + ", " + start_time)
+    return (end_ns - start_ns) / 1e9
 
 # 将Sub()函数获取的duration进行统一为s处理
 def convert_duration_to_seconds(duration_str):
@@ -87,106 +108,74 @@ def convert_duration_to_seconds(duration_str):
         return float('nan')
     return duration_seconds
 
-# 统计分段并生成CDF图
-def construct_cdf_chart(df, num_bins, title_name):
-    # 将数据转换为float类型
-    df = df.astype(float)
-    # 移除负数和NaN值
-    df = df[df >= 0].dropna()
-    # 对数据进行分段
-    bin_edges = pd.cut(df, bins=num_bins, include_lowest=True)
-    # 统计每个分段的数量
-    value_counts = bin_edges.value_counts(sort=False)
-    # 计算累积频数
-    cdf = value_counts.sort_index().cumsum()
-    # 计算累积频数的百分比
-    cdf_percent = cdf / cdf.iloc[-1] * 100
-
-    # 保证从原点开始绘制CDF
-    # 获取数据的最小值
-    min_value = df.min()
-    # 创建一个从0到最小值的区间，并将其累积分布百分比设为0
-    cdf_percent = pd.concat([pd.Series([0], index=[pd.Interval(0, min_value, closed='left')]), cdf_percent])
-
-    # 创建CDF图
-    cdf_chart = (
-        Line()
-        .add_xaxis(cdf_percent.index.astype(str).tolist())
-        .add_yaxis(series_name="累积分布",
-                   y_axis=cdf_percent.tolist(),
-                   areastyle_opts=opts.AreaStyleOpts(opacity=1, color="#173c8550"),
-                   # label_opts=opts.LabelOpts(formatter="{@[1]}%",position="bottom")  # 格式化标签并放在数据点下方
-
-                   label_opts=opts.LabelOpts(formatter=JsCode(
-                            """
-                            function (params) {
-                                console.log(params);
-                                return (params.value[1] * 1).toFixed(3) + '%';
-                            }
-                            """
-                        ), position="right")
-                   )
-        .set_global_opts(
-            title_opts=opts.TitleOpts(title=title_name + "累积分布函数"),
-            toolbox_opts=opts.ToolboxOpts(),
-            datazoom_opts=[opts.DataZoomOpts(range_start=0, range_end=100)],
-            xaxis_opts=opts.AxisOpts(name=title_name + "区间"),
-            yaxis_opts=opts.AxisOpts(name="累积分布百分比"),
-            tooltip_opts=opts.TooltipOpts(),
-        )
-    )
-    return cdf_chart
+# 按输入文件指纹缓存路由渲染结果，filenames为该路由读取的记录文件
+def cached_chart(*filenames):
+    return chart_cache.cached(lambda **kwargs: [filepath + '/' + name for name in filenames])
 
 
+# 把一列数据转换成可JSON序列化的列表，NaN转换为null
+def to_json_list(values):
+    values = pd.Series(values)
+    return values.astype(object).where(values.notna(), None).tolist()
 
-@app.route('/')
-def index():
-    # ---区块信息汇总---
-    df_start_commit = read_csv_without_duplicates(filepath + '/block_commit_duration_start.csv')
-    df_end_commit = read_csv_without_duplicates(filepath + '/block_commit_duration_end.csv')
-
-    df_start_commit = df_start_commit.rename(columns={'measure_time': '打包时刻'})
-    df_end_commit = df_end_commit.rename(columns={'measure_time': '落库时刻'})
-
-    df_commit = pd.merge(df_start_commit, df_end_commit, on='block_height')
-    df_commit.drop_duplicates(subset='block_height', keep='last', inplace=True)
 
-    df_commit.loc[:, 'block_hash'] = df_commit.loc[:, 'block_hash'].apply(lambda x: shorten_id(x))
+# 构造一条列式序列：x轴数组、y轴数组以及可选的附加列（如block_hash）
+def make_series(x, y, name=None, **extra):
+    series = {'x': pd.Series(x).reset_index(drop=True), 'y': pd.Series(y).reset_index(drop=True),
+              'extra': {key: pd.Series(value).reset_index(drop=True) for key, value in extra.items()}}
+    if name is not None:
+        series['name'] = name
+    return series
 
-    df_valid = read_csv_without_duplicates(filepath + '/block_validation_efficiency.csv')
-    df = pd.merge(df_valid, df_commit, on='block_height')
 
-    df = df.dropna()
+# 截取序列在[start%, end%)范围内的部分并降采样到points个点以内，转换为列式JSON
+# index为保留点在完整序列中的下标，total为完整序列长度，前端缩放时据此换算新的范围
+def series_to_json(series, start, end, points, method):
+    total = len(series['y'])
+    lo = min(total, max(0, int(total * start / 100)))
+    hi = min(total, max(lo, int(math.ceil(total * end / 100))))
+    index = downsample_indices(series['y'].astype(float), lo, hi, points, method)
+    res = {'x': to_json_list(series['x'].iloc[index]), 'y': to_json_list(series['y'].iloc[index]),
+           'index': index.tolist(), 'total': total, 'downsampled': len(index) < hi - lo}
+    if 'name' in series:
+        res['name'] = series['name']
+    if series['extra']:
+        res['extra'] = {key: to_json_list(value.iloc[index]) for key, value in series['extra'].items()}
+    return res
 
-    df.rename(columns={'start_time': '开始验证时刻'}, inplace=True)
-    df.rename(columns={'end_time': '结束验证时刻'}, inplace=True)
-    df.rename(columns={'block_height': '块高'}, inplace=True)
-    df.rename(columns={'block_hash': '区块哈希'}, inplace=True)
-    df.rename(columns={'block_tx_count_x': '交易数量'}, inplace=True)
 
-    df = df[['块高', '区块哈希', '交易数量', '打包时刻', '开始验证时刻', '结束验证时刻', '落库时刻']]
-    df = df.reindex(columns=['块高', '区块哈希', '交易数量', '打包时刻', '开始验证时刻', '结束验证时刻', '落库时刻'])
+# 获取数值列中的最大值最小值，用于visualMap，没有数据时为0~100
+def value_range(values):
+    values = pd.Series(values).astype(float).dropna()
+    if len(values) == 0:
+        return {'min': 0, 'max': 100}
+    return {'min': float(values.min()), 'max': float(values.max())}
 
-    # ---交易信息汇总---
-    df_tx_queue = read_csv_without_duplicates(filepath + '/tx_queue_delay.csv')
-    df_in = df_tx_queue.loc[df_tx_queue['in/outFlag'] == 'in']
-    df_out = df_tx_queue.loc[df_tx_queue['in/outFlag'] == 'out']
 
-    df_in = df_in.rename(columns={'measure_time': '进入交易池时刻'})
-    df_out = df_out.rename(columns={'measure_time': '离开交易池时刻'})
-    df_tx_queue = pd.merge(df_in, df_out, on='tx_hash')
+# 延时类指标的取值范围，附带整体的p50/p90/p99/max分位数
+def latency_summary(values):
+    summary = value_range(values)
+    summary['quantiles'] = quantile_summary(values)
+    return summary
 
-    df_tx_block = read_csv_without_duplicates(filepath + '/tx_delay_end.csv')[['tx_hash', 'block_height']]
-    df_tx = pd.merge(df_tx_queue, df_tx_block, on='tx_hash')
 
-    df_tx.loc[:, 'tx_hash'] = df_tx.loc[:, 'tx_hash'].apply(lambda x: shorten_id(x))
+# 统计分段并生成CDF数据：按指标增量维护直方图，x为数值端点
+# 分段方式由请求参数cdf（log/quantile/linear，默认log）指定，段数由cdf_bins指定
+def cdf_data(metric, values):
+    scale = request.args.get('cdf', 'log')
+    if scale not in CDF_SCALES:
+        abort(400)
+    bins = min(MAX_CDF_BINS, max(1, request.args.get('cdf_bins', type=int, default=DEFAULT_CDF_BINS)))
+    return cdf_registry.points(metric, pd.Series(values).astype(float).to_numpy(), bins, scale)
 
-    df_tx.rename(columns={'block_height': '落库块高'}, inplace=True)
-    df_tx.rename(columns={'tx_hash': '交易哈希'}, inplace=True)
-
-    df_tx = df_tx[['交易哈希', '进入交易池时刻', '离开交易池时刻', '落库块高']]
-    df_tx = df_tx.reindex(columns=['交易哈希', '进入交易池时刻', '离开交易池时刻', '落库块高'])
 
+@app.route('/')
+@cached_chart('block_commit_duration_start.csv',
+              'block_commit_duration_end.csv',
+              'block_validation_efficiency.csv',
+              'tx_queue_delay.csv',
+              'tx_delay_end.csv')
+def index():
     # ---表格处理---
     # 获取当前页码
     page = request.args.get(get_page_parameter(), type=int, default=1)
@@ -194,23 +183,23 @@ def index():
     per_page = 5
     # 获取当前选中的选项卡
     active_tab = request.args.get('tab', 'tab1')
-    # 根据选中的选项卡切换数据帧
-    if active_tab == 'tab1':
-        data = df
-    elif active_tab == 'tab2':
-        data = df_tx
+    # 根据选中的选项卡切换汇总表：tab1为区块信息汇总，tab2为交易信息汇总
+    table = 'txs' if active_tab == 'tab2' else 'blocks'
+    # 汇总表随记录文件增量更新，这里只取当前页的切片
+    with phase('load'):
+        data, total = summary_index.page(filepath, table, (page - 1) * per_page, page * per_page)
     # 分页处理
-    pagination = Pagination(page=page, per_page=per_page, total=data.shape[0], css_framework='bootstrap4')
+    pagination = Pagination(page=page, per_page=per_page, total=total, css_framework='bootstrap4')
 
-    return render_template('board.html', data=data[(page - 1) * per_page:page * per_page], pagination=pagination,
-                           active_tab=active_tab)
+    return render_template('board.html', data=data, pagination=pagination, active_tab=active_tab)
 
 
 # 获取最新区块信息
 @app.route('/get_latest_block', methods=['POST','GET'])
 def get_latest_block():
     block_info = client.eth.get_block('latest')
-    return jsonify(block_info)
+    # AttributeDict和HexBytes不能直接用jsonify序列化
+    return Response(Web3.to_json(block_info), mimetype='application/json')
 
 # 获取节点数量
 @app.route('/get_peer_cnt', methods=['POST','GET'])
@@ -225,58 +214,66 @@ def get_block_number():
 # 获取交易数量
 @app.route('/get_tx_cnt', methods=['POST','GET'])
 def get_tx_cnt():
-    total = 0
-    for i in range(0,client.eth.block_number+1):
-        block = client.eth.get_block(i, full_transactions=True)
-        total += len(block.transactions)
+    return str(tx_counter.update(client.eth.block_number))
 
 # 获取交易池tps
+# 按时间窗口（秒，默认10s）统计最近到达交易池的交易数，只增量读取文件尾部
 @app.route('/get_txpool_tps', methods=['POST','GET'])
 def get_txpool_tps():
-    # 读取csv文件
-    df = pd.read_csv(filepath + "/transaction_pool_input_throughput.csv")
-    if len(df) <= 0:
-        return str(0)
-
-    # 确定起始和结束索引
-    if len(df) >= 500:
-        start_index = -500
-    elif len(df) >= 200:
-        start_index = -200
-    elif len(df) >= 100:
-        start_index = -100
-    elif len(df) >= 50:
-        start_index = -50
-    elif len(df) >= 10:
-        start_index = -10
-    elif len(df) >= 5:
-        start_index = -5
-    elif len(df) >= 2:
-        start_index = -2
-    else:
-        return str(0)
-
-    # 获取最后几条数据
-    last_10_df = df.iloc[start_index:]
-    sum_txs = last_10_df.shape[0]  # 最后几条记录的交易数
-    start_time = str(last_10_df.iloc[0]['measure_time'])  # 最后几条记录中第一条的时间
-    end_time = str(df.iloc[-1]['measure_time'])  # 最后一条记录的时间
-    duration = calculate_duration(end_time, start_time)  # 最后几条记录的总记录时间
-
-    # 计算TPS
-    if duration > 0:
-        tps = sum_txs / duration
-    else:
-        tps = 0
-
+    window = request.values.get('window', type=float, default=10)
+    # nan、inf和非正数都不是有效的窗口
+    if not math.isfinite(window) or window <= 0:
+        abort(400)
+    tps = txpool_tps_registry.tps(filepath + "/transaction_pool_input_throughput.csv", window)
     return "%.2f" % tps
 
+# 首页计数器：区块高度、交易总数和交易池TPS，每个tick只计算一次，由/stream/summary推送给所有页面
+# 某项计算失败时本轮不更新该项，推送端保留上一次的值
+def summary_counters():
+    counters = {}
+    try:
+        counters['block_number'] = client.eth.block_number
+        counters['tx_cnt'] = tx_counter.update(counters['block_number'])
+    except Exception as e:
+        print("summary counters:", e)
+    try:
+        tps = txpool_tps_registry.tps(filepath + "/transaction_pool_input_throughput.csv", 10)
+        counters['txpool_tps'] = "%.2f" % tps
+    except OSError as e:
+        print("summary counters:", e)
+    return counters
+
+
+summary_broadcaster = SummaryBroadcaster(summary_counters)
+
+# 推送首页计数器（Server-Sent Events），只在数值变化时发送变化的字段
+@app.route('/stream/summary')
+def stream_summary():
+    return Response(summary_broadcaster.stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 获取图表缓存命中统计
+@app.route('/get_chart_cache_stats', methods=['POST','GET'])
+def get_chart_cache_stats():
+    return jsonify(chart_cache.stats())
+
+# Prometheus指标：各路由的请求耗时和分阶段耗时直方图、缓存命中和JSON-RPC请求计数
+# 任意请求带上profile=1时返回该请求的cProfile报告
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 # 修改记录文件夹路径
 @app.route('/changeFilepath', methods=["POST"])
 def change_filepath():
     input_path = request.get_data()
     global filepath
     filepath = input_path.decode('utf-8')
+    csv_tail_cache.clear()
+    txpool_tps_registry.clear()
+    cdf_registry.clear()
+    summary_index.clear()
+    chart_cache.clear()
     print("new_path", filepath)
     return "success"
 
@@ -320,465 +317,133 @@ def update_switch():
 
 # --网络层--
 # 节点收发消息总量
-@app.route("/PeerMessageThroughput")
-def get_peer_message_throughput():
-    filename = "/peer_message_throughput.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def peer_message_throughput_data():
+    df = read_csv_without_duplicates(filepath + "/peer_message_throughput.csv")
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
-    # 获取message_size中的最大值最小值
-    min_value = float(min(df["message_size"].tolist()))
-    max_value = float(max(df["message_size"].tolist()))
-
+        return None
     # 按照message_type拆分数据
     received_df = df.loc[df['message_type'] == 'Received']
     sent_df = df.loc[df['message_type'] == 'Sent']
-
-    line1 = (
-        Line()
-        .add_xaxis(received_df['measure_time'].tolist())
-        .add_yaxis(series_name="接收消息大小", y_axis=received_df["message_size"].tolist(), is_smooth=True)
-        .set_global_opts(title_opts=opts.TitleOpts(title="节点收发消息总量-接收"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=0, range_end=5, xaxis_index=0),
-                             opts.DataZoomOpts(range_start=10, range_end=15, xaxis_index=1),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="测量时刻"),
-                         yaxis_opts=opts.AxisOpts(name="消息大小"),
-                         legend_opts=opts.LegendOpts(pos_left="center"),
-                         )
-    )
-
-    line2 = (
-        Line()
-        .add_xaxis(sent_df['measure_time'].tolist())
-        .add_yaxis(series_name="发送消息大小", y_axis=sent_df["message_size"].tolist(), is_smooth=True)
-        .set_global_opts(title_opts=opts.TitleOpts(title="节点收发消息总量-发送", pos_top="50%"),
-                         xaxis_opts=opts.AxisOpts(name="测量时刻"),
-                         yaxis_opts=opts.AxisOpts(name="消息大小"),
-                         legend_opts=opts.LegendOpts(pos_left="center", pos_top="50%"),
-                         )
-    )
-
-    grid = (
-        Grid()
-        .add(chart=line1, grid_opts=opts.GridOpts(pos_bottom="60%"))
-        .add(chart=line2, grid_opts=opts.GridOpts(pos_top="60%"))
-    )
-
-    chart, chart_js = parse_html(grid.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    return {
+        'series': [make_series(received_df['measure_time'], received_df['message_size'], name='Received'),
+                   make_series(sent_df['measure_time'], sent_df['message_size'], name='Sent')],
+        'summary': value_range(df['message_size']),
+    }
 
 
 # P2P网络平均传输时延
-@app.route("/NetP2PTransmissionLatency")
-def get_net_p2p_transmission_latency():
-    filename = "/net_p2p_transmission_latency.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def net_p2p_transmission_latency_data():
+    df = read_csv_without_duplicates(filepath + "/net_p2p_transmission_latency.csv",
+                                     ns=['peer1_deliver_time', 'peer2_receive_time', 'peer2_deliver_time',
+                                         'peer1_receive_time'])
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
+        return None
     # 取出send_id列的唯一值，后续作为标题
     send_id = df['peer_id'].unique()[0]
     # 计算时间差
-    df['p1top2'] = df.apply(lambda row: calculate_duration(row['peer2_receive_time'], row['peer1_deliver_time']), axis=1)
-    df['p2top1'] = df.apply(lambda row: calculate_duration(row['peer1_receive_time'], row['peer2_deliver_time']), axis=1)
+    df['p1top2'] = duration_seconds(df['peer2_receive_time'], df['peer1_deliver_time'])
+    df['p2top1'] = duration_seconds(df['peer1_receive_time'], df['peer2_deliver_time'])
     df['duration'] = (df['p1top2'] + df['p2top1']) / 2
     df = df[df['duration'] >= 0]
-
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(df) != 0:
-        min_value = float(min(df["duration"].tolist()))
-        max_value = float(max(df["duration"].tolist()))
-    bar = (
-        Bar()
-        .add_xaxis(df["measure_time"].tolist())
-        .add_yaxis(series_name="平均传输时间", y_axis=df["duration"].tolist())
-        .set_global_opts(title_opts=opts.TitleOpts(title="从" + shorten_id(send_id) + "发出消息计算结果"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=0, range_end=100),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="测量时间"),
-                         yaxis_opts=opts.AxisOpts(name="平均传输时间/s"),
-                         legend_opts=opts.LegendOpts(pos_left="center"),
-                         )
-
-    )
-
-    bar_cdf_hist = construct_cdf_chart(df['duration'], 10, "P2P平均传播时延")
-
-    tab = Tab()
-    tab.add(bar, "按时刻查看")
-    tab.add(bar_cdf_hist, "按累计分布查看")
-    chart, chart_js = parse_html_tab(tab.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    summary = latency_summary(df['duration'])
+    summary['peer_id'] = shorten_id(send_id)
+    return {
+        'series': [make_series(df['measure_time'], df['duration'])],
+        'summary': summary,
+        'cdf': cdf_data('NetP2PTransmissionLatency', df['duration']),
+    }
 
 
 # --数据层--
 # 数据库写入速率
-@app.route("/DBStateWriteRate")
-def get_db_state_write_rate():
-    filename = "/db_state_write_rate.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def db_state_write_rate_data():
+    df = read_csv_without_duplicates(filepath + "/db_state_write_rate.csv",
+                                     ['block_height', 'block_hash', 'write_duration'])
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
-    # 使用loc选择特定列
-    new_df = df.loc[:, ['block_height', 'block_hash', 'write_duration']]
+        return None
     # 应用转换函数到'write_duration'列
-    new_df['write_duration'] = new_df['write_duration'].apply(convert_duration_to_seconds)
-    # 重命名'write_duration'列为'value'
-    new_df.rename(columns={'write_duration': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = new_df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    # 拼接标注字符串
-    JsStr = "'数据库平均写入速率：" + str(new_df['value'].astype(float).mean()) + "秒/块'"
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(new_df['block_height'].tolist())
-        .add_yaxis(series_name="写入耗时", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="数据库写入速率"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=40, range_end=60),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="区块高度"),
-                         yaxis_opts=opts.AxisOpts(name="写入耗时/s"),
-                         legend_opts=opts.LegendOpts(pos_left="center"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块哈希:'+ params.data.block_hash+ '</br>' +
-                                            '写入耗时:'+ params.data.value+ 's' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         graphic_opts=[
-                             opts.GraphicGroup(
-                                 graphic_item=opts.GraphicItem(right="20%", top="15%"),
-                                 children=[
-                                     opts.GraphicRect(
-                                         graphic_item=opts.GraphicItem(
-                                             z=100, left="center", top="middle"
-                                         ),
-                                         graphic_shape_opts=opts.GraphicShapeOpts(width=320, height=30),
-                                         graphic_basicstyle_opts=opts.GraphicBasicStyleOpts(
-                                             fill="#0b3a8a30",
-                                             shadow_blur=8,
-                                             shadow_offset_x=3,
-                                             shadow_offset_y=3,
-                                             shadow_color="rgba(0,0,0,0.3)",
-                                         ),
-                                     ),
-                                     opts.GraphicText(
-                                         graphic_item=opts.GraphicItem(
-                                             left="center", top="middle", z=100
-                                         ),
-                                         graphic_textstyle_opts=opts.GraphicTextStyleOpts(
-                                             text=JsCode(
-                                                 JsStr
-                                             ),
-                                             font="12px Microsoft YaHei",
-                                             graphic_basicstyle_opts=opts.GraphicBasicStyleOpts(
-                                                 fill="#333"
-                                             ),
-                                         ),
-                                     ),
-                                 ],
-                             )
-                         ],
-                         )
-    )
-
-    chart, chart_js = parse_html(bar.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    value = df['write_duration'].apply(convert_duration_to_seconds)
+    summary = value_range(value)
+    # 数据库平均写入速率
+    summary['mean'] = float(value.astype(float).mean())
+    return {
+        'series': [make_series(df['block_height'], value, block_hash=df['block_hash'])],
+        'summary': summary,
+    }
 
 
 # 数据库读取速率
-@app.route("/DBStateReadRate")
-def get_db_state_read_rate():
-    filename = "/db_state_read_rate.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def db_state_read_rate_data():
+    df = read_csv_without_duplicates(filepath + "/db_state_read_rate.csv")
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
-    # 使用loc选择特定列
-    new_df = df.loc[:, ['block_hash', 'read_duration']]
+        return None
     # 应用转换函数到'read_duration'列
-    new_df['read_duration'] = new_df['read_duration'].apply(convert_duration_to_seconds)
-    # 重命名'read_duration'列为'value'
-    new_df.rename(columns={'read_duration': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = new_df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["measure_time"].tolist())
-        .add_yaxis(series_name="读取耗时", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="数据库读取速率"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="开始读取时刻"),
-                         yaxis_opts=opts.AxisOpts(name="读取耗时/s"),
-                         legend_opts=opts.LegendOpts(pos_left="center"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块哈希:'+ params.data.block_hash + '</br>' +
-                                            '读取耗时:'+ params.data.value+ 's';
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-
-    bar_hist = construct_cdf_chart(new_df['value'], 3, "数据库读取耗时")
-
-    tab = Tab()
-    tab.add(bar, "按时刻查看")
-    tab.add(bar_hist, "按累计分布查看")
-    chart, chart_js = parse_html_tab(tab.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    value = df['read_duration'].apply(convert_duration_to_seconds)
+    return {
+        'series': [make_series(df['measure_time'], value, block_hash=df['block_hash'])],
+        'summary': value_range(value),
+        'cdf': cdf_data('DBStateReadRate', value),
+    }
 
 
 # --共识层--
 # 每轮Clique共识耗时
-@app.route("/ConsensusCliqueCost")
-def get_consensus_clique_cost():
-    filename = "/consensus_clique_cost.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def consensus_clique_cost_data():
+    df = read_csv_without_duplicates(filepath + "/consensus_clique_cost.csv", ['block_height', 'cost_time'])
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
-    # 使用loc选择特定列
-    new_df = df.loc[:, ['block_height', 'cost_time']]
-    # 应用转换函数到'cost_time'列
-    new_df['cost_time'] = new_df['cost_time'].apply(convert_duration_to_seconds)
-    # 将负筛掉
-    new_df['cost_time'] = new_df['cost_time'].clip(lower=0)
-    # 重命名'cost_time'列为'value'
-    new_df.rename(columns={'cost_time': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = new_df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(new_df['block_height'].tolist())
-        .add_yaxis(series_name="共识耗时", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="每轮Clique共识耗时"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=40, range_end=60),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="区块高度"),
-                         yaxis_opts=opts.AxisOpts(name="共识耗时/s"),
-                         legend_opts=opts.LegendOpts(pos_left="center"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块高度:'+ params.data.block_height+ '</br>' +
-                                            '共识类型:'+ 'Clique' + '</br>' +
-                                            '共识耗时:'+ params.data.value+ 's' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-    )
-
-    chart, chart_js = parse_html(bar.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+        return None
+    # 应用转换函数到'cost_time'列，并将负值筛掉
+    value = df['cost_time'].apply(convert_duration_to_seconds).clip(lower=0)
+    return {
+        'series': [make_series(df['block_height'], value)],
+        'summary': value_range(value),
+    }
 
 
 # --合约层--
 # 合约执行时间
-@app.route("/ContractTime")
-def get_contract_time():
-    filename = "/contract_time.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def contract_time_data():
+    df = read_csv_without_duplicates(filepath + "/contract_time.csv")
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
-    # 使用loc选择特定列
-    new_df = df.loc[:, ['tx_hash', 'contract_addr', 'exec_time']]
+        return None
     # 应用转换函数到'exec_time'列
-    new_df['exec_time'] = new_df['exec_time'].apply(convert_duration_to_seconds)
-    # 重命名'exec_time'列为'value'
-    new_df.rename(columns={'exec_time': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = new_df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["start_time"].tolist())
-        .add_yaxis(series_name="执行时间", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="合约执行时间"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="开始执行时刻"),
-                         yaxis_opts=opts.AxisOpts(name="执行时间/s"),
-                         legend_opts=opts.LegendOpts(pos_left="center"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '合约地址:'+ params.data.contract_addr + '</br>' +
-                                             '交易哈希:'+ params.data.tx_hash  + '</br>' +
-                                             '执行时间:'+ params.data.value+ 's' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-
-    bar_hist = construct_cdf_chart(new_df['value'], 5, "合约执行时间")
-
-    tab = Tab()
-    tab.add(bar, "按时刻查看")
-    tab.add(bar_hist, "按累计分布查看")
-    chart, chart_js = parse_html_tab(tab.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    value = df['exec_time'].apply(convert_duration_to_seconds)
+    return {
+        'series': [make_series(df['start_time'], value, contract_addr=df['contract_addr'], tx_hash=df['tx_hash'])],
+        'summary': value_range(value),
+        'cdf': cdf_data('ContractTime', value),
+    }
 
 
 # --交易生命周期--
 # 交易延迟
-@app.route("/TxDelay")
-def get_tx_delay():
-    # 读取csv文件
+def tx_delay_data():
     df_start = read_csv_without_duplicates(filepath + '/tx_delay_start.csv')
     df_end = read_csv_without_duplicates(filepath + '/tx_delay_end.csv')
     if len(df_start) <= 0 or len(df_end) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
+        return None
     # 重命名列
     df_start = df_start.rename(columns={'measure_time': 'start_time'})
     df_end = df_end.rename(columns={'measure_time': 'end_time'})
     # 合并df_start和df_end
-    df = pd.merge(df_start, df_end, on='tx_hash')
+    with phase('join'):
+        df = pd.merge(df_start, df_end, on='tx_hash')
     # 计算时间差
-    df['duration'] = df.apply(lambda row: calculate_duration(row['end_time'], row['start_time']), axis=1)
+    df['duration'] = duration_seconds(df['end_time'], df['start_time'])
     df = df[df['duration'] >= 0]
-
-    # 重命名'duration'列为'value'
-    df.rename(columns={'duration': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["start_time"].tolist())
-        .add_yaxis(series_name="交易延迟", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="交易延迟"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="进入交易池时刻"),
-                         yaxis_opts=opts.AxisOpts(name="交易延迟/s"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块高度:'+ params.data.block_height + '</br>' +
-                                             '交易哈希:'+ params.data.tx_hash  + '</br>' +
-                                             '交易延迟:'+ params.data.value+ 's' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-    bar_cdf_hist = construct_cdf_chart(df['value'], 10, "交易延迟")
-
-    tab = Tab()
-    tab.add(bar, "按时刻查看")
-    tab.add(bar_cdf_hist, "按累计分布查看")
-    chart, chart_js = parse_html_tab(tab.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    return {
+        'series': [make_series(df['start_time'], df['duration'],
+                               block_height=df['block_height'], tx_hash=df['tx_hash'])],
+        'summary': latency_summary(df['duration']),
+        'cdf': cdf_data('TxDelay', df['duration']),
+    }
 
 
 # 交易排队时延
-@app.route("/TxQueueDelay")
-def get_tx_queue_delay():
-    # 读取csv文件
+def tx_queue_delay_data():
     df = read_csv_without_duplicates(filepath + '/tx_queue_delay.csv')
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
+        return None
     # 根据"in/outFlag"列的值选择行，并分别赋值给df_in和df_out
     df_in = df.loc[df['in/outFlag'] == 'in']
     df_out = df.loc[df['in/outFlag'] == 'out']
@@ -786,319 +451,220 @@ def get_tx_queue_delay():
     df_in = df_in.rename(columns={'measure_time': 'start_time'})
     df_out = df_out.rename(columns={'measure_time': 'end_time'})
     # 合并df_in和df_out
-    df = pd.merge(df_in, df_out, on='tx_hash')
+    with phase('join'):
+        df = pd.merge(df_in, df_out, on='tx_hash')
     # 计算时间差
-    df['duration'] = df.apply(lambda row: calculate_duration(row['end_time'], row['start_time']), axis=1)
+    df['duration'] = duration_seconds(df['end_time'], df['start_time'])
     df = df[df['duration'] >= 0]
-
-    # 重命名'duration'列为'value'
-    df.rename(columns={'duration': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["start_time"].tolist())
-        .add_yaxis(series_name="交易排队时延", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="交易排队时延"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="进入交易池时刻"),
-                         yaxis_opts=opts.AxisOpts(name="交易排队时延/s"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return  '交易哈希:'+ params.data.tx_hash  + '</br>' +
-                                             '交易排队时延:'+ params.data.value+ 's' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-    bar_hist = construct_cdf_chart(df['value'], 10, "交易排队时延")
-
-    tab = Tab()
-    tab.add(bar, "按时刻查看")
-    tab.add(bar_hist, "按累计分布查看")
-    chart, chart_js = parse_html_tab(tab.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    return {
+        'series': [make_series(df['start_time'], df['duration'], tx_hash=df['tx_hash'])],
+        'summary': latency_summary(df['duration']),
+        'cdf': cdf_data('TxQueueDelay', df['duration']),
+    }
 
 
 # 交易池输入通量
-@app.route("/TransactionPoolInputThroughput")
-def get_transaction_pool_input_throughput():
-    filename = "/transaction_pool_input_throughput.csv"
-    # 读取csv文件
-    df = read_csv_without_duplicates(filepath + filename)
+def transaction_pool_input_throughput_data():
+    df = read_csv_without_duplicates(filepath + "/transaction_pool_input_throughput.csv", ['measure_time', 'source'])
     if len(df) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
+        return None
     sum_txs = df.shape[0]  # 当前记录的交易数
     start_time = str(df.iloc[0]['measure_time'])  # 第一条的时间
     end_time = str(df.iloc[-1]['measure_time'])  # 最后一条的时间
     duration = calculate_duration(end_time, start_time)  # 总记录时间
-    txpool_input_throughput = sum_txs / duration  # 交易池输入通量
-
+    txpool_input_throughput = sum_txs / duration if duration > 0 else 0  # 交易池输入通量
     # 把1修改为local 2修改为rpc
-    df['source'] = df['source'].replace({1: 'local', 2: 'rpc'})
-
-    # 拼接标注字符串
-    JsStr = "['开始时间: " + start_time + "','结束时间: " + end_time + "','总记录时间: " + str(
-        duration) + "s" "','交易数: " + str(sum_txs) + "','交易池输入通量: " + str(
-        txpool_input_throughput) + "'].join('\\n')"
-    type_counts = df["source"].value_counts()
-    pie = (
-        Pie()
-        .add(
-            series_name="交易来源",
-            data_pair=[list(i) for i in type_counts.items()],  # 将Series转换为列表
-        )
-        .set_global_opts(graphic_opts=[
-            opts.GraphicGroup(
-                graphic_item=opts.GraphicItem(left="1%", top="15%"),
-                children=[
-                    opts.GraphicRect(
-                        graphic_item=opts.GraphicItem(
-                            z=100, left="center", top="middle"
-                        ),
-                        graphic_shape_opts=opts.GraphicShapeOpts(width=260, height=90),
-                        graphic_basicstyle_opts=opts.GraphicBasicStyleOpts(
-                            fill="#0b3a8a30",
-                            shadow_blur=8,
-                            shadow_offset_x=3,
-                            shadow_offset_y=3,
-                            shadow_color="rgba(0,0,0,0.3)",
-                        ),
-                    ),
-                    opts.GraphicText(
-                        graphic_item=opts.GraphicItem(
-                            left="center", top="middle", z=100
-                        ),
-                        graphic_textstyle_opts=opts.GraphicTextStyleOpts(
-                            text=JsCode(
-                                JsStr
-                            ),
-                            font="14px Microsoft YaHei",
-                            graphic_basicstyle_opts=opts.GraphicBasicStyleOpts(
-                                fill="#333"
-                            ),
-                        ),
-                    ),
-                ],
-            )
-        ], )
-        .set_series_opts(
-            tooltip_opts=opts.TooltipOpts(
-                trigger="item", formatter="{a} <br/>{b}: {c} ({d}%)"
-            ),
-        )
-    )
-
-    chart, chart_js = parse_html(pie.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    type_counts = df['source'].replace({1: 'local', 2: 'rpc'}).value_counts()
+    return {
+        'series': [make_series(type_counts.index.astype(str), type_counts)],
+        'summary': {'start_time': start_time, 'end_time': end_time, 'duration': duration,
+                    'tx_count': sum_txs, 'throughput': txpool_input_throughput},
+    }
 
 
 # 出块耗时
-@app.route("/BlockCommitDuration")
-def get_block_commit_duration():
-    # 读取csv文件
+def block_commit_duration_data():
     df_start = read_csv_without_duplicates(filepath + '/block_commit_duration_start.csv')
-    df_end = read_csv_without_duplicates(filepath + '/block_commit_duration_end.csv')
+    df_end = read_csv_without_duplicates(filepath + '/block_commit_duration_end.csv',
+                                         ['measure_time', 'block_height', 'block_hash', 'block_tx_count'])
     if len(df_start) <= 0 or len(df_end) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
+        return None
     # 重命名列
     df_start = df_start.rename(columns={'measure_time': 'start_time'})
     df_end = df_end.rename(columns={'measure_time': 'end_time'})
     # 合并df_start和df_end
-    df = pd.merge(df_start, df_end, on='block_height')
+    with phase('join'):
+        df = pd.merge(df_start, df_end, on='block_height')
     # 对于相同高度的区块，可能多次触发该节点准备打包，只保留最后一次记录时间
     df.drop_duplicates(subset='block_height', keep='last', inplace=True)
     # 计算时间差
-    df['duration'] = df.apply(lambda row: calculate_duration(row['end_time'], row['start_time']), axis=1)
+    df['duration'] = duration_seconds(df['end_time'], df['start_time'])
     df = df[df['duration'] >= 0]
-
-    # 重命名'duration'列为'value'
-    df.rename(columns={'duration': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["block_height"].tolist())
-        .add_yaxis(series_name="当前节点出块耗时", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="当前节点出块耗时"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="区块高度"),
-                         yaxis_opts=opts.AxisOpts(name="出块耗时/s"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块高度:'+ params.data.block_height + '</br>' +
-                                             '区块哈希:'+ params.data.block_hash  + '</br>' +
-                                             '块内交易数量:'+ params.data.block_tx_count  + '</br>' +
-                                             '出块耗时:'+ params.data.value+ 's' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-    chart, chart_js = parse_html(bar.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    return {
+        'series': [make_series(df['block_height'], df['duration'],
+                               block_hash=df['block_hash'], block_tx_count=df['block_tx_count'])],
+        'summary': latency_summary(df['duration']),
+    }
 
 
 # 块内交易吞吐量
-@app.route("/TxInBlockTps")
-def get_tx_in_block_tps():
-    # 读取csv文件
+def tx_in_block_tps_data():
     df_start = read_csv_without_duplicates(filepath + '/tx_in_block_tps.csv')  # 打包完成时刻
     df_end = read_csv_without_duplicates(filepath + '/block_commit_duration_end.csv')  # 区块落库时刻
     if len(df_start) <= 0 or len(df_end) <= 0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
+        return None
     # 重命名列
     df_start = df_start.rename(columns={'measure_time': 'start_time'})
     df_end = df_end.rename(columns={'measure_time': 'end_time'})
     # 按照block_txsroot合并df_start和df_end
-    df = pd.merge(df_start, df_end, on='block_txsroot')
+    with phase('join'):
+        df = pd.merge(df_start, df_end, on='block_txsroot')
     # 计算时间差
-    df['duration'] = df.apply(lambda row: calculate_duration(row['end_time'], row['start_time']), axis=1)
+    df['duration'] = duration_seconds(df['end_time'], df['start_time'])
     df = df[df['duration'] >= 0]
     # 计算块内吞吐量 = 块内交易数 / 耗时
     df['block_tps'] = df['block_tx_count_x'] / df['duration']
-
-    # 重命名'block_tps'列为'value'
-    df.rename(columns={'block_tps': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["block_height_x"].tolist())
-        .add_yaxis(series_name="块内交易吞吐量", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="块内交易吞吐量"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="区块高度"),
-                         yaxis_opts=opts.AxisOpts(name="块内交易吞吐量(笔/s)"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块高度:'+ params.data.block_height_x + '</br>' +
-                                             '区块哈希:'+ params.data.block_hash  + '</br>' +
-                                             '块内交易数量:'+ params.data.block_tx_count_x  + '</br>' +
-                                             '块内交易树根:'+ params.data.block_txsroot  + '</br>' +
-                                             '打包到落库耗时:'+ params.data.duration+ 's'+ '</br>' +
-                                             '块内交易吞吐量:'+ params.data.value+ '笔/s' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-    chart, chart_js = parse_html(bar.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    return {
+        'series': [make_series(df['block_height_x'], df['block_tps'],
+                               block_hash=df['block_hash'], block_tx_count=df['block_tx_count_x'],
+                               block_txsroot=df['block_txsroot'], duration=df['duration'])],
+        'summary': value_range(df['block_tps']),
+    }
 
 
 # 区块验证效率
-@app.route("/BlockValidationEfficiency")
-def get_block_validation_efficiency():
-    # 读取csv文件
+def block_validation_efficiency_data():
     df_duration = read_csv_without_duplicates(filepath + '/block_validation_efficiency_start.csv')
-    df_cnt = read_csv_without_duplicates(filepath + '/block_validation_efficiency_end.csv')
-    if len(df_duration) <= 0 or len(df_cnt) <=0:
-        return render_template('draw.html', chart="<h2>当前文件尚无数据</h2>")
-
-    df = pd.merge(df_duration, df_cnt, on='block_hash')
+    df_cnt = read_csv_without_duplicates(filepath + '/block_validation_efficiency_end.csv',
+                                         ['block_hash', 'block_tx_count', 'block_height'])
+    if len(df_duration) <= 0 or len(df_cnt) <= 0:
+        return None
+    with phase('join'):
+        df = pd.merge(df_duration, df_cnt, on='block_hash')
     # 应用转换函数到'block_validation_duration'列
     df['block_validation_duration'] = df['block_validation_duration'].apply(convert_duration_to_seconds)
     df = df[df['block_validation_duration'] >= 0]
-
     # 计算区块验证效率 = 块内交易数 / 验证耗时
     df['valid_efficiency'] = df['block_tx_count'].astype(float) / df['block_validation_duration']
-    # 重命名'valid_efficiency'列为'value'
-    df.rename(columns={'valid_efficiency': 'value'}, inplace=True)
-    # 将新的DataFrame转换为字典列表
-    data = df.to_dict('records')
-    # 获取value中的最大值最小值
-    min_value, max_value = 0, 100
-    if len(data) != 0:
-        min_value = float(min(data, key=lambda x: x['value'])['value'])
-        max_value = float(max(data, key=lambda x: x['value'])['value'])
-    bar = (
-        Bar()
-        .add_xaxis(df["block_height"].tolist())
-        .add_yaxis(series_name="区块验证效率", y_axis=data)
-        .set_global_opts(title_opts=opts.TitleOpts(title="区块验证效率"),
-                         toolbox_opts=opts.ToolboxOpts(),
-                         visualmap_opts=opts.VisualMapOpts(
-                             min_=min_value,
-                             max_=max_value
-                         ),
-                         datazoom_opts=[
-                             opts.DataZoomOpts(range_start=45, range_end=55),
-                         ],
-                         xaxis_opts=opts.AxisOpts(name="区块高度"),
-                         yaxis_opts=opts.AxisOpts(name="区块验证效率(笔/s)"),
-                         tooltip_opts=opts.TooltipOpts(
-                             formatter=JsCode(
-                                 """
-                                 function (params) {
-                                     console.log(params);
-                                     return '区块高度:'+ params.data.block_height + '</br>' +
-                                             '块内交易数量:'+ params.data.block_tx_count  + '</br>' +
-                                             '区块验证耗时:'+ params.data.block_validation_duration+ 's'+ '</br>' +
-                                             '区块验证效率:'+ params.data.value+ '笔/s' ;
-                                 }
-                                 """
-                             )
-                         ),
-                         )
-
-    )
-    chart, chart_js = parse_html(bar.render_embed())
-    return render_template('draw.html', chart=chart, chart_js=chart_js)
+    return {
+        'series': [make_series(df['block_height'], df['valid_efficiency'], block_tx_count=df['block_tx_count'],
+                               block_validation_duration=df['block_validation_duration'])],
+        'summary': value_range(df['valid_efficiency']),
+    }
+
+
+# 各指标的数据构造函数及其读取的记录文件
+metric_builders = {
+    'PeerMessageThroughput': (peer_message_throughput_data, ['peer_message_throughput.csv']),
+    'NetP2PTransmissionLatency': (net_p2p_transmission_latency_data, ['net_p2p_transmission_latency.csv']),
+    'DBStateWriteRate': (db_state_write_rate_data, ['db_state_write_rate.csv']),
+    'DBStateReadRate': (db_state_read_rate_data, ['db_state_read_rate.csv']),
+    'ConsensusCliqueCost': (consensus_clique_cost_data, ['consensus_clique_cost.csv']),
+    'ContractTime': (contract_time_data, ['contract_time.csv']),
+    'TxDelay': (tx_delay_data, ['tx_delay_start.csv', 'tx_delay_end.csv']),
+    'TxQueueDelay': (tx_queue_delay_data, ['tx_queue_delay.csv']),
+    'TransactionPoolInputThroughput': (transaction_pool_input_throughput_data,
+                                       ['transaction_pool_input_throughput.csv']),
+    'BlockCommitDuration': (block_commit_duration_data,
+                            ['block_commit_duration_start.csv', 'block_commit_duration_end.csv']),
+    'TxInBlockTps': (tx_in_block_tps_data, ['tx_in_block_tps.csv', 'block_commit_duration_end.csv']),
+    'BlockValidationEfficiency': (block_validation_efficiency_data,
+                                  ['block_validation_efficiency_start.csv', 'block_validation_efficiency_end.csv']),
+}
+
+
+def metric_input_paths(metric):
+    if metric not in metric_builders:
+        return []
+    return [filepath + '/' + name for name in metric_builders[metric][1]]
+
+
+# 指标数据接口：返回列式JSON，由draw.html在浏览器端用echarts绘图
+# points为点数预算（一般取图表宽度），start/end为各序列的缩放范围（百分比，可按序列重复给出）
+@app.route('/api/<metric>')
+@chart_cache.cached(metric_input_paths, mimetype='application/json')
+def get_metric_data(metric):
+    if metric not in metric_builders:
+        abort(404)
+    points = min(MAX_CHART_POINTS, max(MIN_CHART_POINTS, request.args.get('points', type=int,
+                                                                          default=DEFAULT_CHART_POINTS)))
+    method = request.args.get('downsample', 'lttb')
+    if method not in DOWNSAMPLE_METHODS:
+        abort(400)
+    starts = request.args.getlist('start', type=float) or [0]
+    ends = request.args.getlist('end', type=float) or [100]
+    with phase('compute'):
+        data = metric_builders[metric][0]()
+    with phase('render'):
+        if data is None:
+            data = {'empty': True}
+        else:
+            data['series'] = [series_to_json(series, starts[min(i, len(starts) - 1)], ends[min(i, len(ends) - 1)],
+                                             points, method)
+                              for i, series in enumerate(data['series'])]
+        data['metric'] = metric
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+# 指标展示页面，图表数据由页面脚本从/api/<metric>获取
+@app.route("/PeerMessageThroughput")
+def get_peer_message_throughput():
+    return render_template('draw.html', metric='PeerMessageThroughput')
+
+
+@app.route("/NetP2PTransmissionLatency")
+def get_net_p2p_transmission_latency():
+    return render_template('draw.html', metric='NetP2PTransmissionLatency')
+
+
+@app.route("/DBStateWriteRate")
+def get_db_state_write_rate():
+    return render_template('draw.html', metric='DBStateWriteRate')
+
+
+@app.route("/DBStateReadRate")
+def get_db_state_read_rate():
+    return render_template('draw.html', metric='DBStateReadRate')
+
+
+@app.route("/ConsensusCliqueCost")
+def get_consensus_clique_cost():
+    return render_template('draw.html', metric='ConsensusCliqueCost')
+
+
+@app.route("/ContractTime")
+def get_contract_time():
+    return render_template('draw.html', metric='ContractTime')
+
+
+@app.route("/TxDelay")
+def get_tx_delay():
+    return render_template('draw.html', metric='TxDelay')
+
+
+@app.route("/TxQueueDelay")
+def get_tx_queue_delay():
+    return render_template('draw.html', metric='TxQueueDelay')
+
+
+@app.route("/TransactionPoolInputThroughput")
+def get_transaction_pool_input_throughput():
+    return render_template('draw.html', metric='TransactionPoolInputThroughput')
+
+
+@app.route("/BlockCommitDuration")
+def get_block_commit_duration():
+    return render_template('draw.html', metric='BlockCommitDuration')
+
+
+@app.route("/TxInBlockTps")
+def get_tx_in_block_tps():
+    return render_template('draw.html', metric='TxInBlockTps')
+
+
+@app.route("/BlockValidationEfficiency")
+def get_block_validation_efficiency():
+    return render_template('draw.html', metric='BlockValidationEfficiency')
 
 
 if __name__ == "__main__":
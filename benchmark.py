@@ -0,0 +1,192 @@
+# coding=utf-8
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+
+import loggen
+import metric_runner
+from columnar_cache import columnar_cache
+from metric_runner import peak_memory_mb
+
+# 不参与计时的路由：修改配置的接口、持续推送的SSE接口和静态文件
+SKIP_ROUTES = {"/changeFilepath", "/changeConfigServer", "/changeSwitch", "/updateSwitch", "/stream/summary",
+               "/static"}
+# 判定为性能回退的耗时、内存增长比例，以及忽略的绝对差值（秒、MB），避免把小量的抖动当成回退
+DEFAULT_THRESHOLD = 1.2
+MIN_WALL_DIFF = 0.05
+MIN_MEMORY_DIFF = 20
+
+
+# 当前代码的提交号，以及工作区是否有未提交的修改
+def git_commit():
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                             text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+# 需要计时的路由：所有不带参数、可以GET的路由，以及每个指标的/api/<metric>
+def benchmark_routes():
+    import app
+    routes = []
+    for rule in app.app.url_map.iter_rules():
+        if "GET" not in rule.methods or rule.rule in SKIP_ROUTES or rule.endpoint == "static":
+            continue
+        if rule.arguments == {"metric"}:
+            routes += [rule.rule.replace("<metric>", metric) for metric in app.metric_builders]
+        elif not rule.arguments:
+            routes.append(rule.rule)
+    return sorted(routes)
+
+
+# 在子进程中请求一个路由：第一次请求从记录文件读起（冷启动），第二次请求命中缓存（热启动）
+def run_route(route, input_path):
+    error = None
+    res = {}
+    try:
+        import app
+        app.filepath = input_path
+        # 需要以太坊节点的路由在没有节点时返回500，只记录状态码，不打印异常日志
+        app.app.logger.disabled = True
+        client = app.app.test_client()
+        res["baseline_mb"] = peak_memory_mb()
+        for phase in ["cold", "warm"]:
+            start = time.time()
+            response = client.get(route)
+            res[phase] = time.time() - start
+            res["status"] = response.status_code
+            res["bytes"] = len(response.data)
+        res["peak_mb"] = peak_memory_mb()
+    except Exception:
+        error = traceback.format_exc()
+    return route, res, error
+
+
+# 生成（或复用参数相同的）记录文件，返回生成耗时；复用时为None
+def prepare_logs(input_path, transactions, seed):
+    params = {"transactions": transactions, "tps": 200, "block_interval": 2.0, "seed": seed, "duplicate_headers": 2}
+    manifest = os.path.join(input_path, loggen.MANIFEST)
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            if json.load(f) == params:
+                print("reuse generated logs in " + input_path)
+                return None
+        shutil.rmtree(input_path)
+    start = time.time()
+    loggen.generate(input_path, transactions, params["tps"], params["block_interval"], seed=seed,
+                    duplicate_headers=params["duplicate_headers"])
+    return time.time() - start
+
+
+# 一个规模下的完整测试：生成记录文件、计算全部指标、请求全部路由
+def benchmark_scale(workdir, transactions, seed, routes, kwargs):
+    input_path = os.path.join(workdir, str(transactions), "logs")
+    output_path = os.path.join(workdir, str(transactions), "res")
+    res = {"generate": prepare_logs(input_path, transactions, seed), "calculate": {}, "routes": {}}
+    res["rows"] = {name: _count_lines(os.path.join(input_path, name)) - 1
+                   for name in sorted(os.listdir(input_path)) if name.endswith(".csv")}
+
+    # 每次都从CSV读起：删掉列式缓存和上次的结果
+    columnar_cache.purge(input_path)
+    shutil.rmtree(output_path, ignore_errors=True)
+    stats = metric_runner.run(input_path, output_path, jobs=1, **kwargs)
+    for name, (status, wall, peak, error) in stats.items():
+        res["calculate"][name] = {"status": status, "wall": wall, "peak_mb": peak, "error": error}
+
+    for route in routes:
+        columnar_cache.purge(input_path)
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            route, stat, error = pool.apply(run_route, (route, input_path))
+        stat["error"] = error
+        res["routes"][route] = stat
+        print("[%s] %s cold %.3fs warm %.3fs peak %.1fMB" % (stat.get("status", "error"), route,
+                                                          stat.get("cold", 0.0), stat.get("warm", 0.0),
+                                                          stat.get("peak_mb", 0.0)))
+    return res
+
+
+def _count_lines(path):
+    count = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            count += block.count(b"\n")
+    return count
+
+
+# 与之前的结果对比：同一规模、同一项的耗时或峰值内存超过阈值倍数时报告为回退
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    print("%-10s %-48s %10s %10s %8s" % ("rows", "item", "old", "new", "ratio"))
+    for scale, current in new["scales"].items():
+        previous = old["scales"].get(scale)
+        if previous is None:
+            continue
+        for section, key, unit, min_diff in [("calculate", "wall", "s", MIN_WALL_DIFF),
+                                             ("calculate", "peak_mb", "MB", MIN_MEMORY_DIFF),
+                                             ("routes", "cold", "s", MIN_WALL_DIFF),
+                                             ("routes", "warm", "s", MIN_WALL_DIFF),
+                                             ("routes", "peak_mb", "MB", MIN_MEMORY_DIFF)]:
+            for name, stat in current[section].items():
+                before, after = previous[section].get(name, {}).get(key), stat.get(key)
+                if not before or after is None:
+                    continue
+                ratio = after / before
+                flag = ratio > threshold and after - before > min_diff
+                if flag:
+                    regressions.append((scale, section, name, key))
+                print("%-10s %-48s %9.3f%-2s %9.3f%-2s %7.2fx%s" % (scale, "%s %s %s" % (section, name, key),
+                                                                    before, unit, after, unit, ratio,
+                                                                    " REGRESSION" if flag else ""))
+    print("%d regressions (threshold %.2fx, compared with %s)" % (len(regressions), threshold, old["commit"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用生成的记录文件测试各指标计算和各路由的耗时与峰值内存")
+    parser.add_argument("-n", "--transactions", type=int, nargs="+", default=[10000, 100000],
+                        help="测试的规模（交易笔数），可以给出多个，支持1万到5000万")
+    parser.add_argument("--workdir", default="bench_data", help="生成的记录文件和计算结果所在的文件夹")
+    parser.add_argument("--output", default="benchmarks", help="测试结果JSON文件保存的文件夹")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory-budget", type=metric_runner.parse_memory_budget, default=None,
+                        help="按块流式计算指标时每个进程的内存预算（如512M）")
+    parser.add_argument("--no-routes", action="store_true", help="只测试指标计算")
+    parser.add_argument("--compare", help="与之前的测试结果JSON文件对比，有回退时返回非0")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定回退的增长倍数")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    result = {"commit": commit, "dirty": dirty, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+              "scales": {}}
+    kwargs = {"memory_budget": args.memory_budget} if args.memory_budget is not None else {}
+    routes = [] if args.no_routes else benchmark_routes()
+    for transactions in args.transactions:
+        result["scales"][str(transactions)] = benchmark_scale(args.workdir, transactions, args.seed, routes, kwargs)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, "%s_%s%s.json" % (time.strftime("%Y%m%d%H%M%S"), commit,
+                                                        "_dirty" if dirty else ""))
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print("benchmark result saved to " + path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        sys.exit(1 if compare(old, result, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,89 @@
 # coding=utf-8
 import pandas as pd
 import numpy as np
-from datetime import datetime
 from decimal import Decimal
+import itertools
 import time
 import os
 
+from schemas import SCHEMAS
+from streaming import BucketPartial, Checkpoint, MeanPartial, PairingPartial, iter_chunks, open_records, \
+    read_columns
+from quantile_sketch import QuantileSketch
+from time_buckets import bucket_aggregate, bucket_labels
+from timeutil import NAT, duration_seconds, ns_to_datetime, parse_duration, parse_time_ns, parse_time_scalar
+
 
 # 2.1交易池输入通量
 def transaction_pool_input_throughput(input_path, output_path,
                                       check_column_name=True, add_column_name=False,
-                                      test=False, batch_size=100000):
+                                      test=False, batch_size=100000, bucket_seconds=1, memory_budget=None,
+                                      resume=False):
     start_time = time.time()
+    schema = SCHEMAS["transaction_pool_input_throughput.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "transaction_pool_input_throughput.csv"))
+        store = open_records(os.path.join(input_path, schema.filename), memory_budget)
     except:
         raise Exception("transaction_pool_input_throughput.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "tx_id", "source"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("transaction_pool_input_throughput check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception(
-                        "transaction_pool_input_throughput check column name fail! column:" + str(i) + " unmatched")
-            print("transaction_pool_input_throughput check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 3:
-                # 指标测量时间 交易ID 交易来源
-                data.columns = ["measure_time", "tx_id", "source"]
-            else:
-                raise Exception("transaction_pool_input_throughput add_column_name fail! column count unmatched")
-            print("transaction_pool_input_throughput add_column_name finish!")
-        # 如果只计算部分数据
-        if test:
-            data = data[:batch_size]
-        data.drop("tx_id", inplace=True, axis=1)
-
-        data = data["measure_time"].str.slice(stop=19)  # 只保留需要用到的列并截取到20位保留到秒
-        res = data.value_counts(sort=False)  # 统计每一秒的交易数量
-        res = res.to_frame(name="transaction_pool_input_throughput")
+        names = schema.resolve(store.header, "transaction_pool_input_throughput", check_column_name, add_column_name)
+        # 统计每个时间桶（默认每秒）的交易数量，并按交易来源拆分，没有交易的桶记为0
+        # 如果只计算部分数据，只读取前batch_size行；从断点继续时只读取新追加的行
+        limit = batch_size if test else None
+        checkpoint = Checkpoint(output_path, "transaction_pool_input_throughput", [store], [names, bucket_seconds],
+                                limit, resume)
+        partial = checkpoint.load() or BucketPartial(bucket_seconds)
+        for _, data in iter_chunks(store, ["measure_time", "source"], names, memory_budget, limit,
+                                   checkpoint.starts[0], schema.dtypes(["measure_time"], ns=["measure_time"])):
+            source = data["source"].replace({1: "local", 2: "rpc"})
+            partial.add(parse_time_ns(data["measure_time"]), categories=source)
+        buckets = partial.result()
+        res = pd.DataFrame(index=bucket_labels(buckets.index, bucket_seconds))
+        res["transaction_pool_input_throughput"] = buckets["count"].to_numpy()
+        for column in buckets.columns:
+            if column.startswith("count_"):
+                res["transaction_pool_input_throughput_" + column[6:]] = buckets[column].to_numpy()
         res.to_csv(os.path.join(output_path, "transaction_pool_input_throughput_result.csv"),
                    index_label="measure_time", index=True)
+        checkpoint.save(partial)
         print("calculate transaction_pool_input_throughput finish! time cost =", time.time() - start_time)
 
 
 # 2.2平均传输延时 加了按秒合并 统一为毫秒
 def net_p2p_transmission_latency(input_path, output_path,
                                  check_column_name=True, add_column_name=False,
-                                 test=False, batch_size=3000):
+                                 test=False, batch_size=3000, memory_budget=None, resume=False):
     start_time = time.time()
+    schema = SCHEMAS["net_p2p_transmission_latency.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "net_p2p_transmission_latency.csv"))
+        store = open_records(os.path.join(input_path, schema.filename), memory_budget)
     except:
         print("net_p2p_transmission_latency.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "peer_id", "peer1_deliver_time", "peer2_receive_time", "peer2_deliver_time",
-                   "peer1_receive_time"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("net_p2p_transmission_latency check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception(
-                        "net_p2p_transmission_latency check column name fail! column:" + str(i) + " unmatched")
-            print("net_p2p_transmission_latency check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 7:
-                data.columns = ["measure_time", "peer_id", "peer1_deliver_time", "peer2_receive_time",
-                                "peer2_deliver_time", "peer1_receive_time"]
-            else:
-                raise Exception("net_p2p_transmission_latency add_column_name fail! column count unmatched")
-            print("net_p2p_transmission_latency add_column_name finish!")
-        # 如果只计算部分数据
-        if test:
-            data = data[:batch_size]
-        # data = data.sort_values(["measure_time"])
-        # print(data.head(10))
-        measure_time = []
-        transmission_latencies = []
-        # 循环遍历每一行
-        # for row in data.itertuples(): # 更快的迭代器
-        # 版本1
-        for data_row in data.itertuples():
-            if (len(data_row[2]) == 7):
-                continue
-            time1 = data_row.peer1_deliver_time
-            time2 = data_row.peer2_receive_time
-            time3 = data_row.peer2_deliver_time
-            time4 = data_row.peer1_receive_time
-            t = data_row.measure_time
-
-            t1 = datetime.strptime(time1, "%Y-%m-%d %H:%M:%S.%f")
-            t2 = datetime.strptime(time2, "%Y-%m-%d %H:%M:%S.%f")
-            t3 = datetime.strptime(time3, "%Y-%m-%d %H:%M:%S.%f")
-            t4 = datetime.strptime(time4, "%Y-%m-%d %H:%M:%S.%f")
-
+        names = schema.resolve(store.header, "net_p2p_transmission_latency", check_column_name, add_column_name)
+        # 按秒累计延时（微秒）的整数和与记录数，如果只计算部分数据，只读取前batch_size行
+        limit = batch_size if test else None
+        checkpoint = Checkpoint(output_path, "net_p2p_transmission_latency", [store], [names], limit, resume)
+        partial, sketch = checkpoint.load() or (MeanPartial(scale=2000), QuantileSketch())
+        # 四个时间列直接读取列式缓存中解析好的时间戳
+        times_columns = ["peer1_deliver_time", "peer2_receive_time", "peer2_deliver_time", "peer1_receive_time"]
+        for _, data in iter_chunks(store, names, names, memory_budget, limit, checkpoint.starts[0],
+                                   schema.dtypes(names, ns=times_columns)):
+            # 跳过peer_id长度为7的行（混入的表头行peer_id）
+            data = data[data["peer_id"].astype(str).str.len() != 7]
+            # 四个时间整列解析成int64时间戳，有时间无法解析的行跳过
+            times = [parse_time_ns(data[name]) for name in times_columns]
+            valid = np.logical_and.reduce([t != NAT for t in times])
             # 微秒时间戳
-            timestamp1 = int(t1.timestamp() * 1e6)
-            timestamp2 = int(t2.timestamp() * 1e6)
-            timestamp3 = int(t3.timestamp() * 1e6)
-            timestamp4 = int(t4.timestamp() * 1e6)
-
-            # 结果为毫秒类型
-            transmission_latency = float(timestamp2 + timestamp4 - timestamp1 - timestamp3) / 2000
-            # transmission_latency = t2 + t4 - t1 - t3
-            transmission_latencies.append(transmission_latency)
-            measure_time.append(t)
-
-        res = pd.DataFrame()
-        res["measure_time"] = measure_time
-        res["net_p2p_transmission_latency"] = transmission_latencies
-        res_time = res["measure_time"].str.slice(stop=19)
-        res["measure_time"] = res_time
-        res = res.groupby("measure_time").aggregate("mean")
-        res.to_csv(os.path.join(output_path, "net_p2p_transmission_latency_result.csv"), index_label="measure_time",
-                   index=True)
+            t1, t2, t3, t4 = (t[valid] // 1000 for t in times)
+            measure_time = pd.Series(data["measure_time"].to_numpy()[valid], dtype=object).str.slice(stop=19)
+            partial.add(measure_time, t2 + t4 - t1 - t3)
+            sketch.add(measure_time, (t2 + t4 - t1 - t3) / 2000)
+        # 结果为毫秒类型
+        partial.write_csv(os.path.join(output_path, "net_p2p_transmission_latency_result.csv"),
+                          "net_p2p_transmission_latency")
+        write_quantiles(sketch, output_path, "net_p2p_transmission_latency", "net_p2p_transmission_latency")
+        checkpoint.save((partial, sketch))
         print("calculate net_p2p_transmission_latency finish! time cost =", time.time() - start_time)
 
 
@@ -134,231 +91,244 @@ def net_p2p_transmission_latency(input_path, output_path,
 # SUM(MessageSize)/测量时长/TotalBandwitch时长为1s，
 def peer_message_throughput(input_path, output_path,
                             check_column_name=True, add_column_name=False,
-                            test=False, batch_size=10000):
+                            test=False, batch_size=10000, bucket_seconds=1, memory_budget=None,
+                            resume=False):
     start_time = time.time()
+    schema = SCHEMAS["peer_message_throughput.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "peer_message_throughput.csv"))
+        store = open_records(os.path.join(input_path, schema.filename), memory_budget)
     except:
         print("peer_message_throughput.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "message_type", "message_size"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("peer_message_throughput check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("peer_message_throughput check column name fail! column:" + str(i) + " unmatched")
-            print("peer_message_throughput check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 3:
-                data.columns = ["measure_time", "message_type", "message_size"]
-            else:
-                raise Exception("peer_message_throughput add_column_name fail! column count unmatched")
-            print("peer_message_throughput add_column_name finish!")
-        if test:
-            data = data[:batch_size]
-        data = data.drop("message_type", axis=1)
-        mtime = data["measure_time"].str.slice(stop=19)
-        data["measure_time"] = mtime
-        measure_time = []
-        peer_message_throughput = []
-        id = data.loc[0].measure_time
-        count = 0
-        for row in data.itertuples():
-            if row.measure_time != id:
-                measure_time.append(id)
-                peer_message_throughput.append(count)
-                id = row.measure_time
-                count = row.message_size
-            else:
-                count += row.message_size
-        measure_time.append(id)
-        peer_message_throughput.append(count)
+        names = schema.resolve(store.header, "peer_message_throughput", check_column_name, add_column_name)
+        # 统计每个时间桶（默认每秒）收发消息的总大小，并按消息类型拆分，没有消息的桶记为0
+        limit = batch_size if test else None
+        checkpoint = Checkpoint(output_path, "peer_message_throughput", [store], [names, bucket_seconds], limit,
+                                resume)
+        partial = checkpoint.load() or BucketPartial(bucket_seconds)
+        for _, data in iter_chunks(store, names, names, memory_budget, limit, checkpoint.starts[0],
+                                   schema.dtypes(names, ns=["measure_time"])):
+            partial.add(parse_time_ns(data["measure_time"]), data["message_size"], data["message_type"])
+        buckets = partial.result()
         res = pd.DataFrame()
-        res["measure_time"] = measure_time
-        res["peer_message_throughput"] = peer_message_throughput
+        res["measure_time"] = bucket_labels(buckets.index, bucket_seconds)
+        res["peer_message_throughput"] = buckets["sum"].to_numpy()
+        for column in buckets.columns:
+            if column.startswith("sum_"):
+                res["peer_message_throughput_" + column[4:]] = buckets[column].to_numpy()
         res.to_csv(os.path.join(output_path, "peer_message_throughput_result.csv"), index=False)
+        checkpoint.save(partial)
         print("calculate peer_message_throughput finish! time cost =", time.time() - start_time)
 
 
 # 2.4状态数据写入吞吐量
 def db_state_write_rate(input_path, output_path,
                         check_column_name=True, add_column_name=False,
-                        test=False, batch_size=10000):
+                        test=False, batch_size=10000, memory_budget=None, resume=False):
     start_time = time.time()
+    schema = SCHEMAS["db_state_write_rate.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "db_state_write_rate.csv"))
+        store = open_records(os.path.join(input_path, schema.filename), memory_budget)
     except:
         print("db_state_write_rate.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "block_height", "block_hash", "write_duration"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("db_state_write_rate check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("db_state_write_rate check column name fail! column:" + str(i) + " unmatched")
-            print("db_state_write_rate check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 5:
-                data.columns = ["measure_time", "block_height", "block_hash", "write_duration"]
-            else:
-                raise Exception("db_state_write_rate add_column_name fail! column count unmatched")
-            print("db_state_write_rate add_column_name finish!")
-        if test:
-            data = data[:batch_size]
-        data.drop(["block_height", "block_hash"], axis=1, inplace=True)
-        data.columns = ["measure_time", "db_state_write_rate"]
-
-        data_time = data["measure_time"].str.slice(stop=19)
-        data["measure_time"] = data_time
-
-        res = pd.DataFrame()
-        res["measure_time"] = data["measure_time"]
-        res["db_state_write_rate"] = data["db_state_write_rate"]
-        res.to_csv(os.path.join(output_path, "db_state_write_rate_result.csv"), index=False)
+        names = schema.resolve(store.header, "db_state_write_rate", check_column_name, add_column_name)
+        # 逐行输出，不需要跨行聚合：按块读取并依次追加到结果文件，从断点继续时只追加新行
+        save_path = os.path.join(output_path, "db_state_write_rate_result.csv")
+        limit = batch_size if test else None
+        checkpoint = Checkpoint(output_path, "db_state_write_rate", [store], [names], limit, resume)
+        resumed = checkpoint.load([save_path]) is not None
+        with open(save_path, "a" if resumed else "w", newline="") as f:
+            if not resumed:
+                pd.DataFrame(columns=["measure_time", "db_state_write_rate"]).to_csv(f, index=False)
+            for _, data in iter_chunks(store, ["measure_time", "write_duration"], names, memory_budget, limit,
+                                       checkpoint.starts[0]):
+                res = pd.DataFrame()
+                res["measure_time"] = data["measure_time"].str.slice(stop=19)
+                res["db_state_write_rate"] = data["write_duration"]
+                res.to_csv(f, index=False, header=False)
+        checkpoint.save(True, [save_path])
         print("calculate db_state_write_rate finish! time cost =", time.time() - start_time)
 
 
 # 2.5状态数据读取吞吐量
 def db_state_read_rate(input_path, output_path,
                        check_column_name=True, add_column_name=False,
-                       test=False, batch_size=10000):
+                       test=False, batch_size=10000, memory_budget=None, resume=False):
     start_time = time.time()
+    schema = SCHEMAS["db_state_read_rate.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "db_state_read_rate.csv"))
+        store = open_records(os.path.join(input_path, schema.filename), memory_budget)
     except:
         print("db_state_read_rate.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "block_hash", "read_duration"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("db_state_read_rate check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("db_state_read_rate check column name fail! column:" + str(i) + " unmatched")
-            print("db_state_read_rate check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 4:
-                data.columns = ["measure_time", "block_hash", "read_duration"]
-            else:
-                raise Exception("db_state_read_rate add_column_name fail! column count unmatched")
-            print("db_state_read_rate add_column_name finish!")
-        if test:
-            data = data[:batch_size]
-        data.drop(["block_hash"], axis=1, inplace=True)
-        data.columns = ["measure_time", "db_state_read_rate"]
-        data_time = data["measure_time"].str.slice(stop=19)
-        data["measure_time"] = data_time
-        res = pd.DataFrame()
-        res["measure_time"] = data["measure_time"]
-        res["db_state_read_rate"] = data["db_state_read_rate"]
-        res.to_csv(os.path.join(output_path, "db_state_read_rate_result.csv"), index=False)
+        names = schema.resolve(store.header, "db_state_read_rate", check_column_name, add_column_name)
+        # 逐行输出，不需要跨行聚合：按块读取并依次追加到结果文件，从断点继续时只追加新行
+        save_path = os.path.join(output_path, "db_state_read_rate_result.csv")
+        limit = batch_size if test else None
+        checkpoint = Checkpoint(output_path, "db_state_read_rate", [store], [names], limit, resume)
+        resumed = checkpoint.load([save_path]) is not None
+        with open(save_path, "a" if resumed else "w", newline="") as f:
+            if not resumed:
+                pd.DataFrame(columns=["measure_time", "db_state_read_rate"]).to_csv(f, index=False)
+            for _, data in iter_chunks(store, ["measure_time", "read_duration"], names, memory_budget, limit,
+                                       checkpoint.starts[0]):
+                res = pd.DataFrame()
+                res["measure_time"] = data["measure_time"].str.slice(stop=19)
+                res["db_state_read_rate"] = data["read_duration"]
+                res.to_csv(f, index=False, header=False)
+        checkpoint.save(True, [save_path])
         print("calculate db_state_read_rate finish! time cost =", time.time() - start_time)
 
 
+# 时间文本换算成本地时区的秒级时间戳（与time.mktime一致），小数秒保留到微秒
 def transform_time(t):
-    res = 0
-    try:
-        res = time.mktime(time.strptime(str(t).strip("\t"), '%Y-%m-%d %H:%M:%S.%f')) + float(
-            t[-6:]) / 1000000
-        return res
-    except:
-        try:
-            res = time.mktime(time.strptime(str(t).strip("\t"), '%Y-%m-%d %H:%M:%S'))
-            return res
-        except:
-            raise Exception("time format wrong! time:" + str(t))
+    ns = parse_time_scalar(str(t))
+    if ns == NAT:
+        raise Exception("time format wrong! time:" + str(t))
+    return ns_to_datetime(ns).timestamp()
 
 
 # 2.6交易排队时延？没有除以SUM(TxID)？还是说每个时间只有一个块？单位是m
 def tx_queue_delay(input_path, output_path,
                    check_column_name=True, add_column_name=False,
-                   test=False, batch_size=100000):
+                   test=False, batch_size=100000, memory_budget=None, resume=False):
     start_time = time.time()
+    schema = SCHEMAS["tx_queue_delay.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "tx_queue_delay.csv"))
+        store = open_records(os.path.join(input_path, schema.filename), memory_budget)
     except:
         print("tx_queue_delay.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "tx_hash", "in/outFlag"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("tx_queue_delay check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("tx_queue_delay check column name fail! column:" + str(i) + " unmatched")
-            print("tx_queue_delay check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 3:
-                data.columns = ["measure_time", "tx_hash", "in/outFlag"]
-            else:
-                raise Exception("tx_queue_delay add_column_name fail! column count unmatched")
-            print("tx_queue_delay add_column_name finish!")
-        if test:
-            data = data[:batch_size]
-        gb = data.groupby(by="tx_hash")
-        measure_time_list = []
-        tx_queue_delay_list = []
-        for tx_id_qude, group_data in gb:
-            if len(group_data) == 1:
-                continue
-            in_index = 0
-            out_index = 1
-            limit = len(group_data)
-            while (in_index < limit and out_index < limit):
-                if group_data.iloc[out_index, 2] != "out" or group_data.iloc[in_index, 2] != "in":
-                    raise Exception("unmatched in and out!")
-                out_time = transform_time(group_data.iloc[out_index, 0])
-                in_time = transform_time(group_data.iloc[in_index, 0])
-                measure_time_list.append(group_data.iloc[out_index, 0])
-                tx_queue_delay_list.append((out_time - in_time) * 1000)
-                in_index += 2
-                out_index += 2
-        res = pd.DataFrame()
-        res["measure_time"] = measure_time_list
-
-        # 如果为19，则会把毫秒相同的去掉
-        res_time = res["measure_time"].str.slice(stop=26)
-        res["measure_time"] = res_time
-        res["tx_queue_delay"] = tx_queue_delay_list
-        res = res.groupby("measure_time").aggregate("mean")
-        res.sort_values("measure_time", inplace=True)
-        save_path = os.path.join(output_path, "tx_queue_delay_result.csv")
-        res.to_csv(save_path, encoding='utf-8', index=True)
+        names = schema.resolve(store.header, "tx_queue_delay", check_column_name, add_column_name)
+        # 同一交易的第n次in与第n次out配对，还没配上的in/out留到后面的块继续配对（断点中也保存）
+        limit = batch_size if test else None
+        checkpoint = Checkpoint(output_path, "tx_queue_delay", [store], [names], limit, resume)
+        pairing, partial, sketch, out_of_order_count = \
+            checkpoint.load() or (PairingPartial("tx_hash"), MeanPartial(scale=1e6), QuantileSketch(), 0)
+        for start, data in iter_chunks(store, names, names, memory_budget, limit, checkpoint.starts[0],
+                                       schema.dtypes(names)):
+            events = pd.DataFrame({
+                "tx_hash": data["tx_hash"].to_numpy(),
+                "flag": data["in/outFlag"].astype(str).str.strip().to_numpy(),
+                "measure_time": data["measure_time"].to_numpy(),
+                "t": parse_time_ns(data["measure_time"]),
+                "pos": np.arange(start, start + len(data)),
+            })
+            events = events[events["t"] != NAT]
+            pairs = pairing.add(events[events["flag"] == "in"], events[events["flag"] == "out"])
+            # out记录出现在对应的in之前视为乱序，不参与计算
+            in_order = pairs["pos_end"] > pairs["pos_start"]
+            out_of_order_count += int((~in_order).sum())
+            pairs = pairs[in_order]
+            # 如果为19，则会把毫秒相同的去掉
+            partial.add(pairs["measure_time_end"].str.slice(stop=26), pairs["t_end"] - pairs["t_start"])
+            # 分位数按秒统计
+            sketch.add(pairs["measure_time_end"].str.slice(stop=19), (pairs["t_end"] - pairs["t_start"]) / 1e6)
+        unmatched_count = pairing.unmatched()
+        if unmatched_count or out_of_order_count:
+            print("tx_queue_delay skipped", unmatched_count, "unmatched and", out_of_order_count,
+                  "out-of-order in/out records")
+        partial.write_csv(os.path.join(output_path, "tx_queue_delay_result.csv"), "tx_queue_delay")
+        write_quantiles(sketch, output_path, "tx_queue_delay", "tx_queue_delay")
+        checkpoint.save((pairing, partial, sketch, out_of_order_count))
         print("calculate tx_queue_delay finish! time cost =", time.time() - start_time)
 
 
+# 写出延时指标各秒的分位数（<metric>_quantiles.csv）并打印整个运行期间的分位数，
+# 草图另存到结果目录的.sketches下，多个进程、节点的结果可以用QuantileSketch.load读回后合并
+def write_quantiles(sketch, output_path, metric, name):
+    sketch.write_csv(os.path.join(output_path, metric + "_quantiles.csv"), name)
+    os.makedirs(os.path.join(output_path, ".sketches"), exist_ok=True)
+    sketch.save(os.path.join(output_path, ".sketches", metric + ".npz"))
+    print(metric, "quantiles:", ", ".join("%s=%s" % item for item in sketch.total().items()))
+
+
 def get_time(str_time):
-    try:
-        time = datetime.strptime(str_time, '%Y-%m-%d %H:%M:%S.%f')
-        return time
-    except:
+    ns = parse_time_scalar(str_time)
+    if ns == NAT:
+        raise Exception("time format error:" + str_time)
+    return ns_to_datetime(ns)
+
+
+_stage_cache = {}
+
+
+# 缓存多个指标共用的中间结果：输入文件（路径、大小、修改时间）和参数都没变时直接复用
+def cached_stage(name, paths, params, build):
+    key = (name, tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths), params)
+    if key not in _stage_cache:
+        # 每种中间结果只保留最新的一份
+        for old in [k for k in _stage_cache if k[0] == name]:
+            del _stage_cache[old]
+        _stage_cache[key] = build()
+    return _stage_cache[key]
+
+
+# 区块落库连接：打包开始记录与落库记录按block_height连接（同一高度多次打包只保留第一次），并整列算出出块耗时(秒)
+def join_blocks(df_starts, df_ends):
+    df_starts = df_starts.drop_duplicates(subset="block_height", keep="first")
+    df_starts = df_starts.rename(columns={"measure_time": "sendtime"})
+    df_ends = df_ends.rename(columns={"measure_time": "confirmtime"})
+    blocks = pd.merge(df_starts, df_ends, on="block_height")
+    blocks["block_commit_duration"] = duration_seconds(blocks["confirmtime"], blocks["sendtime"])
+    return blocks
+
+
+# 区块验证连接：验证耗时记录与验证交易数记录按block_hash连接，有落库连接时再按block_hash挂上块高和出块耗时
+def join_validations(df_totals, df_txs, blocks=None):
+    df_totals = df_totals.assign(measure_time=df_totals["measure_time"].str.slice(stop=19))
+    validations = pd.merge(df_totals, df_txs, on="block_hash")
+    if blocks is not None:
+        commits = blocks[["block_hash", "block_height", "block_commit_duration"]].drop_duplicates(
+            subset="block_hash", keep="last")
+        validations = pd.merge(validations, commits, on="block_hash", how="left", suffixes=("", "_commit"))
+    return validations
+
+
+# 按schema读取阶段的几个记录文件，files为[(schema, 列名, 读取的列)]，列名为None时使用文件表头
+# 返回各文件的列式缓存和缓存键中使用的列名
+def open_stage_records(input_path, files):
+    stores = [open_records(os.path.join(input_path, schema.filename)) for schema, _, _ in files]
+    names = tuple(tuple(store.header if names is None else names) for store, (_, names, _) in zip(stores, files))
+    return stores, names
+
+
+# 区块生命周期阶段：出块耗时、块内交易吞吐量共用，读取和连接只做一次
+# names为两个文件校验或添加列名后的列名，只读取连接和计算用到的列
+def block_commit_stage(input_path, test=False, batch_size=10000, names=(None, None)):
+    files = [(SCHEMAS["block_commit_duration_start.csv"], names[0], ["measure_time", "block_height"]),
+             (SCHEMAS["block_commit_duration_end.csv"], names[1],
+              ["measure_time", "block_height", "block_hash", "block_tx_count"])]
+    stores, names = open_stage_records(input_path, files)
+
+    def build():
+        limit = batch_size if test else None
+        df_starts, df_ends = [read_columns(store, columns, list(store_names), stop=limit, dtypes=schema.dtypes())
+                              for store, store_names, (schema, _, columns) in zip(stores, names, files)]
+        return {"starts": df_starts, "ends": df_ends, "blocks": join_blocks(df_starts, df_ends)}
+
+    return cached_stage("block_commit", [store.source for store in stores], (test, batch_size, names), build)
+
+
+# 区块验证阶段：区块验证效率使用，落库记录存在时复用区块生命周期阶段的连接结果
+def block_validation_stage(input_path, test=False, batch_size=10000, names=(None, None)):
+    files = [(SCHEMAS["block_validation_efficiency_start.csv"], names[0],
+              ["measure_time", "block_hash", "block_validation_duration"]),
+             (SCHEMAS["block_validation_efficiency_end.csv"], names[1], ["block_hash", "block_tx_count"])]
+    stores, names = open_stage_records(input_path, files)
+
+    def build():
+        limit = batch_size if test else None
+        df_totals, df_txs = [read_columns(store, columns, list(store_names), stop=limit, dtypes=schema.dtypes())
+                             for store, store_names, (schema, _, columns) in zip(stores, names, files)]
         try:
-            time = datetime.strptime(str_time, '%Y-%m-%d %H:%M:%S')
-            return time
-        except:
-            raise Exception("time format error:" + str_time)
+            blocks = block_commit_stage(input_path, test, batch_size)["blocks"]
+        except (OSError, ValueError):
+            blocks = None
+        return {"totals": df_totals, "txs": df_txs, "validations": join_validations(df_totals, df_txs, blocks)}
+
+    return cached_stage("block_validation", [store.source for store in stores], (test, batch_size, names), build)
 
 
 # 3.1出块时延 BlockConfirmTime - BlockGenTime 单位毫秒
@@ -367,65 +337,29 @@ def block_commit_duration(input_path, output_path,
                           check_column_name=True, add_column_name=False,
                           test=False, batch_size=10000):
     start_time = time.time()
+    start_schema, end_schema = SCHEMAS["block_commit_duration_start.csv"], SCHEMAS["block_commit_duration_end.csv"]
     try:
-        df_starts = pd.read_csv(os.path.join(input_path, "block_commit_duration_start.csv"))
-        df_ends = pd.read_csv(os.path.join(input_path, "block_commit_duration_end.csv"))
+        starts_store = open_records(os.path.join(input_path, start_schema.filename))
+        ends_store = open_records(os.path.join(input_path, end_schema.filename))
     except:
         print("block_commit_duration_start.csv or block_commit_duration_end.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "block_height"]
-            now = []
-            for name in df_starts.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("block_commit_duration check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("block_commit_duration check column name fail! column:" + str(i) + " unmatched")
-            ans = ["measure_time", "block_height", "block_hash", "block_tx_count"]
-            now = []
-            for name in df_ends.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("block_commit_duration check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("block_commit_duration check column name fail! column:" + str(i) + " unmatched")
-            print("block_commit_duration check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if df_starts.shape[1] == 3 and df_ends.shape[1] == 3:
-                df_starts.columns = ["measure_time", "block_height"]
-                df_ends.columns = ["measure_time", "block_height", "block_hash", "block_tx_count"]
-            else:
-                raise Exception("block_commit_duration add_column_name fail! column count unmatched")
-            print("block_commit_duration add_column_name finish!")
-        if test:
-            df_starts = df_starts[:batch_size]
-            df_ends = df_ends[:batch_size]
-        df_starts.drop_duplicates(subset="block_height", keep="first", inplace=True)
-        df_ends.drop(["block_hash", "block_tx_count"], axis=1, inplace=True)
-        df_starts.rename(columns={"measure_time": "sendtime"}, inplace=True)
-        df_ends.rename(columns={"measure_time": "confirmtime"}, inplace=True)
-        df_combine = pd.merge(df_starts, df_ends, on="block_height")
-        time_stamp_list = []
-        block_delay_list = []
-        for data in df_combine.itertuples():
-            time_stamp_list.append(data.confirmtime)
-            confirm_time = get_time(data.confirmtime)
-            send_time = get_time(data.sendtime)
-            block_delay = (confirm_time - send_time).total_seconds()
-            block_delay_list.append(block_delay)
+        start_names = start_schema.resolve(starts_store.header, "block_commit_duration", check_column_name,
+                                           add_column_name)
+        end_names = end_schema.resolve(ends_store.header, "block_commit_duration", check_column_name,
+                                       add_column_name)
+        blocks = block_commit_stage(input_path, test, batch_size, (start_names, end_names))["blocks"]
         res = pd.DataFrame()
-        res["measure_time"] = time_stamp_list
-        res['block_commit_duration'] = block_delay_list
+        res["measure_time"] = blocks["confirmtime"]
+        res['block_commit_duration'] = blocks["block_commit_duration"]
 
         res_time = res["measure_time"].str.slice(stop=19)
         res["measure_time"] = res_time
+        sketch = QuantileSketch()
+        sketch.add(res["measure_time"], res["block_commit_duration"])
         res = res.groupby("measure_time").aggregate("mean")
         res.to_csv(os.path.join(output_path, "block_commit_duration_result.csv"), index=True)
+        write_quantiles(sketch, output_path, "block_commit_duration", "block_commit_duration")
         print("calculate block_commit_duration finish! time cost =", time.time() - start_time)
 
 
@@ -434,61 +368,19 @@ def block_commit_duration(input_path, output_path,
 def tx_in_block_tps(input_path, output_path, check_column_name=True, add_column_name=False, test=False,
                     batch_size=10000):
     start_time = time.time()
+    start_schema, end_schema = SCHEMAS["block_commit_duration_start.csv"], SCHEMAS["block_commit_duration_end.csv"]
     try:
-        df_starts = pd.read_csv(os.path.join(input_path, "block_commit_duration_start.csv"))
-        df_ends = pd.read_csv(os.path.join(input_path, "block_commit_duration_end.csv"))
+        starts_store = open_records(os.path.join(input_path, start_schema.filename))
+        ends_store = open_records(os.path.join(input_path, end_schema.filename))
     except:
         print("block_commit_duration_start.csv or block_commit_duration_end.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "block_height"]
-            now = []
-            for name in df_starts.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("tx_tps check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("tx_tps check column name fail! column:" + str(i) + " unmatched")
-            ans = ["measure_time", "block_height", "block_hash", "block_tx_count"]
-            now = []
-            for name in df_ends.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("tx_tps check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("tx_tps check column name fail! column:" + str(i) + " unmatched")
-            print("tx_tps check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if df_starts.shape[1] == 3 and df_ends.shape[1] == 3:
-                df_starts.columns = ["measure_time", "block_height"]
-                df_ends.columns = ["measure_time", "block_height", "block_hash", "block_tx_count"]
-            else:
-                raise Exception("tx_tps add_column_name fail! column count unmatched")
-            print("tx_tps add_column_name finish!")
-        if test:
-            df_starts = df_starts[:batch_size]
-            df_ends = df_ends[:batch_size]
-        df_starts.drop_duplicates(subset="block_height", keep="first", inplace=True)
-        df_starts.rename(columns={"measure_time": "sendtime"}, inplace=True)
-        df_ends.rename(columns={"measure_time": "confirmtime"}, inplace=True)
-        df_combine = pd.merge(df_starts, df_ends, on="block_height")
-        time_stamp_list = []
-        tx_tps_list = []
-        for data in df_combine.itertuples():
-            time_stamp_list.append(data.confirmtime)
-            confirm_time = get_time(data.confirmtime)
-            send_time = get_time(data.sendtime)
-
-            tx_tps = data.block_tx_count / (((confirm_time - send_time).total_seconds()) / 1000000)
-            tx_tps = round(tx_tps, 2)
-            tx_tps_list.append(tx_tps)
+        start_names = start_schema.resolve(starts_store.header, "tx_tps", check_column_name, add_column_name)
+        end_names = end_schema.resolve(ends_store.header, "tx_tps", check_column_name, add_column_name)
+        blocks = block_commit_stage(input_path, test, batch_size, (start_names, end_names))["blocks"]
         res = pd.DataFrame()
-        res["measure_time"] = time_stamp_list
-        res['tx_tps'] = tx_tps_list
+        res["measure_time"] = blocks["confirmtime"]
+        res['tx_tps'] = (blocks["block_tx_count"] / (blocks["block_commit_duration"] / 1000000)).round(2)
 
         res_time = res["measure_time"].str.slice(stop=19)
         res["measure_time"] = res_time
@@ -501,53 +393,24 @@ def tx_in_block_tps(input_path, output_path, check_column_name=True, add_column_
 def block_validation_efficiency(input_path, output_path, check_column_name=True, add_column_name=False, test=False,
                                 batch_size=10000):
     start_time = time.time()
+    total_schema, tx_schema = SCHEMAS["block_validation_efficiency_start.csv"], \
+        SCHEMAS["block_validation_efficiency_end.csv"]
     try:
-        df_totals = pd.read_csv(os.path.join(input_path, "block_validation_efficiency_start.csv"))
-        df_txs = pd.read_csv(os.path.join(input_path, "block_validation_efficiency_end.csv"))
+        totals_store = open_records(os.path.join(input_path, total_schema.filename))
+        txs_store = open_records(os.path.join(input_path, tx_schema.filename))
     except:
         print("block_validation_efficiency_start.csv or block_validation_efficiency_end.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "block_hash", "block_validation_duration"]
-            now = []
-            for name in df_totals.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("block_validation_efficiency check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception(
-                        "block_validation_efficiency check column name fail! column:" + str(i) + " unmatched")
-            ans = ["measure_time", "block_hash", "block_tx_count"]
-            now = []
-            for name in df_txs.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("block_validation_efficiency check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception(
-                        "block_validation_efficiency check column name fail! column:" + str(i) + " unmatched")
-            print("block_validation_efficiency check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if df_totals.shape[1] == 2 and df_txs.shape[1] == 2:
-                df_totals.columns = ["measure_time", "block_hash", "block_validation_duration"]
-                df_txs.columns = ["measure_time", "block_hash", "block_tx_count"]
-            else:
-                raise Exception("block_validation_efficiency add_column_name fail! column count unmatched")
-            print("block_validation_efficiency add_column_name finish!")
-        if test:
-            df_totals = df_totals[:batch_size]
-            df_txs = df_txs[:batch_size]
-        df_totals["measure_time"] = df_totals["measure_time"].str.slice(stop=19)
-        df_txs.drop(["measure_time"], axis=1, inplace=True)
-        df_combine = pd.merge(df_totals, df_txs, on="block_hash")
+        total_names = total_schema.resolve(totals_store.header, "block_validation_efficiency", check_column_name,
+                                           add_column_name)
+        tx_names = tx_schema.resolve(txs_store.header, "block_validation_efficiency", check_column_name,
+                                     add_column_name)
+        stage = block_validation_stage(input_path, test, batch_size, (total_names, tx_names))
+        validations = stage["validations"]
         res = pd.DataFrame()
-        res["measure_time"] = df_combine["measure_time"]
-        res["block_validation_duration"] = df_combine["block_validation_duration"]
-        res["block_tx_count"] = df_combine["block_tx_count"]
+        res["measure_time"] = validations["measure_time"]
+        res["block_validation_duration"] = validations["block_validation_duration"]
+        res["block_tx_count"] = validations["block_tx_count"]
         save_path = os.path.join(output_path, "block_validation_efficiency_result.csv")
         res.to_csv(save_path, index=False)
         print("calculate  block_validation_efficiency finish! time cost =", time.time() - start_time)
@@ -568,58 +431,40 @@ def get_delay(str_confirm, str_send):
 # 3.4交易确认时延 单位是毫秒 TxConfirmaTime - TxSendTime
 def tx_delay(input_path, output_path,
              check_column_name=True, add_column_name=False,
-             test=False, batch_size=3000):
+             test=False, batch_size=3000, memory_budget=None, resume=False):
     start_time = time.time()
+    start_schema, end_schema = SCHEMAS["tx_delay_start.csv"], SCHEMAS["tx_delay_end.csv"]
     try:
-        df_starts = pd.read_csv(os.path.join(input_path, "tx_delay_start.csv"))
-        df_ends = pd.read_csv(os.path.join(input_path, "tx_delay_end.csv"))
+        starts_store = open_records(os.path.join(input_path, start_schema.filename), memory_budget)
+        ends_store = open_records(os.path.join(input_path, end_schema.filename), memory_budget)
     except:
         print("tx_delay_starts.csv or tx_delay_ends.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "tx_hash"]
-            now = []
-            for name in df_starts.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("tx_confirm_delay check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("tx_confirm_delay check column name fail! column:" + str(i) + " unmatched")
-            ans = ["measure_time", "block_height", "tx_hash"]
-            now = []
-            for name in df_ends.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("tx_confirm_delay check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("tx_confirm_delay check column name fail! column:" + str(i) + " unmatched")
-            print("tx_confirm_delay check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if df_starts.shape[1] == 2 and df_ends.shape[1] == 2:
-                df_starts.columns = ["measure_time", "tx_hash"]
-                df_ends.columns = ["measure_time", "bloch_height", "tx_hash"]
-            else:
-                raise Exception("tx_queue_delay add_column_name fail! column count unmatched")
-            print("tx_queue_delay add_column_name finish!")
-        if test:
-            df_starts = df_starts[:batch_size]
-            df_ends = df_ends[:batch_size]
-        df_starts.rename(columns={"measure_time": "sendtime"}, inplace=True)
-        df_ends.rename(columns={"measure_time": "confirmtime"}, inplace=True)
-        df_combine = pd.merge(df_starts, df_ends, on="tx_hash")
-        confirm_delay = []
-        for row in df_combine.itertuples():  # 更快的迭代器
-            confirm_delay.append(get_delay(row.confirmtime, row.sendtime))
-        res = pd.DataFrame()
-        res["measure_time"] = df_combine["sendtime"]
-        res['tx_confirm_delay'] = confirm_delay
-        res = res.groupby("measure_time").aggregate("mean")
-        res.sort_values("measure_time", inplace=True)
-        res.to_csv(os.path.join(output_path, "tx_delay_result.csv"), index=True)
+        start_names = start_schema.resolve(starts_store.header, "tx_confirm_delay", check_column_name,
+                                           add_column_name)
+        end_names = end_schema.resolve(ends_store.header, "tx_confirm_delay", check_column_name, add_column_name)
+        # 同一交易的第n条发送记录与第n条确认记录配对；两个文件按块交替读取，
+        # 还没等到确认的发送记录（以及先读到的确认记录）留到后面的块继续配对
+        limit = batch_size if test else None
+        budget = None if memory_budget is None else memory_budget // 2
+        checkpoint = Checkpoint(output_path, "tx_delay", [starts_store, ends_store], [start_names, end_names], limit,
+                                resume)
+        pairing, partial, sketch = checkpoint.load() or (PairingPartial("tx_hash"), MeanPartial(scale=1e9),
+                                                         QuantileSketch())
+        starts = iter_chunks(starts_store, ["measure_time", "tx_hash"], start_names, budget, limit,
+                             checkpoint.starts[0])
+        ends = iter_chunks(ends_store, ["measure_time", "tx_hash"], end_names, budget, limit, checkpoint.starts[1])
+        empty = pd.DataFrame({"measure_time": [], "tx_hash": []}, dtype=object)
+        for (_, df_starts), (_, df_ends) in itertools.zip_longest(starts, ends, fillvalue=(0, empty)):
+            df_starts = df_starts.assign(t=parse_time_ns(df_starts["measure_time"]))
+            df_ends = df_ends.assign(t=parse_time_ns(df_ends["measure_time"]))
+            pairs = pairing.add(df_starts[df_starts["t"] != NAT], df_ends[df_ends["t"] != NAT])
+            partial.add(pairs["measure_time_start"], pairs["t_end"] - pairs["t_start"])
+            # 分位数按秒统计
+            sketch.add(pairs["measure_time_start"].str.slice(stop=19), (pairs["t_end"] - pairs["t_start"]) / 1e9)
+        partial.write_csv(os.path.join(output_path, "tx_delay_result.csv"), "tx_confirm_delay")
+        write_quantiles(sketch, output_path, "tx_delay", "tx_confirm_delay")
+        checkpoint.save((pairing, partial, sketch))
         print("calculate tx_delay finish! time cost =", time.time() - start_time)
 
 
@@ -627,31 +472,15 @@ def tx_delay(input_path, output_path,
 def clique_round_time(input_path, output_path,
                       check_column_name=True, add_column_name=False):
     start_time = time.time()
+    schema = SCHEMAS["consensus_clique_cost.csv"]
     try:
-        # 读取数据
-        data = pd.read_csv(input_path + 'consensus_clique_cost.csv', na_values=" NaN")
+        store = open_records(os.path.join(input_path, schema.filename))
     except:
-        print("consensus_tbft_cost.csv is not in the input path")
+        print("consensus_clique_cost.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["block_height", "clique_start", "clique_end", "cost_time"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("clique_round_time check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("clique_round_time check column name fail! column:" + str(i) + " unmatched")
-            print("clique_round_time check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 10:
-                data.columns = ["block_height", "clique_start", "clique_end", "cost_time"]
-            else:
-                raise Exception("clique_round_time add_column_name fail! column count unmatched")
-            print("clique_round_time add_column_name finish!")
+        names = schema.resolve(store.header, "clique_round_time", check_column_name, add_column_name)
+        # 读取数据，只读取计算用到的列
+        data = read_columns(store, ["clique_end", "cost_time"], names, dtypes=schema.dtypes())
 
         res = pd.DataFrame()
         res["measure_time"] = data["clique_end"]
@@ -694,34 +523,19 @@ def clique_round_time(input_path, output_path,
 def contract_time(input_path, output_path,
                   check_column_name=True, add_column_name=False):
     start_time = time.time()
+    schema = SCHEMAS["contract_time.csv"]
     try:
-        # 读取数据
-        data = pd.read_csv(input_path + 'contract_time.csv', na_values=" NaN")
+        store = open_records(os.path.join(input_path, schema.filename))
     except:
         print("contract_time.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["TxHash", "ContractAddr", "StartTime", "EndTime", "ExecTime"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("clique_round_time check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("contract_time check column name fail! column:" + str(i) + " unmatched")
-            print("contract_time check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 10:
-                data.columns = ["TxHash", "ContractAddr", "StartTime", "EndTime", "ExecTime"]
-            else:
-                raise Exception("contract_time add_column_name fail! column count unmatched")
-            print("contract_time add_column_name finish!")
+        names = schema.resolve(store.header, "contract_time", check_column_name, add_column_name)
+        # 读取数据，只读取计算用到的列
+        data = read_columns(store, ["start_time", "exec_time"], names, dtypes=schema.dtypes())
+        # recorder只记录合约开始执行的时间，以它作为测量时间；结果列名沿用ExecTime
         res = pd.DataFrame()
-        res["measure_time"] = data["EndTime"]
-        res["ExecTime"] = data["ExecTime"]
+        res["measure_time"] = data["start_time"]
+        res["ExecTime"] = data["exec_time"]
         # fixed_value = "2030-11-24 15:53:08"  # 设置固定的值
         # res["measure_time"] = [fixed_value] * len(res)
         res.to_csv(os.path.join(output_path, "contract_time_result.csv"), index=False)
@@ -732,30 +546,15 @@ def contract_time(input_path, output_path,
 def block_tx_conflict_rate(input_path, output_path,
                            check_column_name=True, add_column_name=False):
     start_time = time.time()
+    schema = SCHEMAS["block_tx_conflict_rate.csv"]
     try:
-        data = pd.read_csv(os.path.join(input_path, "block_tx_conflict_rate.csv"))
+        store = open_records(os.path.join(input_path, schema.filename))
     except:
         print("block_tx_conflict_rate.csv is not in the input path")
     else:
-        # 如果检查数据来源的列名
-        if check_column_name:
-            ans = ["measure_time", "conflict_count", "block_height", "block_tx_count"]
-            now = []
-            for name in data.columns:
-                now.append(name)
-            if len(ans) != len(now):
-                raise Exception("block_tx_conflict_rate check column name fail! unmatched column count")
-            for i in range(len(ans)):
-                if ans[i] != now[i]:
-                    raise Exception("block_tx_conflict_rate check column name fail! column:" + str(i) + " unmatched")
-            print("block_tx_conflict_rate check_column_name finish!")
-        # 如果需要添加列名
-        if add_column_name:
-            if data.shape[1] == 4:
-                data.columns = ["measure_time", "conflict_count", "block_height", "block_tx_count"]
-            else:
-                raise Exception("block_tx_conflict_rate add_column_name fail! column count unmatched")
-            print("block_tx_conflict_rate add_column_name finish!")
+        names = schema.resolve(store.header, "block_tx_conflict_rate", check_column_name, add_column_name)
+        # 读取数据，只读取计算用到的列
+        data = read_columns(store, ["measure_time", "conflict_count", "block_tx_count"], names, dtypes=schema.dtypes())
         conflict_rate_list = []
         for row in data.itertuples():  # 更快的迭代器
             conflict_rate_list.append(row.conflict_count / row.block_tx_count)
@@ -771,82 +570,64 @@ def block_tx_conflict_rate(input_path, output_path,
         print("calculate block_tx_conflict_rate finish ! time cost =", time.time() - start_time)
 
 
-def preprocess(df):
-    for index in range(df.shape[0]):  # 截取时间只保留到秒
-        df.loc[index, "measure_time"] = df.loc[index, "measure_time"][:19]
-    return df.groupby("measure_time").aggregate(np.mean)  # 秒作为label取平均，得到新的数据
-
-
-def merge(name, old, preprocess_flag=False, sort=False):
-    tmp = pd.DataFrame(pd.read_csv(os.path.join(output_path, name)))
-    if preprocess_flag:
-        t = time.time()
-        tmp = preprocess(tmp)
-        print("preprocess done time=", t - time.time())
-    return pd.merge(old, tmp, on="measure_time", how="outer", sort=sort)
+# 汇总表的列：(结果文件, 结果列, 汇总表列名, 取值类型)，按指标编号排列
+# 取值类型为number时按数值读取，duration时把"3.28ms"这类duration文本换算成毫秒
+REPORT_COLUMNS = [
+    ("transaction_pool_input_throughput_result.csv", "transaction_pool_input_throughput", "2.1交易池输入通量", "number"),
+    ("net_p2p_transmission_latency_result.csv", "net_p2p_transmission_latency", "2.2P2P网络平均传输时延", "number"),
+    ("peer_message_throughput_result.csv", "peer_message_throughput", "2.3节点收发消息总量", "number"),
+    ("db_state_write_rate_result.csv", "db_state_write_rate", "2.4数据库写入速率(ms)", "duration"),
+    ("db_state_read_rate_result.csv", "db_state_read_rate", "2.5数据库读取速率(ms)", "duration"),
+    ("tx_queue_delay_result.csv", "tx_queue_delay", "2.6交易排队时延", "number"),
+    ("block_commit_duration_result.csv", "block_commit_duration", "3.1出块耗时", "number"),
+    ("tx_in_block_tps_result.csv", "tx_tps", "3.2块内交易吞吐量", "number"),
+    ("block_validation_efficiency_result.csv", "block_validation_duration", "3.3区块验证效率-验证耗时(ms)", "duration"),
+    ("block_validation_efficiency_result.csv", "block_tx_count", "3.3区块验证效率-验证交易数", "number"),
+    ("tx_delay_result.csv", "tx_confirm_delay", "3.4交易时延", "number"),
+    ("consensus_clique_cost_result.csv", "cost_time", "3.7每轮clique耗时(ms)", "duration"),
+    ("contract_time_result.csv", "ExecTime", "4.2合约执行时间(ms)", "duration"),
+]
+
+
+# 汇总表用到的结果文件
+def report_files():
+    return list(dict.fromkeys(name for name, _, _, _ in REPORT_COLUMNS))
+
+
+# 读取一个结果文件中汇总表需要的列，按整数秒对齐，同一秒内的多条记录取平均
+def load_report_columns(path, columns):
+    data = pd.read_csv(path, usecols=["measure_time"] + [column for column, _, _ in columns])
+    times = parse_time_ns(data["measure_time"])
+    res = {}
+    for column, title, kind in columns:
+        values = parse_duration(data[column], "ms") if kind == "duration" else \
+            pd.to_numeric(data[column], errors="coerce").to_numpy(dtype=np.float64)
+        buckets = bucket_aggregate(times, values, bucket_seconds=1)
+        res[title] = buckets["mean"][buckets["count"] > 0]
+    return res
+
+
+# 汇总各指标结果：所有结果文件按整数秒对齐，一次concat拼成宽表res.csv
+# 没有生成的结果文件跳过对应的列
+def merge_results(output_path):
+    start_time = time.time()
+    series = {}
+    for name in report_files():
+        path = os.path.join(output_path, name)
+        columns = [(column, title, kind) for file, column, title, kind in REPORT_COLUMNS if file == name]
+        if not os.path.exists(path):
+            print("merge_results skipped", name, "(not found)")
+            continue
+        series.update(load_report_columns(path, columns))
+    titles = [title for _, _, title, _ in REPORT_COLUMNS if title in series]
+    res = pd.concat([series[title] for title in titles], axis=1, keys=titles, sort=True) if titles else \
+        pd.DataFrame(index=pd.Index([], dtype=np.int64))
+    res.insert(0, "measure_time", bucket_labels(res.index, 1).str.replace(":", "-", regex=False).to_numpy())
+    res.reset_index(drop=True).to_csv(os.path.join(output_path, "res.csv"), index=True, encoding="utf_8_sig")
+    print("merge_results finish! time cost =", time.time() - start_time)
 
 
 if __name__ == "__main__":
-    input_path = "/Users/bethestar/Downloads/ethlog/mylog/"
-    output_path = "/Users/bethestar/Downloads/ethlog/mylog/res/"
-    # # 2.1 交易池输入通量
-    # transaction_pool_input_throughput(input_path, output_path)
-    # # 2.2 P2P网络平均传输时延
-    # net_p2p_transmission_latency(input_path, output_path)
-    # # 2.3 节点收发消息总量
-    # peer_message_throughput(input_path, output_path)
-    # 2.4 状态数据写入吞吐量
-    db_state_write_rate(input_path, output_path)
-    # 2.5 状态数据读取吞吐量
-    db_state_read_rate(input_path, output_path)
-    # 2.6交易排队时延
-    tx_queue_delay(input_path, output_path)
-    # 3.1出块时延
-    block_commit_duration(input_path, output_path)
-    # 3.2交易吞吐量
-    tx_in_block_tps(input_path, output_path)
-    # 3.3区块验证效率
-    block_validation_efficiency(input_path, output_path)
-    # 3.4交易确认时延
-    tx_delay(input_path, output_path)
-    # 3.7 3.8 一轮clique耗时
-    clique_round_time(input_path, output_path)
-    # 4.1 交易冲突率
-    # block_tx_conflict_rate(input_path, output_path)
-    # 4.2 合约执行时间
-    contract_time(input_path, output_path)
-
-    # data2_1 = pd.read_csv(os.path.join(output_path, "transaction_pool_input_throughput_result.csv"),skiprows=lambda x: x > 0 and 'measure_time' in x)
-    # data2_2 = pd.read_csv(os.path.join(output_path, "net_p2p_transmission_latency_result.csv"))
-    # res = pd.merge(data2_1, data2_2, on="measure_time", how="outer")
-    # res = merge("peer_message_throughput_result.csv", res)  # 2.3
-    # print("2.3 finish")
-    # res = merge("db_state_write_rate_result.csv", res)  # 2.4
-    res = pd.read_csv(os.path.join(output_path, "db_state_write_rate_result.csv"))
-    print("2.4 finish")
-    res = merge("db_state_read_rate_result.csv", res)  # 2.5
-    print("2.5 finish")
-    res = merge("tx_queue_delay_result.csv", res)  # 2.6
-    print("2.6 finish")
-    res = merge("block_commit_duration_result.csv", res)
-    print("3.1 finish")
-    res = merge("tx_in_block_tps_result.csv", res)
-    print("3.2 finish")
-    res = merge("block_validation_efficiency_result.csv", res)  # 3.3
-    print("3.3 finish")
-    res = merge("tx_delay_result.csv", res)  # 3.4
-    print("3.4 finish")
-    res = merge("consensus_clique_cost_result.csv", res)  # 3.7 3.8
-    print("3.7 finish")
-    res = merge("contract_time_result.csv", res)  # 4.1
-    print("4.2 finish")
-    # res = merge("block_tx_conflict_rate_result.csv", res) #4.2
-    # print("4.1 finish")
-    for index in range(res.shape[0]):  # 截取时间只保留到秒
-        res.loc[index, "measure_time"] = "-".join(res.loc[index, "measure_time"].split(":"))
-    res.columns = ["measure_time", "2.1交易池输入通量", "2.2P2P网络平均传输时延", "2.3节点收发消息总量",
-                   "2.4数据库写入速率", "2.5数据库读取速率",
-                   "2.6交易排队时延", "3.1出块耗时", "3.2块内交易吞吐量", "3.3区块验证效率-验证耗时",
-                   "3.3区块验证效率-验证耗时", "3.4交易时延", "3.7每轮clique耗时", "4.2合约执行时间"]
-
-    res.to_csv(output_path + "res.csv", index=True, encoding="utf_8_sig")
\ No newline at end of file
+    from metric_runner import main
+
+    main()
@@ -0,0 +1,141 @@
+# coding=utf-8
+import math
+import threading
+
+import numpy as np
+
+# CDF的分段方式：log为对数等距，quantile为等分位数（每段样本数相同），linear为等宽
+CDF_SCALES = ("log", "quantile", "linear")
+# 细粒度对数网格：第k格为(MIN_VALUE * GAMMA^(k-1), MIN_VALUE * GAMMA^k]，相邻格相对宽度0.5%
+MIN_VALUE = 1e-9
+GAMMA = 1.005
+
+
+# 取值的增量直方图：非负取值按细粒度对数网格用bincount计数，另外精确记录最小值、最大值
+# 输出时从细网格的累计计数插值出所需分段的CDF，分段方式和段数可以随时更换而不用重新扫描数据
+# 取值序列只在尾部追加时（记录文件追加了新行）只统计新增的部分，否则重新统计
+class CdfHistogram:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # 第0格（不超过MIN_VALUE的取值）计入zeros，始终为0
+        self.counts = np.zeros(1, dtype=np.int64)
+        self.zeros = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        # 最小的正数取值，对数分段从它开始
+        self.minimum_positive = math.inf
+        self.rows = 0
+        self.checksum = 0
+
+    # values为当前完整的取值序列，负数和NaN不参与统计
+    def update(self, values):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        with self.lock:
+            if len(values) < self.rows or _checksum(values[:self.rows]) != self.checksum:
+                self.reset()
+            tail = values[self.rows:]
+            self.rows = len(values)
+            self.checksum = _checksum(values)
+            self._add(tail[tail >= 0])
+
+    def _add(self, values):
+        if len(values) == 0:
+            return
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        positive = values[values > MIN_VALUE]
+        self.zeros += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        self.minimum_positive = min(self.minimum_positive, float(positive.min()))
+        cells = _cells(positive)
+        counts = np.bincount(cells)
+        if len(counts) > len(self.counts):
+            counts[:len(self.counts)] += self.counts
+            self.counts = counts
+        else:
+            self.counts[:len(counts)] += counts
+
+    def total(self):
+        return self.zeros + int(self.counts.sum())
+
+    # 取值不超过x的样本数，x落在某一格内时按格内均匀分布线性插值
+    def _count_at(self, x):
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)]) + self.zeros
+        position = np.log(np.maximum(x, MIN_VALUE) / MIN_VALUE) / math.log(GAMMA)
+        cell = np.clip(np.ceil(position).astype(np.int64), 0, len(self.counts) - 1)
+        fraction = np.clip(position - (cell - 1), 0, 1)
+        res = cumulative[cell] + fraction * self.counts[cell]
+        return np.where(x <= MIN_VALUE, self.zeros, np.minimum(res, cumulative[-1]))
+
+    # 累计计数达到rank的位置所在格的取值（按格内均匀分布线性插值）
+    def _value_at(self, rank):
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)]) + self.zeros
+        cell = np.clip(np.searchsorted(cumulative, rank, side="left") - 1, 0, len(self.counts) - 1)
+        fraction = np.clip((rank - cumulative[cell]) / np.maximum(self.counts[cell], 1), 0, 1)
+        res = MIN_VALUE * np.power(GAMMA, cell - 1 + fraction)
+        return np.where(rank <= self.zeros, 0.0, res)
+
+    # 生成CDF曲线：x为分段端点的取值（数值，不是区间文本），y为不超过该取值的样本百分比
+    def points(self, bins=50, scale="log"):
+        with self.lock:
+            total = self.total()
+            if total == 0:
+                return None
+            lo, hi = self.minimum, self.maximum
+            if scale == "quantile":
+                y = np.linspace(0, 100, bins + 1)
+                x = np.clip(self._value_at(y / 100 * total), lo, hi)
+                x[0], x[-1] = lo, hi
+            else:
+                # 对数分段从最小的正数开始，有0时在前面加上0这一点；取值全部相同时退化为一个点
+                positive = self.minimum_positive
+                if scale == "log" and hi > positive:
+                    x = np.concatenate([[lo] if lo < positive else [], np.geomspace(positive, hi, bins + 1)])
+                else:
+                    x = np.linspace(lo, hi, bins + 1) if hi > lo else np.array([lo])
+                y = self._count_at(x) / total * 100
+                y[-1] = 100.0
+            # 与等宽分段一样从原点开始画
+            if scale == "linear" and lo > 0:
+                x, y = np.concatenate([[0.0], x]), np.concatenate([[0.0], y])
+        return {'x': [float("%.6g" % v) for v in x], 'y': [round(float(v), 4) for v in y], 'scale': scale,
+                'count': total}
+
+
+# 按指标维护增量直方图
+class CdfRegistry:
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def points(self, key, values, bins=50, scale="log"):
+        if scale not in CDF_SCALES:
+            raise ValueError("unknown cdf scale: " + str(scale))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = CdfHistogram()
+                self.histograms[key] = histogram
+        histogram.update(values)
+        return histogram.points(bins, scale)
+
+    def clear(self):
+        with self.lock:
+            self.histograms = {}
+
+
+# 取值所在的细网格格号，从1开始
+def _cells(values):
+    return np.ceil(np.log(values / MIN_VALUE) / math.log(GAMMA)).astype(np.int64)
+
+
+# 取值序列的校验和：按位看成int64求和（溢出回绕），用于判断序列是否只在尾部追加了新值
+def _checksum(values):
+    return int(np.ascontiguousarray(values).view(np.int64).sum())
+
+
+cdf_registry = CdfRegistry()
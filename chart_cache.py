@@ -0,0 +1,99 @@
+# coding=utf-8
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+
+# 获取文件指纹(路径, 大小, 修改时间)，文件不存在时大小和时间记为None
+def file_fingerprint(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, st.st_size, st.st_mtime_ns
+
+
+# 渲染结果缓存：以路由、查询参数和输入文件指纹为键，按LRU淘汰，总大小不超过max_bytes
+class ChartCache:
+    def __init__(self, max_bytes=64 << 20, max_entries=256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = len(value)
+        # 单个结果超过上限就不缓存
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self.entries[key] = value
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes or len(self.entries) > self.max_entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+            }
+
+    # 路由装饰器：get_paths根据路由参数返回本次请求依赖的输入文件，文件没有变化时直接返回缓存的结果
+    # 指定mimetype时，被装饰函数返回字符串，由这里包装成对应类型的响应
+    def cached(self, get_paths, mimetype=None):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = (request.path,
+                       tuple(sorted(request.args.items(multi=True))),
+                       tuple(file_fingerprint(path) for path in get_paths(**kwargs)))
+                value = self.get(key)
+                if value is None:
+                    value = func(*args, **kwargs)
+                    if isinstance(value, str):
+                        self.put(key, value)
+                if mimetype is not None and isinstance(value, str):
+                    return Response(value, mimetype=mimetype)
+                return value
+
+            return wrapper
+
+        return decorator
+
+
+chart_cache = ChartCache()
@@ -0,0 +1,500 @@
+# coding=utf-8
+import fcntl
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from timeutil import NAT, parse_time_ns
+
+STORE_VERSION = 1
+# 指定列式缓存根目录的环境变量
+CACHE_DIR_ENV = "RECORDER_CACHE_DIR"
+# 去重后不超过这个数量的字符串列（消息类型、进出标志等）按字典编码存储
+MAX_CATEGORIES = 1024
+TIME_PATTERN = re.compile(r"^\s*\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+ITEM_DTYPES = {"int": "<i8", "float": "<f8", "cat": "<i4"}
+
+
+# 字符串列编码成定长字节串，空值记为b""
+def encode_text(values):
+    text = pd.Series(values, copy=False)
+    text = text.where(text.notna(), "").astype(str).to_numpy(dtype=object)
+    try:
+        return text.astype("S")
+    except UnicodeEncodeError:
+        return np.array([s.encode("utf-8") for s in text], dtype="S")
+
+
+def decode_text(arr):
+    width = arr.dtype.itemsize
+    codes = arr.view(np.uint8).reshape(len(arr), width)
+    if len(arr) == 0 or codes.max() < 128:
+        # 纯ASCII：逐字节扩成UCS4直接得到unicode数组，比astype("U")快得多
+        text = codes.astype(np.uint32).view("<U%d" % width)[:, 0]
+    else:
+        text = np.char.decode(arr, "utf-8")
+    res = text.astype(object)
+    res[arr == b""] = np.nan
+    return res
+
+
+# 单个记录文件的列式缓存：每列一个定长二进制文件，manifest.json记录读到的字节偏移、行数和各列类型
+# 列类型：int/float为数值，time为时间文本加int64纳秒时间戳，cat为字典编码，str为定长字节串
+# 源文件增长时只解析新追加的完整行并追加到各列；被截断或替换时重建；
+# 新数据放不进原来的列类型时把该列升级（int→float→str），generation随重建和升级加一
+# 多个进程（如metric_runner的各个子进程）可能同时使用同一个缓存：刷新时持有缓存目录旁.lock文件的排他锁，
+# 读取时持有共享锁；重建在临时目录中完成后整体换入，升级、变宽的列写到临时文件后替换，manifest.json最后写入
+class ColumnarStore:
+    def __init__(self, source, store_dir):
+        self.source = source
+        self.dir = store_dir
+        self.lock_path = store_dir + ".lock"
+        self.lock = threading.Lock()
+        # 已加载的manifest.json的(inode, mtime, 大小)，文件被其它进程替换后重新加载
+        self.manifest_key = None
+        self.manifest = None
+        os.makedirs(os.path.dirname(store_dir), exist_ok=True)
+        with self.lock, self._file_lock(fcntl.LOCK_SH):
+            self._sync()
+
+    @property
+    def generation(self):
+        return self.manifest["generation"] if self.manifest else 0
+
+    @property
+    def rows(self):
+        return self.manifest["rows"] if self.manifest else 0
+
+    @property
+    def header(self):
+        return self.manifest["header"] if self.manifest and self.manifest["header"] else []
+
+    # 估算读出一行（指定的列）在内存中占用的字节数，用于按内存预算确定分块行数
+    def row_bytes(self, columns=None):
+        m = self.manifest
+        if not m or not m["columns"]:
+            return 1
+        names = m["header"] if columns is None else columns
+        total = 0
+        for name in names:
+            col = m["columns"][m["header"].index(name)]
+            if col["kind"] in ("int", "float"):
+                total += 8
+            elif col["kind"] == "cat":
+                total += 8 + 4
+            else:
+                # 对象数组中的str：指针、对象头和UCS4解码时的临时数组
+                total += 8 + 49 + 5 * col["width"] + (8 if col["kind"] == "time" else 0)
+        return total
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    @contextmanager
+    def _file_lock(self, mode):
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _manifest_key(self):
+        try:
+            st = os.stat(self._path("manifest.json"))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    # 持有文件锁时调用：其它进程更新过缓存时重新加载manifest
+    def _sync(self):
+        key = self._manifest_key()
+        if key is None or key != self.manifest_key:
+            self.manifest = self._load_manifest() if key is not None else None
+            self.manifest_key = key
+
+    def _load_manifest(self):
+        try:
+            with open(self._path("manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != STORE_VERSION:
+            return None
+        # 列文件比记录的行数短说明上次写入没有完成，整体重建
+        for i, col in enumerate(manifest["columns"]):
+            itemsize = np.dtype(ITEM_DTYPES[col["kind"]]).itemsize if col["kind"] in ITEM_DTYPES else col["width"]
+            try:
+                if os.path.getsize(self._path("c%d.bin" % i)) < manifest["rows"] * itemsize:
+                    return None
+            except OSError:
+                return None
+        return manifest
+
+    def _save_manifest(self):
+        tmp = self._path("manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._path("manifest.json"))
+        self.manifest_key = self._manifest_key()
+
+    # 写到临时文件再替换，读取方不会看到写了一半的列文件
+    def _replace_file(self, name, arr):
+        tmp = self._path(name + ".tmp")
+        np.ascontiguousarray(arr).tofile(tmp)
+        os.replace(tmp, self._path(name))
+
+    # 在缓存目录旁的临时目录中从头建立缓存，完成后由_install换入
+    def _reset(self, st):
+        parent, name = os.path.split(self.dir)
+        # 持有排他锁时，之前中断的重建留下的临时目录都已无用
+        for entry in os.listdir(parent):
+            if entry.startswith(name + ".") and entry.endswith((".build", ".old")):
+                shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+        self.dir = tempfile.mkdtemp(prefix=name + ".", suffix=".build", dir=parent)
+        self.manifest = {
+            "version": STORE_VERSION,
+            "generation": self.generation + 1,
+            "inode": st.st_ino,
+            "offset": 0,
+            "size": -1,
+            "mtime": -1,
+            "rows": 0,
+            "header": None,
+            "header_line": None,
+            "columns": [],
+        }
+
+    # 把建好的临时目录换到缓存目录的位置，旧目录先改名再删除
+    def _install(self, live_dir):
+        old = None
+        if os.path.exists(live_dir):
+            old = tempfile.mkdtemp(prefix=os.path.basename(live_dir) + ".", suffix=".old",
+                                   dir=os.path.dirname(live_dir))
+            os.rmdir(old)
+            os.rename(live_dir, old)
+        os.rename(self.dir, live_dir)
+        self.dir = live_dir
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+    # 读到源文件当前末尾，把新追加的行写入列文件；源文件被截断或替换时在临时目录中重建后换入
+    # block_bytes不为空时按块读取和解析，每块处理完就写入列文件并保存进度，内存占用与文件大小无关
+    def refresh(self, block_bytes=None):
+        with self.lock, self._file_lock(fcntl.LOCK_EX):
+            # 其它进程可能已经刷新过
+            self._sync()
+            st = os.stat(self.source)
+            m = self.manifest
+            rebuild = m is None or st.st_ino != m["inode"] or st.st_size < m["offset"]
+            if not rebuild and st.st_size == m["size"] and st.st_mtime_ns == m["mtime"]:
+                return
+            live_dir = self.dir
+            try:
+                if rebuild:
+                    self._reset(st)
+                self._refresh(st, block_bytes)
+                if rebuild:
+                    self._install(live_dir)
+            except BaseException:
+                # 出错时内存中的manifest可能和磁盘上的不一致，下次从磁盘重新加载；没有换入的临时目录删掉
+                if self.dir != live_dir:
+                    shutil.rmtree(self.dir, ignore_errors=True)
+                    self.dir = live_dir
+                self.manifest_key = None
+                raise
+
+    def _refresh(self, st, block_bytes):
+        m = self.manifest
+        with open(self.source, "rb") as f:
+            f.seek(m["offset"])
+            while True:
+                remaining = st.st_size - m["offset"]
+                chunk = f.read(remaining if block_bytes is None else min(block_bytes, remaining))
+                # 块内没有完整行时继续往后读，直到读到换行符或文件末尾
+                while b"\n" not in chunk and len(chunk) < remaining:
+                    chunk += f.read(min(block_bytes or remaining, remaining - len(chunk)))
+                # 只处理到最后一个换行符，写了一半的行留到下一块或下次再读
+                end = chunk.rfind(b"\n") + 1
+                if end == 0:
+                    break
+                f.seek(m["offset"] + end)
+                self._ingest(chunk[:end])
+                self._save_manifest()
+        m["size"] = st.st_size
+        m["mtime"] = st.st_mtime_ns
+        self._save_manifest()
+
+    def _ingest(self, chunk):
+        m = self.manifest
+        if m["header"] is None:
+            first_end = chunk.find(b"\n") + 1
+            header_line = chunk[:first_end].rstrip(b"\r\n")
+            m["header_line"] = header_line.decode("utf-8")
+            m["header"] = m["header_line"].split(",")
+            m["offset"] = first_end
+            chunk = chunk[first_end:]
+        df = self._parse(chunk)
+        if df is not None:
+            self._append(df)
+        m["offset"] += len(chunk)
+
+    # 把一段完整行解析成DataFrame，去掉其中重复的表头行；已经确定为字符串类的列按字符串读
+    def _parse(self, chunk):
+        header_line = self.manifest["header_line"].encode("utf-8")
+        if header_line in chunk:
+            # 常见情况下重复表头很少，直接替换掉，替换不干净（如\r\n换行）时再逐行过滤
+            chunk = (b"\n" + chunk).replace(b"\n" + header_line + b"\n", b"\n")[1:]
+            if header_line in chunk:
+                lines = [line for line in chunk.split(b"\n") if line.rstrip(b"\r") != header_line]
+                chunk = b"\n".join(lines)
+        if not chunk.strip():
+            return None
+        dtype = {name: str for name, col in zip(self.manifest["header"], self.manifest["columns"])
+                 if col["kind"] in ("time", "cat", "str")}
+        return pd.read_csv(io.BytesIO(chunk), header=None, names=self.manifest["header"], dtype=dtype,
+                           na_values=[" NaN"])
+
+    # 根据第一批数据推断列类型
+    @staticmethod
+    def _infer(values):
+        if pd.api.types.is_integer_dtype(values.dtype):
+            return {"kind": "int"}
+        if pd.api.types.is_float_dtype(values.dtype):
+            return {"kind": "float"}
+        present = values.dropna()
+        # 先看前面一小段是否像时间，再整列解析确认
+        head = present.iloc[:100]
+        if len(present) and all(isinstance(v, str) and TIME_PATTERN.match(v) for v in head):
+            if (parse_time_ns(present) != NAT).all():
+                return {"kind": "time", "width": 1}
+        if present.nunique() <= min(MAX_CATEGORIES, len(values) // 10):
+            return {"kind": "cat", "categories": []}
+        return {"kind": "str", "width": 1}
+
+    def _append(self, df):
+        m = self.manifest
+        if not m["columns"]:
+            m["columns"] = [self._infer(df[name]) for name in m["header"]]
+        for i, name in enumerate(m["header"]):
+            values = df[name]
+            col = m["columns"][i]
+            ns = parse_time_ns(values) if col["kind"] == "time" else None
+            kind = self._fit(col, values, ns)
+            if kind != col["kind"]:
+                self._promote(i, kind)
+                col = m["columns"][i]
+            self._append_column(i, col, values, ns)
+        m["rows"] += len(df)
+
+    # 判断新数据能否放进当前列类型，返回需要使用的列类型
+    @staticmethod
+    def _fit(col, values, ns):
+        kind = col["kind"]
+        numeric = pd.api.types.is_numeric_dtype(values.dtype)
+        if kind == "int" and not pd.api.types.is_integer_dtype(values.dtype):
+            return "float" if numeric else "str"
+        if kind == "float" and not numeric:
+            return "str"
+        if kind == "time" and ((ns == NAT) & values.notna().to_numpy()).any():
+            return "str"
+        if kind == "cat":
+            new = set(values.dropna().unique()) - set(col["categories"])
+            if len(col["categories"]) + len(new) > MAX_CATEGORIES:
+                return "str"
+        return kind
+
+    # 列类型升级：读出已有数据，按新类型整列重写（写临时文件后替换，manifest保存前仍按旧类型可读）
+    def _promote(self, i, kind):
+        m = self.manifest
+        old = pd.Series(self._read_column(i, 0), copy=False)
+        if kind == "float":
+            col = {"kind": "float"}
+            data = old.to_numpy(dtype=ITEM_DTYPES["float"])
+        else:
+            old = old.where(old.notna(), None).map(lambda v: v if v is None else str(v))
+            text = encode_text(old)
+            col = {"kind": "str", "width": max(1, text.dtype.itemsize)}
+            data = text.astype("S%d" % col["width"])
+        self._replace_file("c%d.bin" % i, data)
+        m["columns"][i] = col
+        m["generation"] += 1
+
+    def _write(self, name, arr, itemsize):
+        path = self._path(name)
+        with open(path, "ab") as f:
+            # 上次写入中途失败时文件可能比manifest记录的行数长，先截掉
+            f.truncate(self.manifest["rows"] * itemsize)
+            f.write(np.ascontiguousarray(arr).tobytes())
+
+    # 定长字节串列变宽时整列按新宽度重写
+    def _widen(self, name, col, width):
+        if self.manifest["rows"]:
+            old = np.fromfile(self._path(name), dtype="S%d" % col["width"], count=self.manifest["rows"])
+            self._replace_file(name, old.astype("S%d" % width))
+        col["width"] = width
+
+    def _append_column(self, i, col, values, ns=None):
+        kind = col["kind"]
+        if kind in ("int", "float"):
+            self._write("c%d.bin" % i, values.to_numpy(dtype=ITEM_DTYPES[kind]), np.dtype(ITEM_DTYPES[kind]).itemsize)
+            return
+        if kind == "cat":
+            present = values.dropna()
+            known = set(col["categories"])
+            col["categories"] += [v for v in pd.unique(present) if v not in known]
+            codes = pd.Categorical(values, categories=col["categories"]).codes.astype("<i4")
+            self._write("c%d.bin" % i, codes, 4)
+            return
+        text = encode_text(values)
+        width = max(col["width"], text.dtype.itemsize)
+        if width != col["width"]:
+            self._widen("c%d.bin" % i, col, width)
+        self._write("c%d.bin" % i, text.astype("S%d" % width), width)
+        if kind == "time":
+            self._write("c%d.ns" % i, parse_time_ns(values) if ns is None else ns, 8)
+
+    # dtype为读出后的类型：None保持原样，"category"读成Categorical（字典编码的列直接用编码构造），
+    # "ns"把时间列读成int64纳秒时间戳，整数dtype在放得下时把整数列转换成该类型
+    def _read_column(self, i, start, stop=None, dtype=None):
+        col = self.manifest["columns"][i]
+        kind = col["kind"]
+        count = max(0, min(self.manifest["rows"], self.manifest["rows"] if stop is None else stop) - start)
+        path = self._path("c%d.bin" % i)
+        if dtype == "ns" and kind == "time":
+            return np.fromfile(self._path("c%d.ns" % i), dtype="<i8", count=count, offset=start * 8)
+        if kind in ("int", "float", "cat"):
+            item = np.dtype(ITEM_DTYPES[kind])
+            arr = np.fromfile(path, dtype=item, count=count, offset=start * item.itemsize)
+            if kind == "cat":
+                if dtype == "category":
+                    return pd.Categorical.from_codes(arr, col["categories"])
+                arr = np.array(col["categories"] + [np.nan], dtype=object)[arr]
+            elif kind == "int" and dtype is not None and dtype not in ("category", "ns"):
+                info = np.iinfo(dtype)
+                if len(arr) == 0 or (info.min <= arr.min() and arr.max() <= info.max):
+                    return arr.astype(dtype)
+        else:
+            arr = decode_text(np.fromfile(path, dtype="S%d" % col["width"], count=count,
+                                          offset=start * col["width"]))
+        if dtype == "category":
+            return pd.Categorical(arr)
+        if dtype == "ns":
+            return parse_time_ns(arr)
+        return arr
+
+    # 读取[start, stop)行的数据（stop默认到末尾），columns为需要的列（默认全部），dtypes为各列读出后的类型
+    def read(self, columns=None, start=0, stop=None, dtypes=None):
+        dtypes = dtypes or {}
+        with self.lock, self._file_lock(fcntl.LOCK_SH):
+            self._sync()
+            m = self.manifest
+            if m is None or m["header"] is None:
+                return pd.DataFrame()
+            names = m["header"] if columns is None else columns
+            if not m["columns"]:
+                return pd.DataFrame(columns=names)
+            data = {name: self._read_column(m["header"].index(name), start, stop, dtypes.get(name))
+                    for name in names}
+            return pd.DataFrame(data, columns=names)
+
+    # 读取时间列解析好的int64纳秒时间戳
+    def read_time_ns(self, column, start=0, stop=None):
+        with self.lock, self._file_lock(fcntl.LOCK_SH):
+            self._sync()
+            m = self.manifest
+            i = m["header"].index(column)
+            if m["columns"][i]["kind"] != "time":
+                raise Exception(column + " is not a time column")
+            count = max(0, min(m["rows"], m["rows"] if stop is None else stop) - start)
+            return np.fromfile(self._path("c%d.ns" % i), dtype="<i8", count=count, offset=start * 8)
+
+
+# 列式缓存根目录：环境变量RECORDER_CACHE_DIR，默认为用户缓存目录（$XDG_CACHE_HOME或~/.cache）下的recorder_columnar
+def default_cache_root():
+    root = os.environ.get(CACHE_DIR_ENV)
+    if root:
+        return root
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "recorder_columnar")
+
+
+# 按源文件维护列式缓存。缓存不写进记录文件夹，而是放在缓存根目录下，每个记录文件夹一个子目录（文件夹名加路径哈希）
+# root为空时使用default_cache_root()；根目录不可写时退回系统临时目录，仍不可写时报错
+class ColumnarCache:
+    def __init__(self, root=None):
+        self.root = root
+        self.stores = {}
+        self.lock = threading.Lock()
+        self.warned = set()
+
+    def cache_root(self):
+        root = self.root or default_cache_root()
+        for candidate in (root, os.path.join(tempfile.gettempdir(), "recorder_columnar")):
+            try:
+                os.makedirs(candidate, exist_ok=True)
+            except OSError:
+                continue
+            if os.access(candidate, os.W_OK | os.X_OK):
+                if candidate != root and root not in self.warned:
+                    self.warned.add(root)
+                    print("columnar cache directory %s is not writable, using %s" % (root, candidate))
+                return candidate
+        raise Exception("columnar cache directory is not writable: " + root)
+
+    # 一个记录文件夹的缓存目录
+    def folder_dir(self, dirname):
+        dirname = os.path.abspath(dirname)
+        digest = hashlib.sha1(dirname.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_root(), "%s-%s" % (os.path.basename(dirname) or "root", digest))
+
+    def store_dir(self, source):
+        dirname, basename = os.path.split(os.path.abspath(source))
+        return os.path.join(self.folder_dir(dirname), basename)
+
+    def get_store(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            store = self.stores.get(path)
+            if store is None:
+                store = ColumnarStore(path, self.store_dir(path))
+                self.stores[path] = store
+            return store
+
+    # 增量刷新后返回列式缓存，block_bytes为每次读取解析的源文件字节数上限
+    def refresh(self, path, block_bytes=None):
+        store = self.get_store(path)
+        store.refresh(block_bytes)
+        return store
+
+    # 增量刷新后读取整个文件（或其中几列）
+    def read(self, path, columns=None, dtypes=None):
+        return self.refresh(path).read(columns, dtypes=dtypes)
+
+    def read_time_ns(self, path, column):
+        store = self.get_store(path)
+        store.refresh()
+        return store.read_time_ns(column)
+
+    # 删除一个记录文件夹的全部缓存，下次读取时从CSV重新建立
+    def purge(self, dirname):
+        dirname = os.path.abspath(dirname)
+        with self.lock:
+            self.stores = {path: store for path, store in self.stores.items() if os.path.dirname(path) != dirname}
+        shutil.rmtree(self.folder_dir(dirname), ignore_errors=True)
+
+    def clear(self):
+        with self.lock:
+            self.stores = {}
+
+
+columnar_cache = ColumnarCache()
@@ -0,0 +1,140 @@
+# coding=utf-8
+import os
+import threading
+
+import pandas as pd
+
+from columnar_cache import columnar_cache
+from schemas import SCHEMAS
+
+
+# 单个记录文件的内存缓存：解析和落盘交给列式缓存，这里只保存DataFrame，
+# 文件增长时只把列式缓存中新增的行拼接上来
+# 只缓存读取过的列，各列按记录文件的schema转换成紧凑的dtype（category、int32）
+class TailCsvLoader:
+    def __init__(self, path, on_read=None):
+        self.path = path
+        # 每次读取的方式（hit、tail、full）报告给on_read，用于统计缓存命中
+        self.on_read = on_read or (lambda kind: None)
+        self.lock = threading.Lock()
+        schema = SCHEMAS.get(os.path.basename(path))
+        self.dtypes = schema.dtypes() if schema is not None else {}
+        # 每次缓存失效加一，增量消费方据此判断之前读到的行是否还有效
+        self.generation = 0
+        self.reset()
+
+    # 清空已缓存的内容，下次从列式缓存重新读取
+    def reset(self):
+        self.generation += 1
+        self.store_generation = None
+        self.size = -1
+        self.mtime = -1
+        self.df = None
+        self.all_columns = False
+        # 按纳秒时间戳缓存的时间列
+        self.ns = set()
+
+    # 读取到文件当前末尾，返回缓存的DataFrame（调用方不要原地修改）
+    # columns为需要的列，默认全部；ns中的时间列读成int64纳秒时间戳；返回的DataFrame可能还包含其它读取过的列
+    def load(self, columns=None, ns=()):
+        with self.lock:
+            st = os.stat(self.path)
+            # 大小和修改时间都没变，需要的列也都按相同方式读过，直接返回缓存
+            if self.df is not None and st.st_size == self.size and st.st_mtime_ns == self.mtime and \
+                    not self._missing(self.df.columns if columns is None and self.all_columns else columns, ns):
+                self.on_read("hit")
+                return self.df
+
+            store = columnar_cache.get_store(self.path)
+            store.refresh()
+            wanted = store.header if columns is None else list(columns)
+            dtypes = dict(self.dtypes, **{name: "ns" for name in ns})
+            # 列式缓存被重建或有列升级了类型，整表重读
+            if self.df is None or store.generation != self.store_generation or store.rows < len(self.df):
+                if self.df is not None:
+                    self.reset()
+                self.on_read("full")
+                self.df = store.read(wanted, dtypes=dtypes)
+                self.ns = set(ns) & set(wanted)
+                self.store_generation = store.generation
+            else:
+                self.on_read("tail")
+                # 之前没有读过的列，或读取方式（时间文本/时间戳）不同的列，补读已缓存的行
+                missing = self._missing(wanted, ns)
+                if missing:
+                    reread = store.read(missing, stop=len(self.df), dtypes=dtypes)
+                    self.df = pd.concat([self.df.drop(columns=[name for name in missing if name in self.df.columns]),
+                                         reread], axis=1)
+                    self.df = self.df[[name for name in store.header if name in self.df.columns]]
+                    self.ns = (self.ns - set(missing)) | (set(ns) & set(missing))
+                if store.rows > len(self.df):
+                    dtypes = dict(self.dtypes, **{name: "ns" for name in self.ns})
+                    new_df = store.read(list(self.df.columns), start=len(self.df), dtypes=dtypes)
+                    self.df = new_df if len(self.df) == 0 else concat_rows(self.df, new_df)
+            self.all_columns = len(self.df.columns) == len(store.header)
+            self.size = st.st_size
+            self.mtime = st.st_mtime_ns
+            return self.df
+
+    # 还没有缓存或缓存的读取方式与ns不一致的列
+    def _missing(self, columns, ns):
+        if columns is None:
+            return True
+        return [name for name in columns if name not in self.df.columns or (name in ns) != (name in self.ns)]
+
+
+# 按行拼接两段数据，category列先统一类别，避免拼接后退化成object
+def concat_rows(df, new_df):
+    df = df.copy(deep=False)
+    new_df = new_df.copy(deep=False)
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.CategoricalDtype) and isinstance(new_df[name].dtype, pd.CategoricalDtype):
+            old_categories = df[name].cat.categories
+            categories = old_categories.append(new_df[name].cat.categories.difference(old_categories, sort=False))
+            df[name] = df[name].cat.set_categories(categories)
+            new_df[name] = new_df[name].cat.set_categories(categories)
+    return pd.concat([df, new_df], ignore_index=True)
+
+
+# 按文件路径维护增量读取器
+# reads为各读取方式的次数：hit为文件没有变化直接返回，tail为只读新增的行或补读缺少的列，full为整表读取
+class CsvTailCache:
+    def __init__(self):
+        self.loaders = {}
+        self.reads = {"hit": 0, "tail": 0, "full": 0}
+        self.lock = threading.Lock()
+
+    def count_read(self, kind):
+        with self.lock:
+            self.reads[kind] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.reads, files=len(self.loaders))
+
+    def get_loader(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            loader = self.loaders.get(path)
+            if loader is None:
+                loader = TailCsvLoader(path, self.count_read)
+                self.loaders[path] = loader
+            return loader
+
+    # 读取文件（增量），返回columns列（默认全部）组成的新DataFrame，不复制数据，各列与缓存共用同一份数组
+    # 调用方可以增加、替换列或删除行（df[col] = ...、drop_duplicates(inplace=True)等都会生成新数组），
+    # 但不能原地修改已有列的值（如df.loc[mask, col] = ...、series.values[...] = ...），否则会改坏缓存
+    def read(self, path, columns=None, ns=()):
+        df = self.get_loader(path).load(columns, ns)
+        if columns is None:
+            return df.copy(deep=False)
+        return pd.DataFrame({name: df[name] for name in columns}, copy=False)
+
+    # 切换记录文件夹时清空所有缓存
+    def clear(self):
+        with self.lock:
+            self.loaders = {}
+        columnar_cache.clear()
+
+
+csv_tail_cache = CsvTailCache()
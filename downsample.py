@@ -0,0 +1,78 @@
+# coding=utf-8
+import numpy as np
+
+
+# Largest-Triangle-Three-Buckets降采样，返回保留下来的点的下标（x按等间距处理）
+def lttb_indices(y, threshold):
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])[:max(threshold, 0)]
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+    # 第i个桶为[bounds[i], bounds[i+1])，首尾两个点单独保留
+    bounds = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    # 每个桶的平均点，最后一个桶之后的“下一个桶”就是最后一个点
+    cumsum = np.concatenate(([0.0], np.cumsum(y)))
+    starts = bounds[1:]
+    ends = np.append(bounds[2:], n)
+    avg_x = (starts + ends - 1) / 2.0
+    avg_y = (cumsum[ends] - cumsum[starts]) / (ends - starts)
+
+    res = np.empty(threshold, dtype=np.int64)
+    res[0] = 0
+    res[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        xs = np.arange(lo, hi)
+        area = np.abs((a - avg_x[i]) * (y[lo:hi] - y[a]) - (a - xs) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        res[i + 1] = a
+    return res
+
+
+# 按桶取最小值和最大值，保留尖峰，返回按原顺序排列的下标；与LTTB一样首尾两个点单独保留
+def minmax_indices(y, threshold):
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    buckets = (threshold - 2) // 2
+    if buckets < 1:
+        return np.array([0, n - 1])[:max(threshold, 0)]
+    y = np.asarray(y, dtype=float)[1:n - 1]
+    size = -(-len(y) // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(buckets, size)
+    rows = np.arange(buckets) * size
+    lows = rows + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = rows + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    inner = np.unique(np.concatenate((lows, highs)))
+    return np.concatenate(([0], inner[inner < len(y)] + 1, [n - 1]))
+
+
+DOWNSAMPLE_METHODS = {
+    "lttb": lttb_indices,
+    "minmax": minmax_indices,
+}
+
+
+# 在[lo, hi)窗口内降采样到不超过points个点，返回原序列中的下标
+# 窗口内的点不超过points个时全部保留（包括空值点，图上显示为断开）；需要降采样时空值点不参与，
+# 每段连续的空值只保留第一个点使图上仍然断开，空值段超过points的一半时不再保留
+def downsample_indices(y, lo, hi, points, method="lttb"):
+    y = np.asarray(y, dtype=float)[lo:hi]
+    if len(y) <= points:
+        return np.arange(lo, lo + len(y))
+    finite = np.isfinite(y)
+    pos = np.flatnonzero(finite)
+    gaps = np.flatnonzero(~finite & np.r_[True, finite[:-1]])
+    if len(gaps) > points // 2:
+        gaps = gaps[:0]
+    budget = points - len(gaps)
+    if len(pos) > budget:
+        pos = pos[DOWNSAMPLE_METHODS[method](y[pos], budget)]
+    return np.sort(np.concatenate((pos, gaps))) + lo
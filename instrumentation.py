@@ -0,0 +1,269 @@
+# coding=utf-8
+import bisect
+import cProfile
+import io
+import math
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request, before_render_template, template_rendered
+
+# Prometheus文本格式的Content-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 耗时直方图的分桶上界（秒），与Prometheus客户端库的默认分桶一致
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# ?profile=1时报告中列出的函数数
+PROFILE_TOP = 60
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + "}"
+
+
+# 计数器：按标签取值分别累加
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    # 逐行输出的样本：(样本名, 标签, 取值)
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            yield self.name, list(zip(self.labels, label_values)), value
+
+
+# 直方图：每组标签保存各分桶的计数（不累计）、取值总和，输出时再转换成累计计数
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self.values[label_values] = state
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self.lock:
+            items = sorted((label_values, (list(counts), total))
+                           for label_values, (counts, total) in self.values.items())
+        for label_values, (counts, total) in items:
+            labels = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield self.name + "_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+# 取值由回调函数在输出时给出的指标，用于各缓存已有的统计（如chart_cache.stats()）
+# func返回{标签取值元组: 取值}
+class CallbackMetric:
+    def __init__(self, name, help, kind, func, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.func = func
+        self.labels = tuple(labels)
+
+    def samples(self):
+        for label_values, value in sorted(self.func().items()):
+            yield self.name, list(zip(self.labels, label_values)), value
+
+
+# 指标注册表，render输出Prometheus文本格式
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise Exception("metric already registered: " + metric.name)
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, kind, func, labels=()):
+        return self.register(CallbackMetric(name, help, kind, func, labels))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append("%s%s %s" % (name, _format_labels(labels), _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+request_duration = metrics_registry.histogram("dashboard_request_duration_seconds", "Request duration by route.",
+                                              ["route", "method", "status"])
+phase_duration = metrics_registry.histogram("dashboard_route_phase_seconds",
+                                            "Exclusive time spent in each named phase of a request.",
+                                            ["route", "phase"])
+rpc_requests = metrics_registry.counter("dashboard_rpc_requests_total", "JSON-RPC requests sent to the node.",
+                                        ["method", "outcome"])
+rpc_duration = metrics_registry.histogram("dashboard_rpc_duration_seconds", "JSON-RPC request duration.",
+                                          ["method"])
+
+
+# 一次请求内的分段计时：各阶段记独占耗时，嵌套的阶段（如compute中的load）不计入外层阶段
+class RequestTimer:
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.stack = []
+        self.entered = self.start
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            parent = self.stack[-1]
+            self.phases[parent] = self.phases.get(parent, 0.0) + now - self.entered
+        self.stack.append(name)
+        self.entered = now
+
+    def exit(self):
+        now = time.perf_counter()
+        name = self.stack.pop()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.entered
+        self.entered = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+_local = threading.local()
+
+
+def current_timer():
+    return getattr(_local, "timer", None)
+
+
+# 在当前请求中计时一个阶段（load、join、compute、render、rpc），不在请求中时不计时
+@contextmanager
+def phase(name):
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit()
+
+
+# 记录一次JSON-RPC请求：按方法和结果（ok、error）计数，耗时计入直方图
+def observe_rpc(method, seconds, outcome):
+    rpc_requests.inc(method, outcome)
+    rpc_duration.observe(seconds, method)
+
+
+# 单次请求的性能报告：总耗时、各阶段耗时和cProfile按累计耗时排序的前PROFILE_TOP个函数
+def profile_report(timer, profiler, response):
+    out = io.StringIO()
+    out.write("route %s status %d total %.6fs\n" % (timer.route, response.status_code, timer.elapsed()))
+    for name, seconds in sorted(timer.phases.items(), key=lambda item: -item[1]):
+        out.write("  phase %-10s %.6fs\n" % (name, seconds))
+    out.write("\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return out.getvalue()
+
+
+# 给app挂上请求计时：每个请求按route_label()（默认为路由规则）归类，结束时记录总耗时和各阶段耗时
+# 模板渲染自动计入render阶段；请求带profile=1时返回该请求的cProfile报告而不是原来的响应
+def instrument(app, route_label=None):
+    def default_label():
+        return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+    route_label = route_label or default_label
+
+    @app.before_request
+    def start_request_timer():
+        _local.timer = RequestTimer(route_label())
+        if request.args.get("profile") == "1":
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_request_timer(response):
+        timer = current_timer()
+        if timer is None:
+            return response
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+        request_duration.observe(timer.elapsed(), timer.route, request.method, str(response.status_code))
+        for name, seconds in timer.phases.items():
+            phase_duration.observe(seconds, timer.route, name)
+        if profiler is not None:
+            response = Response(profile_report(timer, profiler, response), mimetype="text/plain")
+        return response
+
+    @app.teardown_request
+    def clear_request_timer(exc):
+        _local.timer = None
+
+    def start_render(sender, template, context, **extra):
+        timer = current_timer()
+        if timer is not None:
+            timer.enter("render")
+
+    def finish_render(sender, template, context, **extra):
+        timer = current_timer()
+        if timer is not None and timer.stack and timer.stack[-1] == "render":
+            timer.exit()
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
@@ -0,0 +1,273 @@
+# coding=utf-8
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from schemas import SCHEMAS
+
+# 生成数据的起始时刻（纳秒时间戳）
+START_TIME = int(np.datetime64("2023-12-01T10:00:00", "ns").astype(np.int64))
+SECOND = 10 ** 9
+HEX_BYTES = np.array([b"%02x" % i for i in range(256)])
+DIGIT_PAIRS = np.array([b"%02d" % i for i in range(100)]).view(np.uint8).reshape(100, 2)
+# Go time.Duration.String()的单位，按取值从大到小选第一个不小于1的单位
+GO_DURATION_UNITS = [(SECOND, "s"), (10 ** 6, "ms"), (10 ** 3, "µs"), (1, "ns")]
+MANIFEST = "loggen.json"
+WRITE_BLOCK_ROWS = 65536
+
+
+# 非负整数写成定宽（偶数位）的十进制数字（前面补0），按两位一组查表，返回(n, width)的uint8矩阵
+def _digits(values, width):
+    powers = 100 ** np.arange(width // 2 - 1, -1, -1, dtype=np.int64)
+    return DIGIT_PAIRS[values[:, None] // powers % 100].reshape(len(values), width)
+
+
+# 纳秒时间戳格式化为recorder的时间文本"YYYY-MM-DD HH:MM:SS.ffffff"（定长字节串）
+def format_times(ns):
+    ns = np.asarray(ns, dtype=np.int64)
+    days = ns.astype("datetime64[ns]").astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    micros = (ns - days.astype("datetime64[ns]").astype(np.int64)) // 1000
+    text = np.empty((len(ns), 26), dtype=np.uint8)
+    text[:, [4, 7]], text[:, 10], text[:, [13, 16]], text[:, 19] = ord("-"), ord(" "), ord(":"), ord(".")
+    text[:, 0:4] = _digits(months.astype("datetime64[Y]").astype(np.int64) + 1970, 4)
+    text[:, 5:7] = _digits(months.astype(np.int64) % 12 + 1, 2)
+    text[:, 8:10] = _digits((days - months).astype(np.int64) + 1, 2)
+    text[:, 11:13] = _digits(micros // 3600000000, 2)
+    text[:, 14:16] = _digits(micros // 60000000 % 60, 2)
+    text[:, 17:19] = _digits(micros // 1000000 % 60, 2)
+    text[:, 20:26] = _digits(micros % 1000000, 6)
+    return text.view("S26").ravel()
+
+
+def format_ints(values):
+    return np.asarray(values, dtype=np.int64).astype("S")
+
+
+# 随机的十六进制哈希，width为十六进制字符数
+def random_hex(rng, n, width=64):
+    return HEX_BYTES[rng.integers(0, 256, (n, width // 2), dtype=np.uint8)].view("S%d" % width).ravel()
+
+
+# 纳秒时长格式化为Go的duration文本，如"3.28ms"、"90.895µs"、"350ns"
+def format_durations(ns):
+    ns = np.asarray(ns, dtype=np.int64)
+    res = np.empty(len(ns), dtype="U32")
+    remaining = np.ones(len(ns), dtype=bool)
+    for scale, unit in GO_DURATION_UNITS:
+        picked = remaining & ((ns >= scale) | (scale == 1))
+        remaining &= ~picked
+        if not picked.any():
+            continue
+        if scale == 1:
+            text = ns[picked].astype(str)
+        else:
+            # 去掉小数末尾的0
+            text = np.char.rstrip(np.char.rstrip(np.char.mod("%.6f", ns[picked] / scale), "0"), ".")
+        res[picked] = np.char.add(text, unit)
+    return np.char.encode(res, "utf-8")
+
+
+# 对数正态分布的时长（纳秒），median为中位数（秒），sigma为对数标准差
+def lognormal_ns(rng, n, median, sigma):
+    return (rng.lognormal(np.log(median * SECOND), sigma, n)).astype(np.int64)
+
+
+# 各列（末尾补0的定长字节串数组）按行用逗号拼接成CSV文本：各列的字节矩阵与分隔符横向拼成定宽的行，
+# 再整体去掉补位的0字节（记录中的文本不含0字节）
+def join_rows(columns):
+    n = len(columns[0])
+    parts = []
+    for column in columns:
+        parts.append(np.ascontiguousarray(column).view(np.uint8).reshape(n, column.dtype.itemsize))
+        parts.append(np.full((n, 1), ord(","), dtype=np.uint8))
+    parts[-1] = np.full((n, 1), ord("\n"), dtype=np.uint8)
+    rows = np.hstack(parts).ravel()
+    return rows[rows != 0].tobytes()
+
+
+# 按schema写出一个记录文件：先写表头，之后每隔period行再插入一行重复的表头（模拟recorder重启后追加写入）
+class RecordWriter:
+    def __init__(self, output_path, filename, expected_rows, duplicate_headers=2):
+        self.schema = SCHEMAS[filename]
+        self.header = ",".join(self.schema.names).encode("utf-8")
+        self.file = open(os.path.join(output_path, filename), "wb")
+        self.file.write(self.header + b"\n")
+        self.period = -(-expected_rows // (duplicate_headers + 1)) if duplicate_headers else 0
+        self.rows = 0
+
+    # columns为按表头顺序排列的各列（定长字节串数组），每次拼接WRITE_BLOCK_ROWS行以限制内存
+    def write(self, columns):
+        n = len(columns[0])
+        # 在第period、2*period……行之前插入表头
+        cuts = []
+        if self.period:
+            first = -(-max(self.rows, 1) // self.period) * self.period
+            cuts = [pos - self.rows for pos in range(first, self.rows + n, self.period)]
+        begin = 0
+        for end in cuts + [n]:
+            for lo in range(begin, end, WRITE_BLOCK_ROWS):
+                self.file.write(join_rows([column[lo:min(lo + WRITE_BLOCK_ROWS, end)] for column in columns]))
+            if end < n:
+                self.file.write(self.header + b"\n")
+            begin = end
+        self.rows += n
+
+    def close(self):
+        self.file.close()
+
+
+# 按时间顺序写出的记录文件：晚于watermark的行先留着，与之后各块的行合并排序后再写出
+class SortedRecordWriter(RecordWriter):
+    def __init__(self, output_path, filename, expected_rows, duplicate_headers=2):
+        super().__init__(output_path, filename, expected_rows, duplicate_headers)
+        self.times = np.array([], dtype=np.int64)
+        self.pending = None
+
+    # times为各行的排序时间，watermark之前的行之后不会再出现
+    def add(self, times, columns, watermark=None):
+        if self.pending is not None:
+            times = np.concatenate([self.times, times])
+            columns = [np.concatenate([old, new]) for old, new in zip(self.pending, columns)]
+        order = np.argsort(times, kind="stable")
+        times, columns = times[order], [column[order] for column in columns]
+        ready = len(times) if watermark is None else int(np.searchsorted(times, watermark))
+        self.write([column[:ready] for column in columns])
+        self.times, self.pending = times[ready:], [column[ready:] for column in columns]
+
+    def close(self):
+        if self.pending is not None:
+            self.write(self.pending)
+        super().close()
+
+
+# 生成所有记录文件：transactions笔交易，按tps的速率到达，每block_interval秒出一个块
+# 交易相关的文件按块生成，每块chunk_rows笔交易，内存占用与总规模无关
+def generate(output_path, transactions=100000, tps=200, block_interval=2.0, chunk_rows=500000, seed=0,
+             duplicate_headers=2):
+    start = time.time()
+    os.makedirs(output_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    span = int(transactions / tps * SECOND)
+    interval = int(block_interval * SECOND)
+    # 出块时刻以及各块打包耗时，多留出若干块给最后到达的交易
+    blocks = span // interval + 64
+    pack_start = START_TIME + np.arange(blocks, dtype=np.int64) * interval
+    commit_cost = lognormal_ns(rng, blocks, 0.3, 0.4)
+    block_hashes = random_hex(rng, blocks)
+    block_tx_counts = np.zeros(blocks, dtype=np.int64)
+
+    def writer(filename, rows, ordered=False):
+        cls = SortedRecordWriter if ordered else RecordWriter
+        return cls(output_path, filename, rows, duplicate_headers)
+
+    txpool = writer("transaction_pool_input_throughput.csv", transactions)
+    queue = writer("tx_queue_delay.csv", 2 * transactions, ordered=True)
+    delay_start = writer("tx_delay_start.csv", transactions)
+    delay_end = writer("tx_delay_end.csv", transactions, ordered=True)
+    messages = writer("peer_message_throughput.csv", transactions)
+    p2p = writer("net_p2p_transmission_latency.csv", transactions // 10)
+    contracts = writer("contract_time.csv", transactions // 10)
+    peers = random_hex(rng, 8, 16)
+    contract_addrs = random_hex(rng, 50, 40)
+
+    for first in range(0, transactions, chunk_rows):
+        n = min(chunk_rows, transactions - first)
+        lo, hi = START_TIME + span * first // transactions, START_TIME + span * (first + n) // transactions
+        times = np.sort(rng.integers(lo, hi, n))
+        hashes = random_hex(rng, n)
+        txpool.write([format_times(times), hashes, np.where(rng.random(n) < 0.3, b"1", b"2")])
+        delay_start.write([format_times(times), hashes])
+
+        # 交易排队：1%的交易一直留在交易池中（只有in记录）
+        leave = times + lognormal_ns(rng, n, 0.2, 0.8)
+        left = rng.random(n) >= 0.01
+        queue.add(np.concatenate([times, leave[left]]),
+                  [format_times(np.concatenate([times, leave[left]])), np.concatenate([hashes, hashes[left]]),
+                   np.concatenate([np.full(n, b"in"), np.full(int(left.sum()), b"out")])], hi)
+        # 离开交易池后被下一个块打包，随该块落库确认
+        height = np.minimum(-(-(leave[left] - START_TIME) // interval), blocks - 1)
+        confirm = pack_start[height] + commit_cost[height] + rng.integers(0, SECOND // 100, len(height))
+        block_tx_counts += np.bincount(height, minlength=blocks)
+        delay_end.add(confirm, [format_times(confirm), format_ints(height), hashes[left]], hi)
+
+        times = np.sort(rng.integers(lo, hi, n))
+        messages.write([format_times(times), np.where(rng.random(n) < 0.5, b"Received", b"Sent"),
+                        format_ints(rng.lognormal(6, 1.2, n).astype(np.int64) + 40)])
+
+        m = n // 10
+        sent = np.sort(rng.integers(lo, hi, m))
+        received = sent + lognormal_ns(rng, m, 0.02, 0.5)
+        replied = received + lognormal_ns(rng, m, 0.001, 0.5)
+        back = replied + lognormal_ns(rng, m, 0.02, 0.5)
+        p2p.write([format_times(back), peers[rng.integers(0, len(peers), m)], format_times(sent),
+                   format_times(received), format_times(replied), format_times(back)])
+        contracts.write([random_hex(rng, m), contract_addrs[rng.integers(0, len(contract_addrs), m)],
+                         format_times(np.sort(rng.integers(lo, hi, m))),
+                         format_durations(lognormal_ns(rng, m, 2e-5, 1.0))])
+    for w in [txpool, queue, delay_start, delay_end, messages, p2p, contracts]:
+        w.close()
+
+    # 区块相关的文件：只写出打包了交易的块（block_tx_conflict_rate按交易数做除数）
+    packed_blocks = np.flatnonzero(block_tx_counts)
+    pack_start, commit_cost = pack_start[packed_blocks], commit_cost[packed_blocks]
+    block_hashes, block_tx_counts = block_hashes[packed_blocks], block_tx_counts[packed_blocks]
+    blocks = len(packed_blocks)
+    heights, counts = format_ints(packed_blocks), format_ints(block_tx_counts)
+    committed = pack_start + commit_cost
+    roots = random_hex(rng, blocks)
+    packed = pack_start + commit_cost // 3
+    validated = committed + lognormal_ns(rng, blocks, 0.005, 0.5)
+    validation_cost = lognormal_ns(rng, blocks, 0.004, 0.6)
+    clique_cost = lognormal_ns(rng, blocks, 0.0005, 0.5)
+    conflicts = rng.binomial(block_tx_counts, 0.02)
+    files = {
+        "block_commit_duration_start.csv": [format_times(pack_start), heights],
+        "block_commit_duration_end.csv": [format_times(committed), heights, block_hashes, counts, roots],
+        "tx_in_block_tps.csv": [format_times(packed), heights, counts, roots],
+        "block_validation_efficiency.csv": [heights, format_times(validated - validation_cost),
+                                            format_times(validated), counts],
+        "block_validation_efficiency_start.csv": [format_times(validated), block_hashes,
+                                                  format_durations(validation_cost)],
+        "block_validation_efficiency_end.csv": [format_times(validated), block_hashes, counts, heights],
+        "consensus_clique_cost.csv": [heights, format_times(pack_start), format_times(pack_start + clique_cost),
+                                      format_durations(clique_cost)],
+        "db_state_write_rate.csv": [format_times(committed), heights, block_hashes,
+                                    format_durations(lognormal_ns(rng, blocks, 0.0005, 0.8))],
+        "db_state_read_rate.csv": [format_times(validated), block_hashes,
+                                   format_durations(lognormal_ns(rng, blocks, 0.00002, 1.0))],
+        "block_tx_conflict_rate.csv": [format_times(committed), format_ints(conflicts), heights, counts],
+    }
+    for filename, columns in files.items():
+        w = writer(filename, blocks)
+        w.write(columns)
+        w.close()
+
+    params = {"transactions": transactions, "tps": tps, "block_interval": block_interval, "seed": seed,
+              "duplicate_headers": duplicate_headers}
+    with open(os.path.join(output_path, MANIFEST), "w") as f:
+        json.dump(params, f, indent=2)
+    print("generated %d transactions, %d blocks in %s, time cost = %.2fs"
+          % (transactions, blocks, output_path, time.time() - start))
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成模拟的recorder记录文件，用于性能测试")
+    parser.add_argument("output_path")
+    parser.add_argument("-n", "--transactions", type=int, default=100000, help="交易笔数，最大的文件约为其2倍行")
+    parser.add_argument("--tps", type=float, default=200, help="交易到达速率（笔/秒）")
+    parser.add_argument("--block-interval", type=float, default=2.0, help="出块间隔（秒）")
+    parser.add_argument("--chunk-rows", type=int, default=500000, help="每次生成的交易笔数，决定内存占用")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-headers", type=int, default=2, help="每个文件中间插入的重复表头行数")
+    args = parser.parse_args()
+    generate(args.output_path, args.transactions, args.tps, args.block_interval, args.chunk_rows, args.seed,
+             args.duplicate_headers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# coding=utf-8
+import argparse
+import inspect
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+import traceback
+
+import calculate
+from columnar_cache import CACHE_DIR_ENV
+from streaming import open_records, parse_memory_budget
+
+# 汇总任务：读取其它任务的结果文件，只接收output_path
+REPORT_TASK = "merge_results"
+
+# 指标依赖图：任务名 -> (计算函数, 读取的文件, 产出的文件)
+# 读取的文件由其它任务产出时依赖该任务，否则是input_path下的记录文件
+TASKS = {
+    "transaction_pool_input_throughput": (calculate.transaction_pool_input_throughput,
+                                          ["transaction_pool_input_throughput.csv"],
+                                          ["transaction_pool_input_throughput_result.csv"]),
+    "net_p2p_transmission_latency": (calculate.net_p2p_transmission_latency,
+                                     ["net_p2p_transmission_latency.csv"],
+                                     ["net_p2p_transmission_latency_result.csv",
+                                      "net_p2p_transmission_latency_quantiles.csv"]),
+    "peer_message_throughput": (calculate.peer_message_throughput,
+                                ["peer_message_throughput.csv"],
+                                ["peer_message_throughput_result.csv"]),
+    "db_state_write_rate": (calculate.db_state_write_rate,
+                            ["db_state_write_rate.csv"],
+                            ["db_state_write_rate_result.csv"]),
+    "db_state_read_rate": (calculate.db_state_read_rate,
+                           ["db_state_read_rate.csv"],
+                           ["db_state_read_rate_result.csv"]),
+    "tx_queue_delay": (calculate.tx_queue_delay,
+                       ["tx_queue_delay.csv"],
+                       ["tx_queue_delay_result.csv", "tx_queue_delay_quantiles.csv"]),
+    "block_commit_duration": (calculate.block_commit_duration,
+                              ["block_commit_duration_start.csv", "block_commit_duration_end.csv"],
+                              ["block_commit_duration_result.csv", "block_commit_duration_quantiles.csv"]),
+    "tx_in_block_tps": (calculate.tx_in_block_tps,
+                        ["block_commit_duration_start.csv", "block_commit_duration_end.csv"],
+                        ["tx_in_block_tps_result.csv"]),
+    "block_validation_efficiency": (calculate.block_validation_efficiency,
+                                    ["block_validation_efficiency_start.csv", "block_validation_efficiency_end.csv"],
+                                    ["block_validation_efficiency_result.csv"]),
+    "tx_delay": (calculate.tx_delay,
+                 ["tx_delay_start.csv", "tx_delay_end.csv"],
+                 ["tx_delay_result.csv", "tx_delay_quantiles.csv"]),
+    "clique_round_time": (calculate.clique_round_time,
+                          ["consensus_clique_cost.csv"],
+                          ["consensus_clique_cost_result.csv"]),
+    "contract_time": (calculate.contract_time,
+                      ["contract_time.csv"],
+                      ["contract_time_result.csv"]),
+    "block_tx_conflict_rate": (calculate.block_tx_conflict_rate,
+                               ["block_tx_conflict_rate.csv"],
+                               ["block_tx_conflict_rate_result.csv"]),
+    REPORT_TASK: (calculate.merge_results, calculate.report_files(), ["res.csv"]),
+}
+
+
+def dependencies(name):
+    inputs = set(TASKS[name][1])
+    return {other for other, (_, _, outputs) in TASKS.items() if other != name and inputs & set(outputs)}
+
+
+# 峰值常驻内存(MB)，Linux下ru_maxrss单位为KB，macOS下为字节
+def peak_memory_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+# 在子进程中执行一个任务，返回(任务名, 耗时, 峰值内存, 错误信息)
+def run_task(name, input_path, output_path, kwargs):
+    start = time.time()
+    func, _, outputs = TASKS[name]
+    error = None
+    try:
+        if name == REPORT_TASK:
+            func(output_path)
+        else:
+            # 只传入该指标函数支持的参数（如只有分块计算的指标接收memory_budget）
+            params = inspect.signature(func).parameters
+            func(input_path, output_path, **{k: v for k, v in kwargs.items() if k in params})
+        # 指标函数遇到缺少记录文件时只打印提示，这里按结果文件是否生成判断成败
+        missing = [f for f in outputs if not os.path.exists(os.path.join(output_path, f))]
+        if missing:
+            error = "output not produced: " + ", ".join(missing)
+    except Exception:
+        error = traceback.format_exc()
+    return name, time.time() - start, peak_memory_mb(), error
+
+
+# 在子进程中刷新一个记录文件的列式缓存；出错时不在这里报告，读取该文件的任务会得到同样的错误
+def refresh_records(path, memory_budget):
+    try:
+        open_records(path, memory_budget)
+    except Exception:
+        pass
+
+
+# 按依赖图并行执行任务：没有未完成依赖的任务提交到进程池，依赖失败的任务跳过
+# 每个任务使用一个新的子进程（maxtasksperchild=1），峰值内存按任务统计
+def run(input_path, output_path, jobs=None, only=None, **kwargs):
+    os.makedirs(output_path, exist_ok=True)
+    names = list(TASKS) if not only else list(only)
+    for name in names:
+        if name not in TASKS:
+            raise Exception("unknown metric: " + name)
+    # 不在本次执行范围内的依赖视为已经完成（使用已有的结果文件）
+    deps = {name: dependencies(name) & set(names) for name in names}
+    pending = list(names)
+    stats = {}
+    finished = queue.Queue()
+    start = time.time()
+    records = sorted({os.path.join(input_path, f) for name in names if name != REPORT_TASK for f in TASKS[name][1]
+                      if os.path.exists(os.path.join(input_path, f))})
+    with multiprocessing.Pool(jobs or os.cpu_count(), maxtasksperchild=1) as pool:
+        # 先把各任务读取的记录文件的列式缓存刷新一遍，每个文件只由一个进程解析；
+        # 之后的任务只读取已经建好的缓存，读取同一文件的几个任务不会同时刷新它
+        pool.starmap(refresh_records, [(path, kwargs.get("memory_budget")) for path in records])
+        print("refreshed %d record files in %.2fs" % (len(records), time.time() - start))
+        running = 0
+        while pending or running:
+            for name in list(pending):
+                # 只有依赖失败时跳过；依赖因缺少记录文件被跳过时照常执行（汇总任务跳过不存在的结果文件）
+                failed = [d for d in deps[name] if d in stats and stats[d][0] == "failed"]
+                missing = [f for f in TASKS[name][1] if name != REPORT_TASK and
+                           not os.path.exists(os.path.join(input_path, f))]
+                if failed or missing:
+                    pending.remove(name)
+                    reason = "dependency failed: " + ", ".join(failed) if failed else "missing input: " + ", ".join(missing)
+                    stats[name] = ("skipped", 0.0, 0.0, reason)
+                elif all(d in stats for d in deps[name]):
+                    pending.remove(name)
+                    running += 1
+                    pool.apply_async(run_task, (name, input_path, output_path, kwargs), callback=finished.put,
+                                     error_callback=lambda e, name=name: finished.put((name, 0.0, 0.0, repr(e))))
+            if not running:
+                if pending:
+                    raise Exception("dependency cycle among: " + ", ".join(pending))
+                continue
+            name, wall, peak, error = finished.get()
+            running -= 1
+            stats[name] = ("ok" if error is None else "failed", wall, peak, error)
+            print("[%s] %s %.2fs peak %.1fMB" % (stats[name][0], name, wall, peak))
+    total = time.time() - start
+
+    print("%-36s %-8s %10s %12s" % ("metric", "status", "wall(s)", "peak(MB)"))
+    for name in names:
+        status, wall, peak, error = stats[name]
+        print("%-36s %-8s %10.2f %12.1f" % (name, status, wall, peak))
+        if error:
+            print("    " + error.strip().replace("\n", "\n    "))
+    print("total wall time %.2fs, sum of metric time %.2fs" % (total, sum(s[1] for s in stats.values())))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行计算记录文件的各项指标并汇总")
+    parser.add_argument("input_path", nargs="?", default="/Users/bethestar/Downloads/ethlog/mylog/")
+    parser.add_argument("output_path", nargs="?", default="/Users/bethestar/Downloads/ethlog/mylog/res/")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument("--only", nargs="+", help="只执行这些任务，其余任务的结果文件直接使用")
+    parser.add_argument("--no-check-column-name", action="store_true", help="不检查记录文件的列名")
+    parser.add_argument("--memory-budget", type=parse_memory_budget, default=None,
+                        help="每个指标进程的内存预算（如512M），设置后大文件按块流式计算")
+    parser.add_argument("--cache-dir", default=None,
+                        help="记录文件列式缓存的根目录，默认为环境变量RECORDER_CACHE_DIR或~/.cache/recorder_columnar")
+    parser.add_argument("--resume", action="store_true",
+                        help="从上次保存的断点继续，只处理记录文件新追加的行（断点保存在output_path/.checkpoints）")
+    args = parser.parse_args()
+    # 通过环境变量传给各子进程
+    if args.cache_dir:
+        os.environ[CACHE_DIR_ENV] = args.cache_dir
+    kwargs = {"check_column_name": False} if args.no_check_column_name else {}
+    if args.memory_budget is not None:
+        kwargs["memory_budget"] = args.memory_budget
+    if args.resume:
+        kwargs["resume"] = True
+    stats = run(args.input_path, args.output_path, args.jobs, args.only, **kwargs)
+    sys.exit(0 if all(s[0] != "failed" for s in stats.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
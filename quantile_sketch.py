@@ -0,0 +1,160 @@
+# coding=utf-8
+import math
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import decode_text, encode_text
+
+# 默认输出的分位数
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+# 绝对值不超过MIN_VALUE的取值都放进0号桶
+MIN_VALUE = 1e-9
+
+
+# 按键分组的对数分桶分位数草图（DDSketch）：取值按相对误差relative_accuracy映射到对数桶，
+# 每个键（如measure_time所在的秒）只保存非空桶的计数，以及精确的最小值、最大值
+# 桶号与数据顺序、分块方式无关，合并就是同键同桶的计数相加，所以各块、各进程、各节点的草图可以任意合并
+# 每个键的桶数不超过log(取值范围)/log(gamma)，相对误差1%时覆盖1e-9~1e12也只有约2400个桶
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # 排好序的键，以及每个键的精确最小值、最大值
+        self.keys = np.array([], dtype="S1")
+        self.minima = np.array([], dtype=np.float64)
+        self.maxima = np.array([], dtype=np.float64)
+        # 按(键序号, 桶号)排序的非空桶
+        self.groups = np.array([], dtype=np.int32)
+        self.bins = np.array([], dtype=np.int32)
+        self.counts = np.array([], dtype=np.int64)
+
+    # 取值映射到桶号：正数为1 + ceil(log_gamma(v / MIN_VALUE))，负数取相反数，桶号的顺序与取值的顺序一致
+    def _bins(self, values):
+        magnitude = np.maximum(np.abs(values), MIN_VALUE)
+        bins = np.ceil(np.log(magnitude / MIN_VALUE) / math.log(self.gamma)).astype(np.int64) + 1
+        bins[np.abs(values) <= MIN_VALUE] = 0
+        return (np.sign(values).astype(np.int64) * bins).astype(np.int32)
+
+    # 桶号对应的代表值，与桶内任一取值的相对误差不超过relative_accuracy
+    def _values(self, bins):
+        magnitude = MIN_VALUE * np.power(self.gamma, np.abs(bins).astype(np.float64) - 1) * 2 / (self.gamma + 1)
+        return np.where(bins == 0, 0.0, np.sign(bins) * magnitude)
+
+    # 加入一批取值，keys为每个取值所属的键（如截断到秒的measure_time），键或取值为空的跳过
+    def add(self, keys, values):
+        values = np.asarray(values, dtype=np.float64)
+        codes, uniques = pd.factorize(np.asarray(keys, dtype=object), sort=True)
+        valid = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[valid], values[valid]
+        if len(values) == 0:
+            return
+        # 先在本批内按(键序号, 桶号)计数，再并入已有的桶
+        ids, counts = np.unique(_bin_ids(codes, self._bins(values)), return_counts=True)
+        extremes = pd.Series(values).groupby(codes).agg(["min", "max"])
+        part = QuantileSketch(self.relative_accuracy)
+        part.keys = encode_text(uniques[extremes.index.to_numpy()])
+        part.minima, part.maxima = extremes["min"].to_numpy(), extremes["max"].to_numpy()
+        # 没有取值的键（取值全为空）已经从extremes中去掉，键序号按剩下的键重新编号
+        renumber = np.full(len(uniques), -1, dtype=np.int64)
+        renumber[extremes.index.to_numpy()] = np.arange(len(extremes))
+        part.groups = renumber[ids >> 32].astype(np.int32)
+        part.bins = ((ids & 0xFFFFFFFF) - (1 << 31)).astype(np.int32)
+        part.counts = counts.astype(np.int64)
+        self.merge(part)
+
+    # 合并另一个草图：键取并集，同键同桶的计数相加，最小值、最大值分别取小、取大
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise Exception("can not merge quantile sketches with different relative accuracy")
+        if len(other.keys) == 0:
+            return
+        width = max(self.keys.dtype.itemsize, other.keys.dtype.itemsize)
+        keys = np.union1d(self.keys.astype("S%d" % width), other.keys.astype("S%d" % width))
+        own = np.searchsorted(keys, self.keys.astype("S%d" % width))
+        theirs = np.searchsorted(keys, other.keys.astype("S%d" % width))
+        minima, maxima = np.full(len(keys), np.inf), np.full(len(keys), -np.inf)
+        minima[own], maxima[own] = self.minima, self.maxima
+        minima[theirs] = np.minimum(minima[theirs], other.minima)
+        maxima[theirs] = np.maximum(maxima[theirs], other.maxima)
+
+        ids = np.concatenate([_bin_ids(own[self.groups], self.bins), _bin_ids(theirs[other.groups], other.bins)])
+        counts = np.concatenate([self.counts, other.counts])
+        order = np.argsort(ids, kind="stable")
+        ids, counts = ids[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ids = ids[starts]
+        self.keys, self.minima, self.maxima = keys, minima, maxima
+        self.groups = (ids >> 32).astype(np.int32)
+        self.bins = ((ids & 0xFFFFFFFF) - (1 << 31)).astype(np.int32)
+        self.counts = np.add.reduceat(counts, starts)
+
+    # 按键排序的分位数表：count、各分位数和max，quantiles为{列名: 分位数}
+    def result(self, quantiles=QUANTILES):
+        res = pd.DataFrame(index=pd.Index(decode_text(self.keys), name="measure_time"))
+        group_starts = np.searchsorted(self.groups, np.arange(len(self.keys)))
+        cumulative = np.cumsum(self.counts)
+        offsets = cumulative[group_starts] - self.counts[group_starts] if len(self.keys) else group_starts
+        totals = np.diff(np.r_[offsets, cumulative[-1:]])
+        res["count"] = totals
+        for name, q in quantiles.items():
+            # 每组中排第floor(q * (count - 1))位（从0开始）的取值所在桶的代表值，限制在该组的最小值、最大值之间
+            ranks = offsets + np.floor(q * (totals - 1)).astype(np.int64)
+            positions = np.searchsorted(cumulative, ranks, side="right")
+            res[name] = np.clip(self._values(self.bins[positions]), self.minima, self.maxima)
+        res["max"] = self.maxima
+        return res
+
+    # 整个运行期间（所有键合并）的计数、分位数和最大值
+    def total(self, quantiles=QUANTILES):
+        if len(self.keys) == 0:
+            return {"count": 0, **{name: None for name in quantiles}, "max": None}
+        res = self._regroup(np.zeros(len(self.keys), dtype=np.int32), np.array([b""])).result(quantiles)
+        return {column: (int(value) if column == "count" else float(value)) for column, value in res.iloc[0].items()}
+
+    # 按groups（每个键的新序号）把各键归并到新的键keys下
+    def _regroup(self, groups, keys):
+        res = QuantileSketch(self.relative_accuracy)
+        res.keys = keys
+        res.minima = pd.Series(self.minima).groupby(groups).min().to_numpy()
+        res.maxima = pd.Series(self.maxima).groupby(groups).max().to_numpy()
+        ids = _bin_ids(groups[self.groups], self.bins)
+        order = np.argsort(ids, kind="stable")
+        ids, counts = ids[order], self.counts[order]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        res.groups = (ids[starts] >> 32).astype(np.int32)
+        res.bins = ((ids[starts] & 0xFFFFFFFF) - (1 << 31)).astype(np.int32)
+        res.counts = np.add.reduceat(counts, starts)
+        return res
+
+    # 写入各键的分位数表，列名加上name前缀，如tx_confirm_delay_p99
+    def write_csv(self, path, name, quantiles=QUANTILES):
+        res = self.result(quantiles)
+        res.columns = [name + "_" + column for column in res.columns]
+        res.to_csv(path, index=True)
+
+    # 保存为npz文件，不同进程、不同节点的草图文件可以用load读回后merge
+    def save(self, path):
+        np.savez(path, relative_accuracy=self.relative_accuracy, keys=self.keys, minima=self.minima,
+                 maxima=self.maxima, groups=self.groups, bins=self.bins, counts=self.counts)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            sketch = QuantileSketch(float(data["relative_accuracy"]))
+            for name in ["keys", "minima", "maxima", "groups", "bins", "counts"]:
+                setattr(sketch, name, data[name])
+        return sketch
+
+
+# (键序号, 桶号)拼成一个int64，排序顺序与先按键序号、再按桶号排序一致
+def _bin_ids(groups, bins):
+    return (groups.astype(np.int64) << 32) | (bins.astype(np.int64) + (1 << 31))
+
+
+# 一列取值整体的分位数（不分键），返回{"count", "p50", "p90", "p99", "max"}
+def quantile_summary(values, relative_accuracy=0.01):
+    values = pd.Series(values, copy=False).astype(float).to_numpy()
+    sketch = QuantileSketch(relative_accuracy)
+    sketch.add(np.full(len(values), "", dtype=object), values)
+    return sketch.total()
@@ -0,0 +1,440 @@
+// 根据/api/<metric>返回的列式数据在浏览器端绘制echarts图表
+
+// 各指标的展示配置：标题、坐标轴名称、提示框字段、默认缩放范围等
+// tooltip中每一项为[显示名称, 字段, 单位]，字段为x、y或接口返回的附加列
+var CHART_SPECS = {
+    PeerMessageThroughput: {
+        type: 'dual_line',
+        titles: ['节点收发消息总量-接收', '节点收发消息总量-发送'],
+        seriesNames: ['接收消息大小', '发送消息大小'],
+        xName: '测量时刻',
+        yName: '消息大小',
+        zooms: [[0, 5], [10, 15]]
+    },
+    NetP2PTransmissionLatency: {
+        type: 'bar',
+        title: function (data) {
+            return '从' + data.summary.peer_id + '发出消息计算结果';
+        },
+        seriesName: '平均传输时间',
+        xName: '测量时间',
+        yName: '平均传输时间/s',
+        zoom: [0, 100],
+        cdfName: 'P2P平均传播时延'
+    },
+    DBStateWriteRate: {
+        type: 'bar',
+        title: '数据库写入速率',
+        seriesName: '写入耗时',
+        xName: '区块高度',
+        yName: '写入耗时/s',
+        zoom: [40, 60],
+        tooltip: [['区块哈希', 'block_hash', ''], ['写入耗时', 'y', 's']],
+        note: function (data) {
+            return '数据库平均写入速率：' + data.summary.mean + '秒/块';
+        }
+    },
+    DBStateReadRate: {
+        type: 'bar',
+        title: '数据库读取速率',
+        seriesName: '读取耗时',
+        xName: '开始读取时刻',
+        yName: '读取耗时/s',
+        zoom: [45, 55],
+        tooltip: [['区块哈希', 'block_hash', ''], ['读取耗时', 'y', 's']],
+        cdfName: '数据库读取耗时'
+    },
+    ConsensusCliqueCost: {
+        type: 'bar',
+        title: '每轮Clique共识耗时',
+        seriesName: '共识耗时',
+        xName: '区块高度',
+        yName: '共识耗时/s',
+        zoom: [40, 60],
+        tooltip: [['区块高度', 'x', ''], ['共识类型', null, 'Clique'], ['共识耗时', 'y', 's']]
+    },
+    ContractTime: {
+        type: 'bar',
+        title: '合约执行时间',
+        seriesName: '执行时间',
+        xName: '开始执行时刻',
+        yName: '执行时间/s',
+        zoom: [45, 55],
+        tooltip: [['合约地址', 'contract_addr', ''], ['交易哈希', 'tx_hash', ''], ['执行时间', 'y', 's']],
+        cdfName: '合约执行时间'
+    },
+    TxDelay: {
+        type: 'bar',
+        title: '交易延迟',
+        seriesName: '交易延迟',
+        xName: '进入交易池时刻',
+        yName: '交易延迟/s',
+        zoom: [45, 55],
+        tooltip: [['区块高度', 'block_height', ''], ['交易哈希', 'tx_hash', ''], ['交易延迟', 'y', 's']],
+        cdfName: '交易延迟'
+    },
+    TxQueueDelay: {
+        type: 'bar',
+        title: '交易排队时延',
+        seriesName: '交易排队时延',
+        xName: '进入交易池时刻',
+        yName: '交易排队时延/s',
+        zoom: [45, 55],
+        tooltip: [['交易哈希', 'tx_hash', ''], ['交易排队时延', 'y', 's']],
+        cdfName: '交易排队时延'
+    },
+    TransactionPoolInputThroughput: {
+        type: 'pie',
+        seriesName: '交易来源'
+    },
+    BlockCommitDuration: {
+        type: 'bar',
+        title: '当前节点出块耗时',
+        seriesName: '当前节点出块耗时',
+        xName: '区块高度',
+        yName: '出块耗时/s',
+        zoom: [45, 55],
+        tooltip: [['区块高度', 'x', ''], ['区块哈希', 'block_hash', ''], ['块内交易数量', 'block_tx_count', ''],
+            ['出块耗时', 'y', 's']]
+    },
+    TxInBlockTps: {
+        type: 'bar',
+        title: '块内交易吞吐量',
+        seriesName: '块内交易吞吐量',
+        xName: '区块高度',
+        yName: '块内交易吞吐量(笔/s)',
+        zoom: [45, 55],
+        tooltip: [['区块高度', 'x', ''], ['区块哈希', 'block_hash', ''], ['块内交易数量', 'block_tx_count', ''],
+            ['块内交易树根', 'block_txsroot', ''], ['打包到落库耗时', 'duration', 's'], ['块内交易吞吐量', 'y', '笔/s']]
+    },
+    BlockValidationEfficiency: {
+        type: 'bar',
+        title: '区块验证效率',
+        seriesName: '区块验证效率',
+        xName: '区块高度',
+        yName: '区块验证效率(笔/s)',
+        zoom: [45, 55],
+        tooltip: [['区块高度', 'x', ''], ['块内交易数量', 'block_tx_count', ''],
+            ['区块验证耗时', 'block_validation_duration', 's'], ['区块验证效率', 'y', '笔/s']]
+    }
+};
+
+var TOOLBOX = {
+    feature: {
+        saveAsImage: {},
+        restore: {},
+        dataView: {readOnly: true},
+        dataZoom: {},
+        magicType: {type: ['line', 'bar']}
+    }
+};
+
+function specValue(value, data) {
+    return typeof value === 'function' ? value(data) : value;
+}
+
+// 取序列中第index个点的某个字段
+function fieldValue(series, field, index) {
+    if (field === 'x') {
+        return series.x[index];
+    }
+    if (field === 'y') {
+        return series.y[index];
+    }
+    return series.extra[field][index];
+}
+
+function tooltipFormatter(spec, series) {
+    if (!spec.tooltip) {
+        return undefined;
+    }
+    return function (params) {
+        return spec.tooltip.map(function (item) {
+            var value = item[1] === null ? '' : fieldValue(series, item[1], params.dataIndex);
+            return item[0] + ':' + value + item[2];
+        }).join('</br>');
+    };
+}
+
+function visualMap(summary) {
+    return {
+        type: 'continuous',
+        min: summary.min,
+        max: summary.max,
+        calculable: true,
+        inRange: {color: ['#50a3ba', '#eac763', '#d94e5d']}
+    };
+}
+
+// 在图表右上角显示一段说明文字
+function noteGraphic(text, options) {
+    return [{
+        type: 'group',
+        right: options.right,
+        left: options.left,
+        top: options.top,
+        children: [{
+            type: 'rect',
+            z: 100,
+            left: 'center',
+            top: 'middle',
+            shape: {width: options.width, height: options.height},
+            style: {
+                fill: '#0b3a8a30',
+                shadowBlur: 8,
+                shadowOffsetX: 3,
+                shadowOffsetY: 3,
+                shadowColor: 'rgba(0,0,0,0.3)'
+            }
+        }, {
+            type: 'text',
+            z: 100,
+            left: 'center',
+            top: 'middle',
+            style: {text: text, font: options.font, fill: '#333'}
+        }]
+    }];
+}
+
+function barOption(spec, data, zooms) {
+    var series = data.series[0];
+    var zoom = zooms ? zooms[0] : spec.zoom;
+    var option = {
+        title: {text: specValue(spec.title, data)},
+        toolbox: TOOLBOX,
+        visualMap: visualMap(data.summary),
+        dataZoom: [{type: 'slider', start: zoom[0], end: zoom[1]}],
+        legend: {left: 'center', data: [spec.seriesName]},
+        tooltip: {trigger: 'item', formatter: tooltipFormatter(spec, series)},
+        xAxis: {type: 'category', name: spec.xName, data: series.x},
+        yAxis: {type: 'value', name: spec.yName},
+        series: [{type: 'bar', name: spec.seriesName, data: series.y, label: {show: true}}]
+    };
+    if (spec.note) {
+        option.graphic = noteGraphic(spec.note(data),
+            {right: '20%', top: '15%', width: 320, height: 30, font: '12px Microsoft YaHei'});
+    }
+    return option;
+}
+
+function dualLineOption(spec, data, zooms) {
+    var received = data.series[0];
+    var sent = data.series[1];
+    zooms = zooms || spec.zooms;
+    return {
+        title: [{text: spec.titles[0]}, {text: spec.titles[1], top: '50%'}],
+        toolbox: TOOLBOX,
+        visualMap: visualMap(data.summary),
+        dataZoom: [
+            {type: 'slider', start: zooms[0][0], end: zooms[0][1], xAxisIndex: 0},
+            {type: 'slider', start: zooms[1][0], end: zooms[1][1], xAxisIndex: 1}
+        ],
+        legend: [{left: 'center', data: [spec.seriesNames[0]]}, {left: 'center', top: '50%', data: [spec.seriesNames[1]]}],
+        tooltip: {trigger: 'item'},
+        grid: [{bottom: '60%'}, {top: '60%'}],
+        xAxis: [
+            {type: 'category', gridIndex: 0, name: spec.xName, data: received.x},
+            {type: 'category', gridIndex: 1, name: spec.xName, data: sent.x}
+        ],
+        yAxis: [
+            {type: 'value', gridIndex: 0, name: spec.yName},
+            {type: 'value', gridIndex: 1, name: spec.yName}
+        ],
+        series: [
+            {type: 'line', name: spec.seriesNames[0], data: received.y, smooth: true, xAxisIndex: 0, yAxisIndex: 0},
+            {type: 'line', name: spec.seriesNames[1], data: sent.y, smooth: true, xAxisIndex: 1, yAxisIndex: 1}
+        ]
+    };
+}
+
+function pieOption(spec, data) {
+    var series = data.series[0];
+    var summary = data.summary;
+    var text = ['开始时间: ' + summary.start_time, '结束时间: ' + summary.end_time,
+        '总记录时间: ' + summary.duration + 's', '交易数: ' + summary.tx_count,
+        '交易池输入通量: ' + summary.throughput].join('\n');
+    return {
+        tooltip: {trigger: 'item', formatter: '{a} <br/>{b}: {c} ({d}%)'},
+        legend: {},
+        graphic: noteGraphic(text, {left: '1%', top: '15%', width: 260, height: 90, font: '14px Microsoft YaHei'}),
+        series: [{
+            type: 'pie',
+            name: spec.seriesName,
+            data: series.x.map(function (name, i) {
+                return {name: name, value: series.y[i]};
+            })
+        }]
+    };
+}
+
+// data.cdf.x为数值端点，对数分段且端点都为正数时使用对数坐标轴
+function cdfOption(spec, data) {
+    var cdf = data.cdf;
+    var logAxis = cdf.scale === 'log' && cdf.x[0] > 0;
+    return {
+        title: {text: spec.cdfName + '累积分布函数'},
+        toolbox: TOOLBOX,
+        dataZoom: [{type: 'slider', start: 0, end: 100}],
+        tooltip: {
+            trigger: 'item',
+            formatter: function (params) {
+                return '≤ ' + params.value[0] + ': ' + (params.value[1] * 1).toFixed(3) + '%';
+            }
+        },
+        xAxis: {type: logAxis ? 'log' : 'value', name: spec.cdfName, scale: !logAxis},
+        yAxis: {type: 'value', name: '累积分布百分比', max: 100},
+        series: [{
+            type: 'line',
+            name: '累积分布',
+            showSymbol: cdf.x.length <= 60,
+            data: cdf.x.map(function (x, i) {
+                return [x, cdf.y[i]];
+            }),
+            areaStyle: {opacity: 1, color: '#173c8550'},
+            label: {
+                show: cdf.x.length <= 20,
+                position: 'right',
+                formatter: function (params) {
+                    return (params.value[1] * 1).toFixed(3) + '%';
+                }
+            }
+        }]
+    };
+}
+
+// zooms为各数据缩放组件的[start, end]，不传时使用配置中的默认范围
+function buildOption(spec, data, zooms) {
+    if (spec.type === 'dual_line') {
+        return dualLineOption(spec, data, zooms);
+    }
+    if (spec.type === 'pie') {
+        return pieOption(spec, data);
+    }
+    return barOption(spec, data, zooms);
+}
+
+// 有累积分布数据时，在图表上方加“按时刻查看/按累计分布查看”两个选项卡
+function addTabs(container, views) {
+    var tabs = $('<ul class="nav nav-tabs" style="width: 100%"></ul>');
+    views.forEach(function (view, i) {
+        var link = $('<a class="nav-link" href="#"></a>').text(view[0]);
+        if (i === 0) {
+            link.addClass('active');
+        }
+        link.click(function (event) {
+            event.preventDefault();
+            tabs.find('.nav-link').removeClass('active');
+            link.addClass('active');
+            view[1]();
+        });
+        tabs.append($('<li class="nav-item"></li>').append(link));
+    });
+    container.before(tabs);
+}
+
+// windows为各序列在完整数据上的[start, end]百分比范围
+// 页面地址中的cdf（log/quantile/linear）、cdf_bins参数原样传给接口，用于选择CDF的分段方式和段数
+function metricUrl(metric, points, windows) {
+    var url = '/api/' + metric + '?points=' + points;
+    (windows || []).forEach(function (window) {
+        url += '&start=' + window[0] + '&end=' + window[1];
+    });
+    var pageParams = new URLSearchParams(location.search);
+    ['cdf', 'cdf_bins'].forEach(function (name) {
+        if (pageParams.has(name)) {
+            url += '&' + name + '=' + encodeURIComponent(pageParams.get(name));
+        }
+    });
+    return url;
+}
+
+// 把当前数据上的缩放百分比换算成完整序列上的百分比（series.index为各点在完整序列中的下标）
+function fullWindow(series, start, end) {
+    var len = series.index.length;
+    if (len === 0) {
+        return [0, 100];
+    }
+    var i0 = Math.max(0, Math.floor(start / 100 * (len - 1)));
+    var i1 = Math.min(len - 1, Math.ceil(end / 100 * (len - 1)));
+    return [series.index[i0] / series.total * 100, (series.index[i1] + 1) / series.total * 100];
+}
+
+function debounce(func, wait) {
+    var timer = null;
+    return function () {
+        clearTimeout(timer);
+        timer = setTimeout(func, wait);
+    };
+}
+
+// 后端按图表宽度降采样；缩放到降采样过的数据时，按缩放范围重新请求该段的细节数据，
+// 点工具栏的还原按钮回到完整序列的概览
+function drawMetric(metric, elementId) {
+    var container = $('#' + elementId);
+    var spec = CHART_SPECS[metric];
+    var points = Math.max(100, Math.round(container.width()));
+    var state = {data: null, zooms: undefined, view: 'time'};
+    var chart = null;
+
+    function render() {
+        chart.setOption(buildOption(spec, state.data, state.zooms), true);
+    }
+
+    function load(windows) {
+        $.getJSON(metricUrl(metric, points, windows), function (data) {
+            state.data = data;
+            state.zooms = windows ? windows.map(function () {
+                return [0, 100];
+            }) : undefined;
+            if (state.view === 'time') {
+                render();
+            }
+        });
+    }
+
+    function onDataZoom() {
+        var downsampled = state.data.series.some(function (series) {
+            return series.downsampled;
+        });
+        if (state.view !== 'time' || !downsampled) {
+            return;
+        }
+        var zooms = chart.getOption().dataZoom;
+        load(state.data.series.map(function (series, i) {
+            var zoom = zooms[Math.min(i, zooms.length - 1)];
+            return fullWindow(series, zoom.start, zoom.end);
+        }));
+    }
+
+    $.getJSON(metricUrl(metric, points), function (data) {
+        if (data.empty) {
+            container.html('<h2>当前文件尚无数据</h2>');
+            return;
+        }
+        state.data = data;
+        chart = echarts.init(container[0]);
+        render();
+        chart.on('datazoom', debounce(onDataZoom, 300));
+        chart.on('restore', function () {
+            if (state.view === 'time') {
+                load();
+            }
+        });
+        if (spec.cdfName && data.cdf) {
+            var cdf = data.cdf;
+            addTabs(container, [
+                ['按时刻查看', function () {
+                    state.view = 'time';
+                    render();
+                }],
+                ['按累计分布查看', function () {
+                    state.view = 'cdf';
+                    chart.setOption(cdfOption(spec, {cdf: cdf}), true);
+                }]
+            ]);
+        }
+        $(window).resize(function () {
+            chart.resize();
+        });
+    });
+}
@@ -0,0 +1,190 @@
+# coding=utf-8
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import HTTPProvider
+from web3._utils.encoding import Web3JsonEncoder
+
+from instrumentation import metrics_registry, observe_rpc, phase
+
+# 随链头变化的请求，结果缓存head_ttl秒
+HEAD_METHODS = {"eth_blockNumber", "admin_peers", "net_peerCount", "eth_syncing", "eth_gasPrice"}
+# 按高度、按哈希取区块的请求；按高度取时参数为标签（latest等）的也随链头变化
+BLOCK_BY_NUMBER_METHODS = {"eth_getBlockByNumber", "eth_getBlockTransactionCountByNumber"}
+BLOCK_BY_HASH_METHODS = {"eth_getBlockByHash", "eth_getBlockTransactionCountByHash"}
+BLOCK_TAGS = {"latest", "pending", "safe", "finalized", "earliest"}
+# 链头附近的区块可能被重组，按高度缓存的区块至少要比已知的链头低CONFIRMATIONS个块
+CONFIRMATIONS = 6
+
+rpc_cache_requests = metrics_registry.counter("dashboard_rpc_cache_requests_total",
+                                              "JSON-RPC calls by how they were served "
+                                              "(hit: cache, coalesced: shared an in-flight call, miss: sent).",
+                                              ["method", "result"])
+
+
+# 正在进行的一次请求，相同的请求等待它的结果
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+# 节点JSON-RPC访问层：所有请求共用一个keep-alive连接池，超时可配置
+# 相同的请求（方法和参数都相同）同时只发一次，其余的等待并共享结果（single-flight）
+# 随链头变化的结果（区块高度、节点列表、latest区块等）缓存head_ttl秒，按高度或哈希取的区块不会再变，放进LRU缓存
+class RpcClient:
+    def __init__(self, endpoint_uri, timeout=(3, 10), pool_size=16, head_ttl=0.5, block_cache_size=1024,
+                 confirmations=CONFIRMATIONS):
+        self.endpoint_uri = endpoint_uri
+        self.timeout = timeout
+        self.head_ttl = head_ttl
+        self.block_cache_size = block_cache_size
+        self.confirmations = confirmations
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.flights = {}
+        # 请求键 -> (过期时刻, 响应)
+        self.head_cache = {}
+        # 请求键 -> 响应，按LRU淘汰
+        self.blocks = OrderedDict()
+        # 最近一次eth_blockNumber得到的高度
+        self.head = None
+
+    def _post(self, payload, label):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with phase("rpc"):
+                response = self.session.post(self.endpoint_uri, data=json.dumps(payload, cls=Web3JsonEncoder),
+                                             headers={"Content-Type": "application/json"}, timeout=self.timeout)
+            response.raise_for_status()
+            res = response.json()
+            outcome = "error" if isinstance(res, dict) and "error" in res else "ok"
+            return res
+        finally:
+            observe_rpc(label, time.perf_counter() - start, outcome)
+
+    # 请求的缓存方式：head（短时缓存）、block（LRU缓存）或None（不缓存）
+    def _policy(self, method, params):
+        if method in HEAD_METHODS:
+            return "head"
+        if method in BLOCK_BY_HASH_METHODS:
+            return "block"
+        if method in BLOCK_BY_NUMBER_METHODS and params:
+            return "head" if params[0] in BLOCK_TAGS else "block"
+        return None
+
+    def _lookup(self, key, policy):
+        with self.lock:
+            if policy == "head":
+                entry = self.head_cache.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+            elif policy == "block":
+                response = self.blocks.get(key)
+                if response is not None:
+                    self.blocks.move_to_end(key)
+                    return response
+        return None
+
+    def _store(self, key, method, params, policy, response):
+        if "error" in response or response.get("result") is None:
+            return
+        with self.lock:
+            if method == "eth_blockNumber":
+                self.head = int(response["result"], 16)
+            if policy == "head":
+                self.head_cache[key] = (time.monotonic() + self.head_ttl, response)
+            elif policy == "block":
+                # 按高度取的区块离链头太近（或还不知道链头）时不缓存
+                if method in BLOCK_BY_NUMBER_METHODS and \
+                        (self.head is None or int(params[0], 16) + self.confirmations > self.head):
+                    return
+                self.blocks[key] = response
+                while len(self.blocks) > self.block_cache_size:
+                    self.blocks.popitem(last=False)
+
+    # 发送一个JSON-RPC请求，返回完整的响应（包含result或error），调用方不要修改返回的响应
+    # cache=False时既不读缓存也不写缓存（仍与相同的请求合并）：用于校验链是否重组、是否换链等必须取到最新结果的请求，
+    # 按高度缓存的区块假定CONFIRMATIONS个块以下不会再变，重组更深或链被重置时缓存中的结果已经过时
+    def request(self, method, params=None, cache=True):
+        params = list(params or [])
+        key = (method, json.dumps(params, cls=Web3JsonEncoder, sort_keys=True))
+        policy = self._policy(method, params) if cache else None
+        response = self._lookup(key, policy)
+        if response is not None:
+            rpc_cache_requests.inc(method, "hit")
+            return response
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.flights[key] = flight
+        if not leader:
+            rpc_cache_requests.inc(method, "coalesced")
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        rpc_cache_requests.inc(method, "miss")
+        try:
+            flight.response = self._post({"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": params},
+                                         method)
+            self._store(key, method, params, policy, flight.response)
+            return flight.response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+
+    # 发送一个请求，返回result，节点返回错误时抛出异常
+    def call(self, method, params=None, cache=True):
+        response = self.request(method, params, cache)
+        if "error" in response:
+            raise Exception("json-rpc error: " + str(response["error"]))
+        return response["result"]
+
+    # 发送一次批量JSON-RPC请求（同一方法、不同参数），按请求顺序返回结果，不经过缓存
+    def batch(self, method, params_list):
+        payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+                   for i, params in enumerate(params_list)]
+        results = sorted(self._post(payload, "batch:" + method), key=lambda x: x["id"])
+        for item in results:
+            if "error" in item:
+                raise Exception("json-rpc error: " + str(item["error"]))
+        return [item["result"] for item in results]
+
+    def clear(self):
+        with self.lock:
+            self.head_cache = {}
+            self.blocks = OrderedDict()
+            self.head = None
+
+
+# 经由RpcClient发送请求的web3 provider，Web3对结果的格式化（AttributeDict、HexBytes等）保持不变
+# 不使用HTTPProvider自带的重试：请求在超时内失败即返回，由前端的下一次轮询重试，合并等待的请求也不会被拖住
+class PooledHTTPProvider(HTTPProvider):
+    _middlewares = ()
+
+    def __init__(self, rpc):
+        super().__init__(rpc.endpoint_uri)
+        self.rpc = rpc
+
+    def make_request(self, method, params):
+        return self.rpc.request(method, params)
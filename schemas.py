@@ -0,0 +1,99 @@
+# coding=utf-8
+import numpy as np
+
+# 列类型及其在内存中的dtype：
+# time 时间文本，列式缓存中另存了int64纳秒时间戳，按"ns"读取时直接得到时间戳
+# hash 十六进制的哈希、地址、节点ID，每行都不同，按字符串读取
+# cat 取值很少的字符串或标志（消息类型、进出标志、交易来源），按category读取
+# int32/int64 整数，int32放不下时保持int64
+# duration Go的duration文本（如"3.28ms"），按字符串读取，需要数值时用timeutil.parse_duration换算
+KIND_DTYPES = {"time": None, "hash": None, "cat": "category", "int32": np.int32, "int64": np.int64,
+               "duration": None}
+
+
+# 一种记录文件的列定义，columns为按文件中顺序排列的(列名, 列类型)
+class RecordSchema:
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = columns
+        self.names = [name for name, _ in columns]
+        self.kinds = dict(columns)
+
+    # 校验文件表头、需要时按位置添加列名，返回与文件表头按位置对应的列名
+    # metric为报错和提示信息中的指标名
+    def resolve(self, header, metric, check_column_name=True, add_column_name=False):
+        names = list(header)
+        # 如果检查数据来源的列名
+        if check_column_name:
+            if len(names) != len(self.names):
+                raise Exception(metric + " check column name fail! unmatched column count")
+            for i in range(len(self.names)):
+                if names[i] != self.names[i]:
+                    raise Exception(metric + " check column name fail! column:" + str(i) + " unmatched")
+            print(metric + " check_column_name finish!")
+        # 如果需要添加列名
+        if add_column_name:
+            if len(names) != len(self.names):
+                raise Exception(metric + " add_column_name fail! column count unmatched")
+            names = list(self.names)
+            print(metric + " add_column_name finish!")
+        return names
+
+    # 读取columns列时使用的dtype，ns中的时间列读成int64纳秒时间戳
+    def dtypes(self, columns=None, ns=()):
+        res = {}
+        for name in self.names if columns is None else columns:
+            # 不在列定义中的列（不检查列名时文件表头可能不同）保持原样
+            if name not in self.kinds:
+                continue
+            dtype = "ns" if name in ns else KIND_DTYPES[self.kinds[name]]
+            if dtype is not None:
+                res[name] = dtype
+        return res
+
+
+# 各记录文件的列定义，与recorder写出的表头一致
+SCHEMAS = {schema.filename: schema for schema in [
+    RecordSchema("transaction_pool_input_throughput.csv",
+                 [("measure_time", "time"), ("tx_id", "hash"), ("source", "cat")]),
+    RecordSchema("net_p2p_transmission_latency.csv",
+                 [("measure_time", "time"), ("peer_id", "hash"), ("peer1_deliver_time", "time"),
+                  ("peer2_receive_time", "time"), ("peer2_deliver_time", "time"), ("peer1_receive_time", "time")]),
+    RecordSchema("peer_message_throughput.csv",
+                 [("measure_time", "time"), ("message_type", "cat"), ("message_size", "int32")]),
+    RecordSchema("db_state_write_rate.csv",
+                 [("measure_time", "time"), ("block_height", "int32"), ("block_hash", "hash"),
+                  ("write_duration", "duration")]),
+    RecordSchema("db_state_read_rate.csv",
+                 [("measure_time", "time"), ("block_hash", "hash"), ("read_duration", "duration")]),
+    RecordSchema("tx_queue_delay.csv",
+                 [("measure_time", "time"), ("tx_hash", "hash"), ("in/outFlag", "cat")]),
+    RecordSchema("block_commit_duration_start.csv",
+                 [("measure_time", "time"), ("block_height", "int32")]),
+    RecordSchema("block_commit_duration_end.csv",
+                 [("measure_time", "time"), ("block_height", "int32"), ("block_hash", "hash"),
+                  ("block_tx_count", "int32"), ("block_txsroot", "hash")]),
+    RecordSchema("tx_in_block_tps.csv",
+                 [("measure_time", "time"), ("block_height", "int32"), ("block_tx_count", "int32"),
+                  ("block_txsroot", "hash")]),
+    RecordSchema("block_validation_efficiency.csv",
+                 [("block_height", "int32"), ("start_time", "time"), ("end_time", "time"),
+                  ("block_tx_count", "int32")]),
+    RecordSchema("block_validation_efficiency_start.csv",
+                 [("measure_time", "time"), ("block_hash", "hash"), ("block_validation_duration", "duration")]),
+    RecordSchema("block_validation_efficiency_end.csv",
+                 [("measure_time", "time"), ("block_hash", "hash"), ("block_tx_count", "int32"),
+                  ("block_height", "int32")]),
+    RecordSchema("tx_delay_start.csv",
+                 [("measure_time", "time"), ("tx_hash", "hash")]),
+    RecordSchema("tx_delay_end.csv",
+                 [("measure_time", "time"), ("block_height", "int32"), ("tx_hash", "hash")]),
+    RecordSchema("consensus_clique_cost.csv",
+                 [("block_height", "int32"), ("clique_start", "time"), ("clique_end", "time"),
+                  ("cost_time", "duration")]),
+    RecordSchema("contract_time.csv",
+                 [("tx_hash", "hash"), ("contract_addr", "hash"), ("start_time", "time"), ("exec_time", "duration")]),
+    RecordSchema("block_tx_conflict_rate.csv",
+                 [("measure_time", "time"), ("conflict_count", "int32"), ("block_height", "int32"),
+                  ("block_tx_count", "int32")]),
+]}
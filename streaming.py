@@ -0,0 +1,275 @@
+# coding=utf-8
+import os
+import pickle
+import re
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import columnar_cache, decode_text, encode_text
+from time_buckets import bucket_aggregate
+
+# 一行数据读出后在计算过程中的内存放大倍数（切片、中间列和分组结果）
+CHUNK_OVERHEAD = 4
+MEMORY_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+# 断点中部分聚合状态的格式版本，状态格式变化时旧断点作废
+CHECKPOINT_VERSION = 2
+
+
+# 解析内存预算，如"512M"、"2G"、"1048576"，单位不区分大小写
+def parse_memory_budget(text):
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError("invalid memory budget: " + str(text))
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()])
+
+
+# 刷新记录文件的列式缓存；有内存预算时源文件也按块解析
+def open_records(path, memory_budget=None):
+    block_bytes = None if memory_budget is None else max(1 << 20, memory_budget // (2 * CHUNK_OVERHEAD))
+    return columnar_cache.refresh(path, block_bytes)
+
+
+# 按内存预算确定每块的行数，没有预算时整个文件作为一块
+def chunk_rows(store, columns, memory_budget=None, rows=None):
+    rows = store.rows if rows is None else rows
+    if memory_budget is None:
+        return max(rows, 1)
+    return max(1, int(memory_budget // (store.row_bytes(columns) * CHUNK_OVERHEAD)))
+
+
+# 读取记录文件[start, stop)行中的columns列，names为添加列名后的列名（与文件表头按位置对应），
+# dtypes为各列（按names中的列名）读出后的类型，见RecordSchema.dtypes
+def read_columns(store, columns, names=None, start=0, stop=None, dtypes=None):
+    header = store.header
+    names = header if names is None else names
+    source_columns = [header[names.index(name)] for name in columns]
+    dtypes = {source: dtypes[name] for source, name in zip(source_columns, columns) if name in (dtypes or {})}
+    df = store.read(source_columns, start, stop, dtypes)
+    df.columns = columns
+    return df
+
+
+# 分块读取记录文件，逐块返回(起始行号, DataFrame)
+# limit为最多读取的行数，start为开始读取的行号（从断点继续时跳过已经处理过的行）
+def iter_chunks(store, columns, names=None, memory_budget=None, limit=None, start=0, dtypes=None):
+    header = store.header
+    names = header if names is None else names
+    source_columns = [header[names.index(name)] for name in columns]
+    rows = store.rows if limit is None else min(limit, store.rows)
+    step = chunk_rows(store, source_columns, memory_budget, rows - start)
+    for first in range(start, rows, step):
+        yield first, read_columns(store, columns, names, first, min(first + step, rows), dtypes)
+
+
+# 时间桶部分聚合：每块用bucket_aggregate算出计数和求和，各块按桶起点相加
+# 合并与分块方式无关，最后补齐首尾之间的空桶并重新计算均值
+class BucketPartial:
+    def __init__(self, bucket_seconds=1):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = None
+
+    def add(self, times_ns, values=None, categories=None):
+        self.merge(bucket_aggregate(times_ns, values, categories, bucket_seconds=self.bucket_seconds))
+
+    def merge(self, part):
+        part = part.drop(columns="mean")
+        if self.buckets is None or len(self.buckets) == 0:
+            self.buckets = part
+            return
+        if len(part) == 0:
+            return
+        index = self.buckets.index.union(part.index)
+        columns = self._columns(set(self.buckets.columns) | set(part.columns))
+        self.buckets = self.buckets.reindex(index=index, columns=columns, fill_value=0) + \
+            part.reindex(index=index, columns=columns, fill_value=0)
+
+    # 列顺序与bucket_aggregate一致：count、sum，然后按类别排序的count_<类别>、sum_<类别>
+    @staticmethod
+    def _columns(names):
+        categories = sorted(name[6:] for name in names if name.startswith("count_"))
+        res = ["count", "sum"]
+        for category in categories:
+            res += ["count_" + category, "sum_" + category]
+        return res
+
+    def result(self):
+        width = int(round(self.bucket_seconds * 1e9))
+        buckets = self.buckets
+        if buckets is None:
+            return bucket_aggregate(np.array([], dtype=np.int64), bucket_seconds=self.bucket_seconds)
+        if len(buckets):
+            index = pd.Index(np.arange(buckets.index.min(), buckets.index.max() + width, width), name="bucket")
+            buckets = buckets.reindex(index=index, fill_value=0)
+        res = buckets[["count", "sum"]].copy()
+        counts = res["count"].to_numpy()
+        res["mean"] = np.divide(res["sum"].to_numpy(dtype=np.float64), counts, out=np.zeros(len(res)),
+                                where=counts > 0)
+        for column in buckets.columns[2:]:
+            res[column] = buckets[column]
+        return res
+
+
+# 按键求均值的部分聚合：按键排好序的整数求和与计数，每块的分组结果按二分查找并入，最后统一算均值
+# 整数求和与相加顺序无关，所以分块计算与整体计算的结果完全相同
+class MeanPartial:
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.keys = np.array([], dtype="S1")
+        self.sums = np.array([], dtype=np.int64)
+        self.counts = np.array([], dtype=np.int64)
+        # 结果文件中每行结尾的字节偏移，dirty之后的行在上次写入后有变化
+        self.line_ends = np.array([], dtype=np.int64)
+        self.file_size = None
+        self.dirty = 0
+
+    def add(self, keys, values):
+        part = pd.DataFrame({"sum": np.asarray(values, dtype=np.int64), "count": 1}, index=pd.Index(keys))
+        part = part.groupby(level=0).sum()
+        if len(part) == 0:
+            return
+        # 键存成utf-8定长字节串，字节序与字符串的排序一致
+        part_keys = encode_text(part.index)
+        if part_keys.dtype.itemsize > self.keys.dtype.itemsize:
+            self.keys = self.keys.astype(part_keys.dtype)
+        pos = np.searchsorted(self.keys, part_keys)
+        hit = pos < len(self.keys)
+        hit[hit] = self.keys[pos[hit]] == part_keys[hit]
+        self.sums[pos[hit]] += part["sum"].to_numpy()[hit]
+        self.counts[pos[hit]] += part["count"].to_numpy()[hit]
+        self.keys = np.insert(self.keys, pos[~hit], part_keys[~hit])
+        self.sums = np.insert(self.sums, pos[~hit], part["sum"].to_numpy()[~hit])
+        self.counts = np.insert(self.counts, pos[~hit], part["count"].to_numpy()[~hit])
+        self.dirty = min(self.dirty, int(pos.min()))
+
+    # 返回按键排序的均值，列名为name
+    def result(self, name):
+        res = pd.DataFrame(index=pd.Index(decode_text(self.keys), name="measure_time"))
+        res[name] = self.sums / self.scale / self.counts
+        return res
+
+    # 写入结果文件（measure_time,name两列）：文件还是上次写入的样子时，只从第一处变化的行开始重写
+    def write_csv(self, path, name):
+        start = self.dirty
+        if self.file_size is None or not os.path.exists(path) or os.path.getsize(path) != self.file_size:
+            start = 0
+        offset = int(self.line_ends[start - 1]) if start else 0
+        res = self.result(name).iloc[start:]
+        data = res.to_csv(header=start == 0, index_label="measure_time").encode("utf-8")
+        with open(path, "r+b" if start else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            f.write(data)
+        ends = offset + np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n")) + 1
+        # 表头行不计入数据行
+        self.line_ends = np.concatenate([self.line_ends[:start], ends[1:] if start == 0 else ends])
+        self.file_size = offset + len(data)
+        self.dirty = len(self.keys)
+
+
+# 每个元素是所在分组（相同编码）中的第几次出现，从0开始，按原顺序计数
+def _occurrence(codes):
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_first = np.repeat(firsts, np.diff(np.r_[firsts, len(codes)]))
+    res = np.empty(len(codes), dtype=np.int64)
+    res[order] = np.arange(len(codes)) - group_first
+    return res
+
+
+# 开始/结束事件配对的部分状态：同一键的第n个开始事件与第n个结束事件配对
+# 只保留还没有配上的事件，跨块到达的开始和结束事件在后续块中继续配对
+class PairingPartial:
+    def __init__(self, key="tx_hash"):
+        self.key = key
+        self.starts = None
+        self.ends = None
+
+    @staticmethod
+    def _pending(pending, events):
+        if pending is None or len(pending) == 0:
+            return events.reset_index(drop=True)
+        return pd.concat([pending, events], ignore_index=True)
+
+    # 加入新到达的开始事件和结束事件（按各自文件顺序），返回本次配上的事件对，列名带_start/_end后缀
+    def add(self, starts, ends):
+        starts = self._pending(self.starts, starts)
+        ends = self._pending(self.ends, ends)
+        # 键统一编码成整数，(键, 第n次出现)拼成一个int64再按它查找另一侧
+        codes, _ = pd.factorize(np.concatenate([starts[self.key].to_numpy(dtype=object),
+                                                ends[self.key].to_numpy(dtype=object)]))
+        codes = codes.astype(np.int64) << 32
+        start_ids = codes[:len(starts)] + _occurrence(codes[:len(starts)])
+        end_ids = codes[len(starts):] + _occurrence(codes[len(starts):])
+        matches = pd.Index(end_ids).get_indexer(start_ids)
+        matched = matches >= 0
+        pairs = pd.concat([starts[matched].reset_index(drop=True).add_suffix("_start"),
+                           ends.iloc[matches[matched]].reset_index(drop=True).add_suffix("_end")], axis=1)
+        pairs[self.key] = pairs.pop(self.key + "_start")
+        del pairs[self.key + "_end"]
+        end_matched = np.zeros(len(ends), dtype=bool)
+        end_matched[matches[matched]] = True
+        self.starts = starts[~matched]
+        self.ends = ends[~end_matched]
+        return pairs
+
+    # 还没有配上的事件数
+    def unmatched(self):
+        return sum(0 if events is None else len(events) for events in (self.starts, self.ends))
+
+
+# 指标的断点：各输入文件处理到的行数和字节偏移，以及部分聚合状态（时间桶、未配对事件等）
+# 记录文件只是追加了新行时从断点继续，只处理新追加的部分；文件被替换、截断、列类型升级，
+# 或计算参数变化时断点作废，从头计算。断点文件放在结果目录的.checkpoints下
+class Checkpoint:
+    def __init__(self, output_path, name, stores, params, limit=None, enabled=True):
+        self.path = os.path.join(output_path, ".checkpoints", name + ".pkl")
+        self.stores = stores
+        self.params = [params, limit, CHECKPOINT_VERSION]
+        self.limit = limit
+        self.enabled = enabled
+        # 每个输入文件开始读取的行号
+        self.starts = [0] * len(stores)
+
+    def _sources(self):
+        res = []
+        for store in self.stores:
+            m = store.manifest or {}
+            rows = store.rows if self.limit is None else min(self.limit, store.rows)
+            res.append({"source": store.source, "inode": m.get("inode"), "generation": store.generation,
+                        "header": m.get("header_line"), "rows": rows, "offset": m.get("offset")})
+        return res
+
+    # 断点有效时返回保存的状态并设置starts，否则返回None
+    # outputs为增量追加写入的结果文件，它们的大小必须与保存断点时一致
+    def load(self, outputs=()):
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except Exception:
+            return None
+        if saved.get("params") != self.params or len(saved.get("sources", [])) != len(self.stores):
+            return None
+        for old, new in zip(saved["sources"], self._sources()):
+            same = all(old[key] == new[key] for key in ("source", "inode", "generation", "header"))
+            if not same or old["rows"] > new["rows"]:
+                return None
+        for path, size in saved.get("outputs", {}).items():
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                return None
+        self.starts = [old["rows"] for old in saved["sources"]]
+        return saved["state"]
+
+    def save(self, state, outputs=()):
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        saved = {"params": self.params, "sources": self._sources(), "state": state,
+                 "outputs": {path: os.path.getsize(path) for path in outputs}}
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
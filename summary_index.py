@@ -0,0 +1,271 @@
+# coding=utf-8
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from csv_cache import csv_tail_cache
+
+
+# 截短过长的哈希值
+def shorten_id(node_id):
+    return "0x" + node_id[:8] + "..."
+
+
+def shorten_ids(ids):
+    return "0x" + np.asarray(ids, dtype=object).astype("U8").astype(object) + "..."
+
+
+# 各来源文件都处理完后，还缺字段、没有成行的键最多保留多少个，超过时丢掉最早出现的（例如一直没有落库的交易）
+MAX_PARTIAL = 1 << 17
+
+
+# 只追加的键索引：键到行号的查找表，分成若干段，每段是一个pd.Index（哈希表建好后一直可用）
+# 追加的新段不小于前一段时与前一段合并，段数保持在O(log n)，每次追加不用重建整个索引
+class KeyIndex:
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # 返回各键的行号，不存在的为-1
+    def get_indexer(self, keys):
+        res = np.full(len(keys), -1, dtype=np.int64)
+        for offset, index in self.chunks:
+            found = index.get_indexer(keys)
+            hit = found >= 0
+            res[hit] = found[hit] + offset
+        return res
+
+    def append(self, keys):
+        index = pd.Index(keys, dtype=object)
+        offset = self.size
+        self.size += len(index)
+        while self.chunks and len(self.chunks[-1][1]) <= len(index):
+            offset, last = self.chunks.pop()
+            index = last.append(index)
+        self.chunks.append((offset, index))
+
+
+# 按键物化的汇总表：各来源文件的字段按键拼到一起，字段齐全的键追加为表中一行
+# 已经成行的键再次出现时原地更新（与原先合并后保留最后一条一致），分页时只取需要的切片
+# 同一个键的每个字段取最后一次出现的值；行按order_field第一次出现的位置排序（与原先按首个来源文件合并的顺序一致），
+# 这样表的内容与记录文件每次追加多少行无关，增量更新和从头重建得到同一张表
+class SummaryTable:
+    def __init__(self, columns, fields, order_field=None, max_partial=MAX_PARTIAL):
+        self.columns = columns
+        self.fields = fields
+        self.order_field = fields[0] if order_field is None else order_field
+        self.max_partial = max_partial
+        self.clear()
+
+    def clear(self):
+        self.keys = KeyIndex()
+        self.data = {field: np.empty(0, dtype=object) for field in self.fields}
+        # 各行的排序位置；sorted为各行是否已按排序位置存放，否则分页时按perm取行
+        self.rank = np.empty(0, dtype=np.int64)
+        self.sorted = True
+        self.perm = None
+        # 还没有成行的键，按第一次出现的先后排列；present为各字段是否已有值，rank为排序位置（还没有时为-1）
+        self.partial_keys = pd.Index([], dtype=object)
+        self.partial_values = {field: np.empty(0, dtype=object) for field in self.fields}
+        self.partial_present = {field: np.zeros(0, dtype=bool) for field in self.fields}
+        self.partial_rank = np.empty(0, dtype=np.int64)
+        # 没有给出order时，记录按update的调用顺序依次编号
+        self.seen = 0
+        self.evicted = 0
+
+    # keys为一批记录的键，values为字段名到该字段取值（与keys等长）的映射
+    # present为字段名到布尔数组的映射，给出每条记录是否带有该字段，没有给出的字段每条记录都带有
+    # order为各条记录的排序位置（如在来源文件中的行号），只用到带有order_field的记录
+    def update(self, keys, values, present=None, order=None):
+        keys = np.asarray(keys, dtype=object)
+        if order is None:
+            order = np.arange(self.seen, self.seen + len(keys), dtype=np.int64)
+            self.seen += len(keys)
+        order = np.asarray(order, dtype=np.int64)
+        values = {field: np.asarray(value, dtype=object) for field, value in values.items()}
+        present = present or {}
+        masks = {field: np.asarray(present.get(field, np.ones(len(keys), dtype=bool)), dtype=bool)
+                 for field in values}
+        # 不带任何字段的记录不影响汇总表
+        rows = np.flatnonzero(np.logical_or.reduce(list(masks.values()))) if masks else np.zeros(0, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        codes, uniques = pd.factorize(keys[rows])
+        uniques = np.asarray(uniques, dtype=object)
+        # 每个键每个字段在这一批中第一次和最后一次出现的行，没有出现为-1
+        first, last = {}, {}
+        for field, mask in masks.items():
+            hit = mask[rows]
+            first[field] = np.full(len(uniques), len(keys), dtype=np.int64)
+            np.minimum.at(first[field], codes[hit], rows[hit])
+            first[field][first[field] == len(keys)] = -1
+            last[field] = np.full(len(uniques), -1, dtype=np.int64)
+            np.maximum.at(last[field], codes[hit], rows[hit])
+
+        # 已经成行的键原地更新
+        pos = self.keys.get_indexer(uniques)
+        done = pos >= 0
+        for field in values:
+            sel = done & (last[field] >= 0)
+            self.data[field][pos[sel]] = values[field][last[field][sel]]
+
+        # 其余的键并入还缺字段的记录
+        pending = ~done
+        keys_new = uniques[pending]
+        old = self.partial_keys.get_indexer(keys_new)
+        is_old = old >= 0
+        fresh = keys_new[~is_old]
+        count = len(self.partial_keys)
+        merged_keys = self.partial_keys.append(pd.Index(fresh, dtype=object))
+        slot = np.empty(len(keys_new), dtype=np.int64)
+        slot[is_old] = old[is_old]
+        slot[~is_old] = np.arange(count, count + len(fresh))
+        total = len(merged_keys)
+        merged_rank = np.full(total, -1, dtype=np.int64)
+        merged_rank[:count] = self.partial_rank
+        if self.order_field in values:
+            # 排序位置取order_field第一次出现的记录，之前已经出现过的不变
+            sel = (first[self.order_field][pending] >= 0) & (merged_rank[slot] < 0)
+            merged_rank[slot[sel]] = order[first[self.order_field][pending][sel]]
+        merged_values, merged_present = {}, {}
+        for field in self.fields:
+            field_values = np.empty(total, dtype=object)
+            field_values[:count] = self.partial_values[field]
+            field_present = np.zeros(total, dtype=bool)
+            field_present[:count] = self.partial_present[field]
+            if field in values:
+                sel = last[field][pending] >= 0
+                field_values[slot[sel]] = values[field][last[field][pending][sel]]
+                field_present[slot[sel]] = True
+            merged_values[field] = field_values
+            merged_present[field] = field_present
+        complete = np.logical_and.reduce([merged_present[field] for field in self.fields])
+        ready = np.flatnonzero(complete)
+        ready = ready[np.argsort(merged_rank[ready], kind="stable")]
+        if len(ready):
+            # 新成行的键排在已有的行之前时（键的其它字段来得晚），分页时再按排序位置重排
+            if len(self.rank) and merged_rank[ready[0]] < self.rank[-1]:
+                self.sorted = False
+            self.perm = None
+            self.keys.append(merged_keys[ready])
+            self.rank = np.concatenate([self.rank, merged_rank[ready]])
+            for field in self.fields:
+                self.data[field] = np.concatenate([self.data[field], merged_values[field][ready]])
+
+        keep = np.flatnonzero(~complete)
+        self.partial_keys = merged_keys[keep]
+        self.partial_values = {field: merged_values[field][keep] for field in self.fields}
+        self.partial_present = {field: merged_present[field][keep] for field in self.fields}
+        self.partial_rank = merged_rank[keep]
+
+    # 所有来源文件都处理完后调用：仍缺字段的键超过max_partial个时丢掉最早出现的
+    def evict(self):
+        extra = len(self.partial_keys) - self.max_partial
+        if extra <= 0:
+            return
+        self.evicted += extra
+        self.partial_keys = self.partial_keys[extra:]
+        self.partial_values = {field: values[extra:] for field, values in self.partial_values.items()}
+        self.partial_present = {field: present[extra:] for field, present in self.partial_present.items()}
+        self.partial_rank = self.partial_rank[extra:]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def page(self, start, stop):
+        rows = range(len(self))[start:stop]
+        if self.sorted:
+            rows = slice(rows.start, rows.stop)
+        else:
+            if self.perm is None:
+                self.perm = np.argsort(self.rank, kind="stable")
+            rows = self.perm[rows.start:rows.stop]
+        return pd.DataFrame({column: self.data[field][rows] for column, field in zip(self.columns, self.fields)},
+                            columns=self.columns).infer_objects()
+
+
+# 首页区块/交易汇总表，随记录文件增长增量更新
+# 每个来源文件记住已经消费到第几行，每次只处理新追加的行
+class SummaryIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 区块按打包记录、交易按进入交易池的记录在文件中的先后排列
+        self.blocks = SummaryTable(['块高', '区块哈希', '交易数量', '打包时刻', '开始验证时刻', '结束验证时刻', '落库时刻'],
+                                   ['block_height', 'block_hash', 'block_tx_count', 'commit_start', 'valid_start',
+                                    'valid_end', 'commit_end'], order_field='commit_start')
+        self.txs = SummaryTable(['交易哈希', '进入交易池时刻', '离开交易池时刻', '落库块高'],
+                                ['tx_hash', 'in_time', 'out_time', 'block_height'], order_field='in_time')
+        self.sources = {
+            'block_commit_duration_start.csv': self._add_commit_start,
+            'block_commit_duration_end.csv': self._add_commit_end,
+            'block_validation_efficiency.csv': self._add_validation,
+            'tx_queue_delay.csv': self._add_tx_queue,
+            'tx_delay_end.csv': self._add_tx_block,
+        }
+        self.clear()
+
+    def clear(self):
+        self.consumed = {}
+        self.blocks.clear()
+        self.txs.clear()
+
+    def _add_commit_start(self, df):
+        self.blocks.update(df['block_height'], {'block_height': df['block_height'], 'commit_start': df['measure_time']},
+                           order=df.index)
+
+    def _add_commit_end(self, df):
+        self.blocks.update(df['block_height'], {'commit_end': df['measure_time'],
+                                                'block_hash': shorten_ids(df['block_hash'])})
+
+    def _add_validation(self, df):
+        df = df.dropna(subset=['start_time', 'end_time', 'block_tx_count'])
+        self.blocks.update(df['block_height'], {'valid_start': df['start_time'], 'valid_end': df['end_time'],
+                                                'block_tx_count': df['block_tx_count']})
+
+    def _add_tx_queue(self, df):
+        flag = df['in/outFlag']
+        is_in = (flag == 'in').to_numpy()
+        is_out = (flag == 'out').to_numpy()
+        self.txs.update(df['tx_hash'], {'tx_hash': shorten_ids(df['tx_hash']), 'in_time': df['measure_time'],
+                                        'out_time': df['measure_time']},
+                        {'tx_hash': is_in, 'in_time': is_in, 'out_time': is_out}, order=df.index)
+
+    def _add_tx_block(self, df):
+        self.txs.update(df['tx_hash'], {'block_height': df['block_height']})
+
+    # 把各来源文件新追加的行并入汇总表；任一文件被截断或替换时整体重建
+    # 读取器返回的DataFrame的行标签就是记录在文件中的行号，用作排序位置
+    def refresh(self, dirpath):
+        updates = []
+        for filename, add in self.sources.items():
+            path = os.path.join(dirpath, filename)
+            if not os.path.exists(path):
+                continue
+            loader = csv_tail_cache.get_loader(path)
+            df = loader.load()
+            generation, done = self.consumed.get(filename, (loader.generation, 0))
+            if generation != loader.generation or len(df) < done:
+                self.clear()
+                return self.refresh(dirpath)
+            updates.append((filename, add, loader.generation, df, done))
+        for filename, add, generation, df, done in updates:
+            if len(df) > done:
+                add(df.iloc[done:])
+            self.consumed[filename] = (generation, len(df))
+        self.blocks.evict()
+        self.txs.evict()
+
+    # 返回(当前页数据, 总行数)，table为'blocks'或'txs'
+    def page(self, dirpath, table, start, stop):
+        with self.lock:
+            self.refresh(dirpath)
+            table = getattr(self, table)
+            return table.page(start, stop), len(table)
+
+
+summary_index = SummaryIndex()
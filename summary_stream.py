@@ -0,0 +1,79 @@
+# coding=utf-8
+import json
+import queue
+import threading
+import time
+
+
+# 首页计数器推送：一个后台线程按固定间隔计算一次计数器，广播给所有订阅者
+# 只推送发生变化的字段；没有订阅者时后台线程自动退出，下次有人订阅再启动
+class SummaryBroadcaster:
+    def __init__(self, compute, interval=0.5, keepalive=15, queue_size=16):
+        self.compute = compute
+        self.interval = interval
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.last = {}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            if self.thread is None:
+                # 后台线程退出期间的快照已经过时，重新启动时清空，第一轮计算后推送完整的新值
+                self.last = {}
+                self.thread = threading.Thread(target=self._run, name="summary-broadcaster", daemon=True)
+                self.thread.start()
+            # 新订阅者先收到一份完整快照
+            if self.last:
+                q.put_nowait(dict(self.last))
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, values):
+        with self.lock:
+            changed = {key: value for key, value in values.items() if self.last.get(key) != value}
+            if not changed:
+                return
+            self.last.update(changed)
+            for q in self.subscribers:
+                try:
+                    q.put_nowait(changed)
+                except queue.Full:
+                    # 客户端读得太慢：丢掉积压的增量，改发一份完整快照
+                    while not q.empty():
+                        q.get_nowait()
+                    q.put_nowait(dict(self.last))
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+            started = time.monotonic()
+            try:
+                self.publish(self.compute())
+            except Exception as e:
+                print("summary broadcaster:", e)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    # 生成text/event-stream响应体，客户端断开时取消订阅
+    def stream(self):
+        q = self.subscribe()
+        try:
+            while True:
+                try:
+                    values = q.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "data: %s\n\n" % json.dumps(values)
+        finally:
+            self.unsubscribe(q)
@@ -0,0 +1,84 @@
+# coding=utf-8
+import numpy as np
+import pytest
+
+from cdf_engine import GAMMA, CdfHistogram, CdfRegistry
+
+
+def random_values(seed, n=50000):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.lognormal(0, 1.5, n), np.zeros(n // 50), rng.uniform(10, 20, n // 5)])
+    rng.shuffle(values)
+    return values
+
+
+# 细网格一格内按均匀分布插值，与经验CDF的差不超过x附近两格内的样本占比（x输出时保留6位有效数字）
+def assert_matches_empirical(points, values):
+    values = np.sort(values[values >= 0])
+    for x, y in zip(points["x"], points["y"]):
+        empirical = np.searchsorted(values, x, side="right") / len(values) * 100
+        near = (np.searchsorted(values, x * GAMMA ** 2, side="right") -
+                np.searchsorted(values, x / GAMMA ** 2, side="left")) / len(values) * 100
+        assert abs(y - empirical) <= near + 1e-3, (x, y, empirical)
+
+
+@pytest.mark.parametrize("scale", ["log", "linear"])
+def test_cdf_matches_empirical(scale):
+    values = random_values(1)
+    histogram = CdfHistogram()
+    histogram.update(values)
+    points = histogram.points(bins=80, scale=scale)
+    assert points["count"] == len(values)
+    assert points["y"][-1] == 100.0
+    assert points["x"][-1] == float("%.6g" % values.max())
+    assert np.all(np.diff(points["y"]) >= 0)
+    assert_matches_empirical(points, values)
+
+
+# 等分位数分段：各端点处的经验CDF接近等分的百分比
+def test_quantile_scale():
+    values = random_values(2)
+    histogram = CdfHistogram()
+    histogram.update(values)
+    points = histogram.points(bins=20, scale="quantile")
+    assert points["y"] == [round(float(v), 4) for v in np.linspace(0, 100, 21)]
+    assert points["x"][0] == 0.0 and points["x"][-1] == float("%.6g" % values.max())
+    assert_matches_empirical(points, values)
+
+
+# 取值序列只在尾部追加时增量统计，与一次统计全部取值相同；序列被改写时重新统计
+def test_incremental_update():
+    values = random_values(3)
+    whole = CdfHistogram()
+    whole.update(values)
+    histogram = CdfHistogram()
+    for stop in [0, 10, 1000, 30000, len(values)]:
+        histogram.update(values[:stop])
+    np.testing.assert_array_equal(histogram.counts, whole.counts)
+    assert histogram.points() == whole.points()
+    changed = values.copy()
+    changed[5] += 1
+    histogram.update(changed)
+    whole = CdfHistogram()
+    whole.update(changed)
+    assert histogram.points(scale="quantile") == whole.points(scale="quantile")
+    histogram.update(values[:100])
+    assert histogram.total() == 100
+
+
+def test_negative_and_missing_values_ignored():
+    histogram = CdfHistogram()
+    histogram.update(np.array([-1.0, np.nan, 0.0, 1.0, 2.0, 4.0]))
+    assert histogram.total() == 4
+    points = histogram.points(bins=4, scale="linear")
+    assert points["x"] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert points["y"][0] == 25.0 and points["y"][-1] == 100.0
+    single = CdfHistogram()
+    single.update(np.array([3.0, 3.0]))
+    assert single.points(scale="log")["x"] == [3.0]
+    assert CdfHistogram().points() is None
+
+
+def test_registry_rejects_unknown_scale():
+    with pytest.raises(ValueError):
+        CdfRegistry().points("key", np.array([1.0]), scale="sqrt")
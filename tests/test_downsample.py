@@ -0,0 +1,63 @@
+# coding=utf-8
+import numpy as np
+import pytest
+
+from downsample import DOWNSAMPLE_METHODS, downsample_indices
+
+
+def noisy_series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(size=n)) + 50 * (rng.random(n) < 0.01)
+
+
+# 降采样后不超过threshold个点，首尾两个点保留，下标严格递增
+@pytest.mark.parametrize("method", sorted(DOWNSAMPLE_METHODS))
+@pytest.mark.parametrize("n,threshold", [(1000, 100), (1000, 101), (1000, 3), (1000, 2), (1000, 1), (7, 5),
+                                         (10001, 640), (5, 5), (5, 10), (0, 10)])
+def test_methods_keep_endpoints(method, n, threshold):
+    y = noisy_series(n)
+    res = DOWNSAMPLE_METHODS[method](y, threshold)
+    assert len(res) <= max(threshold, 0) or threshold >= n
+    assert np.all(np.diff(res) > 0)
+    if n == 0:
+        assert len(res) == 0
+        return
+    assert res[0] == 0 and res.min() >= 0 and res.max() <= n - 1
+    if threshold >= 2:
+        assert res[-1] == n - 1
+    if threshold >= n:
+        assert res.tolist() == list(range(n))
+
+
+# minmax保留每段的尖峰
+def test_minmax_keeps_spikes():
+    y = np.zeros(1000)
+    y[[123, 456, 789]] = [10, -10, 10]
+    res = DOWNSAMPLE_METHODS["minmax"](y, 20)
+    assert {123, 456, 789} <= set(res.tolist())
+
+
+# 不需要降采样时空值点也保留，图上断开
+def test_window_keeps_gaps_without_downsampling():
+    y = np.arange(20, dtype=float)
+    y[[3, 4, 10]] = np.nan
+    assert downsample_indices(y, 2, 12, 10).tolist() == list(range(2, 12))
+    assert downsample_indices(y, 0, 20, 100).tolist() == list(range(20))
+
+
+# 降采样时每段连续空值保留第一个点
+@pytest.mark.parametrize("method", sorted(DOWNSAMPLE_METHODS))
+def test_window_downsampled_keeps_gap_markers(method):
+    y = noisy_series(5000)
+    y[1000:1100] = np.nan
+    y[3000] = np.inf
+    res = downsample_indices(y, 500, 4500, 200, method)
+    assert len(res) <= 200
+    assert res[0] == 500 and res[-1] == 4499
+    assert 1000 in res and 3000 in res
+    assert not set(res.tolist()) & set(range(1001, 1100))
+    # 空值段太多时不再保留
+    y = noisy_series(5000)
+    y[::7] = np.nan
+    res = downsample_indices(y, 0, 5000, 200, method)
+    assert len(res) <= 200 and np.isfinite(y[res]).all()
@@ -0,0 +1,139 @@
+# coding=utf-8
+import filecmp
+import multiprocessing
+import os
+
+import pandas as pd
+import pytest
+
+import loggen
+import metric_runner
+from columnar_cache import CACHE_DIR_ENV, columnar_cache
+from streaming import Checkpoint, open_records
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path / "cache"))
+    columnar_cache.clear()
+    input_path = str(tmp_path / "logs")
+    loggen.generate(input_path, transactions=5000, tps=200, block_interval=2.0, seed=1)
+    yield input_path
+    columnar_cache.clear()
+
+
+# 从空的列式缓存开始多进程计算全部指标，几个任务读取同一个记录文件（如block_commit_duration_end.csv）
+def test_run_from_empty_cache(logs, tmp_path):
+    for attempt in range(3):
+        columnar_cache.purge(logs)
+        assert not os.path.exists(columnar_cache.folder_dir(logs))
+        output_path = str(tmp_path / ("res%d" % attempt))
+        stats = metric_runner.run(logs, output_path, jobs=4)
+        assert {name: status for name, (status, _, _, _) in stats.items()} == {name: "ok" for name in metric_runner.TASKS}
+        assert os.path.exists(os.path.join(output_path, "res.csv"))
+
+
+def _refresh_and_count(path):
+    return len(open_records(path, 1 << 20).read())
+
+
+# 多个进程同时从空缓存刷新同一个记录文件，每个进程都读到完整的数据
+def test_concurrent_refresh_same_store(logs):
+    path = os.path.join(logs, "block_commit_duration_end.csv")
+    expected = len(pd.read_csv(path).query("measure_time != 'measure_time'"))
+    with multiprocessing.Pool(4) as pool:
+        assert pool.map(_refresh_and_count, [path] * 8) == [expected] * 8
+
+
+# 缺少一个记录文件时对应任务跳过，汇总任务仍然用其余的结果文件生成res.csv
+def test_missing_input_still_merges(logs, tmp_path):
+    os.remove(os.path.join(logs, "contract_time.csv"))
+    output_path = str(tmp_path / "res")
+    stats = metric_runner.run(logs, output_path, jobs=2)
+    assert stats["contract_time"][0] == "skipped"
+    assert stats[metric_runner.REPORT_TASK][0] == "ok"
+    assert all(status == "ok" for name, (status, _, _, _) in stats.items() if name != "contract_time")
+    assert os.path.exists(os.path.join(output_path, "res.csv"))
+
+
+def _result_files(output_path):
+    return sorted(name for name in os.listdir(output_path) if os.path.isfile(os.path.join(output_path, name)))
+
+
+# 两个结果目录中的文件相同且逐字节一致
+def assert_same_results(expected_path, actual_path):
+    names = _result_files(expected_path)
+    assert names and _result_files(actual_path) == names
+    _, mismatch, errors = filecmp.cmpfiles(expected_path, actual_path, names, shallow=False)
+    assert mismatch == [] and errors == []
+
+
+# 很小的内存预算下分块计算的结果与整个文件一次读入的结果一致
+def test_memory_budget_same_results(logs, tmp_path):
+    metric_runner.run(logs, str(tmp_path / "default"), jobs=2)
+    metric_runner.run(logs, str(tmp_path / "small"), jobs=2, memory_budget=64 * 1024)
+    assert_same_results(str(tmp_path / "default"), str(tmp_path / "small"))
+
+
+# 把记录文件按行分成前后两部分，前一部分约占fraction
+def _split_lines(path, fraction):
+    with open(path, "rb") as f:
+        lines = f.readlines()
+    cut = max(2, int(len(lines) * fraction))
+    return b"".join(lines[:cut]), b"".join(lines[cut:])
+
+
+# 先用60%的记录计算，追加其余记录后从断点继续，结果与从头计算一致
+def test_resume_after_append(logs, tmp_path):
+    names = sorted(name for name in os.listdir(logs) if name.endswith(".csv"))
+    rests = {}
+    for name in names:
+        path = os.path.join(logs, name)
+        head, rests[name] = _split_lines(path, 0.6)
+        with open(path, "wb") as f:
+            f.write(head)
+    resumed = str(tmp_path / "resumed")
+    metric_runner.run(logs, resumed, jobs=2, resume=True)
+    assert os.listdir(os.path.join(resumed, ".checkpoints"))
+    for name in names:
+        with open(os.path.join(logs, name), "ab") as f:
+            f.write(rests[name])
+    metric_runner.run(logs, resumed, jobs=2, resume=True)
+    fresh = str(tmp_path / "fresh")
+    metric_runner.run(logs, fresh, jobs=2)
+    assert_same_results(fresh, resumed)
+
+
+def _checkpoint(path, output_path):
+    return Checkpoint(output_path, "test", [open_records(path)], ["params"])
+
+
+# 输入文件只是追加时断点有效，被截断或被替换时断点作废
+def test_checkpoint_discarded(logs, tmp_path):
+    path = os.path.join(logs, "block_commit_duration_end.csv")
+    output_path = str(tmp_path / "res")
+    head, rest = _split_lines(path, 0.6)
+    with open(path, "wb") as f:
+        f.write(head)
+    checkpoint = _checkpoint(path, output_path)
+    rows = checkpoint.stores[0].rows
+    checkpoint.save("state")
+    with open(path, "ab") as f:
+        f.write(rest)
+    checkpoint = _checkpoint(path, output_path)
+    assert checkpoint.load() == "state" and checkpoint.starts == [rows]
+    assert Checkpoint(output_path, "test", checkpoint.stores, ["other"]).load() is None
+
+    with open(path, "wb") as f:
+        f.write(head[:len(head) // 2])
+    assert _checkpoint(path, output_path).load() is None
+
+    with open(path, "wb") as f:
+        f.write(head)
+    _checkpoint(path, output_path).save("state")
+    # 内容相同的新文件替换原文件（保持原文件打开，新文件不会复用它的inode）
+    with open(path, "rb") as old:
+        with open(path + ".new", "wb") as f:
+            f.write(head + rest)
+        os.replace(path + ".new", path)
+        assert _checkpoint(path, output_path).load() is None
@@ -0,0 +1,84 @@
+# coding=utf-8
+import numpy as np
+import pytest
+
+from quantile_sketch import QUANTILES, QuantileSketch, quantile_summary
+
+
+def random_values(seed, n=20000):
+    rng = np.random.default_rng(seed)
+    keys = rng.choice(["2023-12-01 10:00:%02d" % s for s in range(10)], n).astype(object)
+    values = np.concatenate([rng.lognormal(-3, 2, n // 2), rng.pareto(1.5, n - n // 2) * 1e3])
+    rng.shuffle(values)
+    return keys, values
+
+
+def assert_within(actual, expected, relative_accuracy):
+    assert abs(actual - expected) <= relative_accuracy * abs(expected) + 1e-12
+
+
+# 每个键的分位数与np.quantile（取排第floor(q * (n - 1))位的值）的相对误差不超过relative_accuracy
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_error(relative_accuracy):
+    keys, values = random_values(1)
+    sketch = QuantileSketch(relative_accuracy)
+    sketch.add(keys, values)
+    res = sketch.result()
+    assert list(res.index) == sorted(set(keys))
+    for key, row in res.iterrows():
+        group = values[keys == key]
+        assert row["count"] == len(group)
+        assert row["max"] == group.max()
+        for name, q in QUANTILES.items():
+            assert_within(row[name], np.quantile(group, q, method="lower"), relative_accuracy)
+    total = sketch.total()
+    assert total["count"] == len(values)
+    for name, q in QUANTILES.items():
+        assert_within(total[name], np.quantile(values, q, method="lower"), relative_accuracy)
+
+
+def test_negative_zero_and_missing_values():
+    values = np.array([-5.0, -1.0, 0.0, 0.0, 2.0, 7.0, np.nan, 3.0])
+    keys = np.array(["a", "a", "a", "a", "a", "a", "a", None], dtype=object)
+    # 空值不计入
+    summary = quantile_summary(values[:-1])
+    assert summary["count"] == 6
+    assert summary["p50"] == 0.0
+    assert_within(summary["p90"], 2.0, 0.01)
+    assert summary["max"] == 7.0
+    sketch = QuantileSketch()
+    sketch.add(keys, values)
+    assert sketch.result()["count"].tolist() == [6]
+    assert_within(sketch.result(quantiles={"p0": 0.0})["p0"].iloc[0], -5.0, 0.01)
+    assert quantile_summary([]) == {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+
+
+def assert_same_sketch(actual, expected):
+    for name in ["keys", "minima", "maxima", "groups", "bins", "counts"]:
+        np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name))
+
+
+# 分块加入、各块的草图合并与一次加入全部取值得到同一个草图
+def test_merge_equals_single_pass(tmp_path):
+    keys, values = random_values(2)
+    whole = QuantileSketch()
+    whole.add(keys, values)
+    chunked, merged = QuantileSketch(), QuantileSketch()
+    for rows in np.array_split(np.arange(len(values)), 7):
+        chunked.add(keys[rows], values[rows])
+        part = QuantileSketch()
+        part.add(keys[rows], values[rows])
+        part.save(str(tmp_path / "part.npz"))
+        merged.merge(QuantileSketch.load(str(tmp_path / "part.npz")))
+    assert_same_sketch(chunked, whole)
+    assert_same_sketch(merged, whole)
+    assert merged.result().equals(whole.result())
+    assert merged.total() == whole.total()
+
+
+def test_merge_different_accuracy():
+    sketch = QuantileSketch(0.01)
+    other = QuantileSketch(0.02)
+    other.add(["a"], [1.0])
+    with pytest.raises(Exception):
+        sketch.merge(other)
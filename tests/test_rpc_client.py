@@ -0,0 +1,236 @@
+# coding=utf-8
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from hexbytes import HexBytes
+from web3 import Web3
+
+from rpc_client import CONFIRMATIONS, PooledHTTPProvider, RpcClient
+
+
+# 本地的假节点：链头高度为head，区块哈希由高度得到；每次POST前等待delay秒
+# fail_methods中的方法返回HTTP 500，error_methods中的方法返回JSON-RPC错误，批量请求按相反的顺序返回
+class FakeNode:
+    def __init__(self, head=100, delay=0.0):
+        self.head = head
+        self.delay = delay
+        self.fail_methods = set()
+        self.error_methods = set()
+        self.posts = 0
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with node.lock:
+                    node.posts += 1
+                time.sleep(node.delay)
+                items = body if isinstance(body, list) else [body]
+                if any(item["method"] in node.fail_methods for item in items):
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                res = [node.handle(item) for item in items]
+                data = json.dumps(res[::-1] if isinstance(body, list) else res[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.uri = "http://127.0.0.1:%d" % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def block(self, number):
+        return {"number": hex(number), "hash": "0x%064x" % (number + 1), "parentHash": "0x%064x" % number,
+                "transactions": [], "timestamp": hex(1700000000 + number), "gasUsed": "0x0", "gasLimit": "0x1",
+                "miner": "0x" + "00" * 20, "difficulty": "0x2", "extraData": "0x", "logsBloom": "0x" + "00" * 256,
+                "nonce": "0x0000000000000000", "sha3Uncles": "0x" + "00" * 32, "stateRoot": "0x" + "00" * 32,
+                "transactionsRoot": "0x" + "00" * 32, "receiptsRoot": "0x" + "00" * 32, "uncles": [],
+                "mixHash": "0x" + "00" * 32, "size": "0x10", "totalDifficulty": "0x2"}
+
+    def handle(self, item):
+        method, params = item["method"], item.get("params", [])
+        with self.lock:
+            self.calls[method] += 1
+        if method in self.error_methods:
+            return {"jsonrpc": "2.0", "id": item["id"], "error": {"code": -32000, "message": "boom"}}
+        if method == "eth_blockNumber":
+            result = hex(self.head)
+        elif method == "eth_getBlockByNumber":
+            result = self.block(self.head if params[0] == "latest" else int(params[0], 16))
+        elif method == "eth_getBlockTransactionCountByNumber":
+            result = hex(int(params[0], 16) % 5)
+        else:
+            result = "0x1"
+        return {"jsonrpc": "2.0", "id": item["id"], "result": result}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def node():
+    node = FakeNode()
+    yield node
+    node.close()
+
+
+def _concurrently(n, func):
+    results, errors = [None] * n, [None] * n
+    barrier = threading.Barrier(n)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = func()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+# 同时发出的相同请求只发一次POST，所有调用方得到同一个结果
+def test_single_flight(node):
+    node.delay = 0.3
+    rpc = RpcClient(node.uri)
+    results, errors = _concurrently(8, lambda: rpc.request("eth_getBalance", ["0x00", "latest"]))
+    assert errors == [None] * 8
+    assert node.posts == 1
+    assert all(r is results[0] for r in results)
+
+
+# 同一次请求失败时，等待它的调用方都得到这个错误
+def test_single_flight_shares_error(node):
+    node.delay = 0.3
+    node.fail_methods.add("eth_getBalance")
+    rpc = RpcClient(node.uri)
+    results, errors = _concurrently(6, lambda: rpc.request("eth_getBalance", ["0x00", "latest"]))
+    assert node.posts == 1
+    assert all(isinstance(e, requests.HTTPError) for e in errors)
+    assert all(e is errors[0] for e in errors)
+    # 失败的请求不留在进行中的表里，下次重新发送
+    node.fail_methods.clear()
+    assert rpc.call("eth_getBalance", ["0x00", "latest"]) == "0x1"
+    assert node.posts == 2
+
+
+def test_head_ttl(node):
+    rpc = RpcClient(node.uri, head_ttl=0.2)
+    assert rpc.call("eth_blockNumber") == hex(100)
+    node.head = 101
+    assert rpc.call("eth_blockNumber") == hex(100)
+    assert node.posts == 1
+    time.sleep(0.3)
+    assert rpc.call("eth_blockNumber") == hex(101)
+    assert node.posts == 2
+
+
+# 按高度取的区块离链头不到CONFIRMATIONS个块时不进LRU，更早的区块缓存后不再请求
+def test_block_lru_skips_recent_blocks(node):
+    rpc = RpcClient(node.uri)
+    rpc.call("eth_blockNumber")
+    recent = hex(100 - CONFIRMATIONS + 1)
+    old = hex(100 - CONFIRMATIONS)
+    for _ in range(2):
+        rpc.call("eth_getBlockByNumber", [recent, False])
+        rpc.call("eth_getBlockByNumber", [old, False])
+    assert node.calls["eth_getBlockByNumber"] == 3
+    # cache=False既不读也不写缓存
+    rpc.call("eth_getBlockByNumber", [old, False], cache=False)
+    rpc.call("eth_getBlockByNumber", [hex(10), False], cache=False)
+    assert node.calls["eth_getBlockByNumber"] == 5
+    assert len(rpc.blocks) == 1
+
+
+# 还不知道链头时按高度取的区块都不缓存
+def test_block_lru_needs_head(node):
+    rpc = RpcClient(node.uri)
+    rpc.call("eth_getBlockByNumber", [hex(1), False])
+    rpc.call("eth_getBlockByNumber", [hex(1), False])
+    assert node.calls["eth_getBlockByNumber"] == 2
+
+
+# 参数为标签（latest等）的请求随链头变化，只做短时缓存，不进LRU
+def test_block_tags_not_in_lru(node):
+    rpc = RpcClient(node.uri, head_ttl=0.2)
+    rpc.call("eth_blockNumber")
+    assert rpc.call("eth_getBlockByNumber", ["latest", False])["number"] == hex(100)
+    assert rpc.call("eth_getBlockByNumber", ["latest", False])["number"] == hex(100)
+    assert node.calls["eth_getBlockByNumber"] == 1
+    assert len(rpc.blocks) == 0
+    node.head = 120
+    time.sleep(0.3)
+    assert rpc.call("eth_getBlockByNumber", ["latest", False])["number"] == hex(120)
+
+
+def test_block_lru_eviction(node):
+    rpc = RpcClient(node.uri, block_cache_size=2)
+    rpc.call("eth_blockNumber")
+    for number in [1, 2, 3, 1]:
+        rpc.call("eth_getBlockByNumber", [hex(number), False])
+    assert node.calls["eth_getBlockByNumber"] == 4
+    assert len(rpc.blocks) == 2
+
+
+# 批量请求按请求的顺序返回（假节点倒序返回），不经过缓存
+def test_batch_order(node):
+    rpc = RpcClient(node.uri)
+    counts = rpc.batch("eth_getBlockTransactionCountByNumber", [[hex(i)] for i in range(10)])
+    assert counts == [hex(i % 5) for i in range(10)]
+    assert node.posts == 1
+    rpc.batch("eth_getBlockTransactionCountByNumber", [[hex(1)]])
+    assert node.posts == 2
+
+
+def test_batch_error(node):
+    rpc = RpcClient(node.uri)
+    node.error_methods.add("eth_getBlockTransactionCountByNumber")
+    with pytest.raises(Exception, match="json-rpc error"):
+        rpc.batch("eth_getBlockTransactionCountByNumber", [[hex(1)], [hex(2)]])
+    node.fail_methods.add("eth_getBlockByNumber")
+    with pytest.raises(requests.HTTPError):
+        rpc.batch("eth_getBlockByNumber", [[hex(1), False]])
+
+
+# 节点返回JSON-RPC错误时request返回完整响应，call抛出异常，错误响应不缓存
+def test_call_error(node):
+    rpc = RpcClient(node.uri)
+    node.error_methods.add("eth_blockNumber")
+    assert "error" in rpc.request("eth_blockNumber")
+    with pytest.raises(Exception, match="boom"):
+        rpc.call("eth_blockNumber")
+    assert node.posts == 2
+
+
+# 经由PooledHTTPProvider的Web3结果格式与HTTPProvider相同
+def test_pooled_provider_formatting(node):
+    rpc = RpcClient(node.uri)
+    pooled = Web3(PooledHTTPProvider(rpc))
+    plain = Web3(Web3.HTTPProvider(node.uri))
+    assert pooled.eth.block_number == plain.eth.block_number == 100
+    block = pooled.eth.get_block(90)
+    assert block == plain.eth.get_block(90)
+    assert isinstance(block["hash"], HexBytes)
+    assert block["number"] == 90
+    assert Web3.to_json(pooled.eth.get_block("latest")) == Web3.to_json(plain.eth.get_block("latest"))
@@ -0,0 +1,135 @@
+# coding=utf-8
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import loggen
+from columnar_cache import CACHE_DIR_ENV, columnar_cache
+from csv_cache import csv_tail_cache
+from summary_index import KeyIndex, SummaryIndex, SummaryTable
+
+
+def test_key_index():
+    index = KeyIndex()
+    keys = ["k%d" % i for i in range(1000)]
+    start = 0
+    for size in [1, 1, 2, 7, 3, 100, 50, 836]:
+        index.append(keys[start:start + size])
+        start += size
+    assert len(index) == 1000
+    assert len(index.chunks) <= 11
+    query = ["k999", "x", "k0", "k500", "k1"]
+    assert index.get_indexer(query).tolist() == [999, -1, 0, 500, 1]
+
+
+# 随机生成的记录：每条记录只带部分字段，同一个键会多次出现
+def random_records(seed, n=3000, keys=800):
+    rng = np.random.default_rng(seed)
+    key = rng.integers(0, keys, n).astype(str).astype(object)
+    values = {field: np.array(["%s%d" % (field, i) for i in range(n)], dtype=object) for field in "abc"}
+    present = {field: rng.random(n) < 0.4 for field in "abc"}
+    return key, values, present
+
+
+def table_frame(table):
+    return table.page(0, None)
+
+
+# 分批增量更新的结果与一次处理全部记录的结果相同
+@pytest.mark.parametrize("seed", range(5))
+def test_summary_table_incremental(seed):
+    keys, values, present = random_records(seed)
+    whole = SummaryTable(["A", "B", "C"], ["a", "b", "c"])
+    whole.update(keys, values, present)
+    rng = np.random.default_rng(seed + 100)
+    cuts = np.sort(rng.choice(np.arange(1, len(keys)), 20, replace=False))
+    table = SummaryTable(["A", "B", "C"], ["a", "b", "c"])
+    for rows in np.split(np.arange(len(keys)), cuts):
+        table.update(keys[rows], {field: value[rows] for field, value in values.items()},
+                     {field: mask[rows] for field, mask in present.items()})
+    assert not table.sorted
+    assert len(table) == len(whole) > 0
+    pd.testing.assert_frame_equal(table_frame(table), table_frame(whole))
+    pd.testing.assert_frame_equal(table.page(10, 20), whole.page(10, 20))
+    assert table.partial_keys.equals(whole.partial_keys)
+
+
+# 同一批中同一个键的字段取最后一次出现的值，按字段凑齐时所在的行排序
+def test_summary_table_update_order():
+    table = SummaryTable(["A", "B"], ["a", "b"])
+    table.update(["x", "y", "y", "x", "z"], {"a": ["1", "2", "3", "4", "5"], "b": ["6", "7", "8", "9", "0"]},
+                 {"a": np.array([1, 1, 1, 0, 0], dtype=bool), "b": np.array([0, 0, 1, 1, 0], dtype=bool)})
+    assert table_frame(table).values.tolist() == [["1", "9"], ["3", "8"]]
+    table.update(["x", "z"], {"a": ["10", "11"]})
+    assert table_frame(table).values.tolist() == [["10", "9"], ["3", "8"]]
+    assert list(table.partial_keys) == ["z"]
+
+
+# 行按order_field第一次出现的位置排列，与字段凑齐的先后无关
+def test_summary_table_order():
+    table = SummaryTable(["A", "B"], ["a", "b"])
+    table.update(["x", "y", "z"], {"a": ["1", "2", "3"]}, order=[10, 11, 12])
+    table.update(["z"], {"b": ["4"]})
+    table.update(["y", "x"], {"b": ["5", "6"]})
+    assert table_frame(table).values.tolist() == [["1", "6"], ["2", "5"], ["3", "4"]]
+    assert table.page(1, 2).values.tolist() == [["2", "5"]]
+    assert table.page(-1, None).values.tolist() == [["3", "4"]]
+    assert table.page(5, 8).empty
+
+
+def test_summary_table_evict():
+    table = SummaryTable(["A", "B"], ["a", "b"], max_partial=2)
+    table.update(["k1", "k2", "k3"], {"a": ["1", "2", "3"]})
+    # 成行之前不丢弃：同一次刷新中后面的来源文件可能补齐字段
+    assert len(table.partial_keys) == 3
+    table.evict()
+    assert list(table.partial_keys) == ["k2", "k3"] and table.evicted == 1
+    table.update(["k1", "k2"], {"b": ["4", "5"]})
+    assert table_frame(table).values.tolist() == [["2", "5"]]
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path / "cache"))
+    columnar_cache.clear()
+    csv_tail_cache.clear()
+    input_path = str(tmp_path / "logs")
+    loggen.generate(input_path, transactions=5000, tps=200, block_interval=0.5, seed=2)
+    yield input_path
+    csv_tail_cache.clear()
+    columnar_cache.clear()
+
+
+def assert_same_index(index, dirpath):
+    rebuilt = SummaryIndex()
+    for table in ["blocks", "txs"]:
+        expected, expected_rows = rebuilt.page(dirpath, table, 0, None)
+        actual, rows = index.page(dirpath, table, 0, None)
+        assert rows == expected_rows > 0
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+# 记录文件追加后增量更新的汇总表与从头构建的相同；文件被截断后整体重建
+def test_summary_index_append_and_truncate(logs):
+    index = SummaryIndex()
+    parts = {}
+    for filename in index.sources:
+        path = os.path.join(logs, filename)
+        with open(path, "rb") as f:
+            lines = f.readlines()
+        cuts = [0, len(lines) // 3, len(lines) * 2 // 3, len(lines)]
+        parts[filename] = [b"".join(lines[a:b]) for a, b in zip(cuts, cuts[1:])]
+        with open(path, "wb") as f:
+            f.write(parts[filename][0])
+    assert_same_index(index, logs)
+    for step in [1, 2]:
+        for filename in index.sources:
+            with open(os.path.join(logs, filename), "ab") as f:
+                f.write(parts[filename][step])
+        assert_same_index(index, logs)
+    path = os.path.join(logs, "tx_queue_delay.csv")
+    with open(path, "wb") as f:
+        f.write(parts["tx_queue_delay.csv"][0])
+    assert_same_index(index, logs)
@@ -0,0 +1,97 @@
+# coding=utf-8
+import numpy as np
+import pytest
+
+from timeutil import NAT, _parse_time_block, _parse_time_numpy, _parse_time_words, _strip_blanks, _to_bytes, \
+    parse_time_bytes, parse_time_ns, parse_time_scalar
+
+
+def ns(iso):
+    return int(np.datetime64(iso, "ns").astype(np.int64))
+
+
+VALID = {
+    "2023-12-01 10:00:00": ns("2023-12-01T10:00:00"),
+    "2023-12-01T10:00:00.123456": ns("2023-12-01T10:00:00.123456"),
+    "2023-12-01 10:00:00.5": ns("2023-12-01T10:00:00.5"),
+    "2024-02-29 23:59:59.999999": ns("2024-02-29T23:59:59.999999"),
+    # 超过微秒的小数：按字节解析，最多取到纳秒
+    "2023-12-01 10:00:00.123456789": ns("2023-12-01T10:00:00.123456789"),
+    "2023-12-01 10:00:00.1234567891": ns("2023-12-01T10:00:00.123456789"),
+    # 两端的空白
+    " 2023-12-01 10:00:00.25": ns("2023-12-01T10:00:00.25"),
+    "2023-12-01 10:00:00.25\t": ns("2023-12-01T10:00:00.25"),
+    "1678-01-01 00:00:00": ns("1678-01-01T00:00:00"),
+    "2261-12-31 23:59:59.999999999": ns("2261-12-31T23:59:59.999999999"),
+}
+MALFORMED = ["", "NaT", "now", "today", "2023", "2023-12-01", "2023-12-01 10:00", "2023-12-01T10", "2023-12-01 10:00:0",
+             "2023-12-01 10:00:00Z", "2023-12-01 10:00:00+08:00", "2023-12-01 10:00:00 AM", "+2023-12-01 10:00:00",
+             "2023/12/01 10:00:00", "2023-1-01 10:00:00", "2023-12-01  10:00:00", "2023-12-01 10:00:00.12a",
+             "2023-12-01 10:00:00,5", "2023-12-01 24:00:00", "2023-12-01 10:60:00", "2023-12-01 10:00:60",
+             "2023-02-29 10:00:00", "2023-13-01 10:00:00", "2023-12-32 10:00:00"]
+OUT_OF_RANGE = ["1677-12-31 23:59:59", "2262-01-01 00:00:00", "2300-01-01 00:00:00", "1500-06-01 12:00:00",
+                "0000-01-01 00:00:00", "9999-12-31 23:59:59", "12023-12-01 10:00:00", "-2023-12-01 10:00:00"]
+CASES = list(VALID.items()) + [(text, NAT) for text in MALFORMED + OUT_OF_RANGE]
+
+
+def _matrix(texts):
+    arr = _to_bytes(np.array(texts, dtype=object))
+    return np.ascontiguousarray(arr).view(np.uint8).reshape(len(arr), arr.dtype.itemsize)
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_parse_time_ns(text, expected):
+    assert parse_time_ns([text])[0] == expected
+    # 与大量合法的行放在同一列中，整列不能走快速路径
+    column = ["2023-12-01 10:00:00.000001"] * 100 + [text]
+    assert parse_time_ns(column)[-1] == expected
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_numpy_path(text, expected):
+    res = _parse_time_numpy(np.array([text], dtype=object))
+    # 快速路径要么不处理，要么结果与按字节解析相同
+    assert res is None or res[0] == expected
+    if expected == NAT:
+        assert res is None
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_byte_paths(text, expected):
+    assert parse_time_bytes(_to_bytes(np.array([text], dtype=object)))[0] == expected
+    assert parse_time_bytes(np.array([text.encode()], dtype="S40"))[0] == expected
+    b = _matrix([text])
+    if b.shape[1] >= 19:
+        # SWAR快速路径：处理了的行结果必须正确
+        fast, res = _parse_time_words(_strip_blanks(b))
+        assert not fast[0] or res[0] == expected
+        # 逐字节列的通用路径
+        assert _parse_time_block(_strip_blanks(b))[0] == expected
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_scalar_path(text, expected):
+    assert parse_time_scalar(text) == expected
+
+
+def test_swar_handles_common_formats():
+    fast, res = _parse_time_words(_matrix(["2023-12-01 10:00:00", "2023-12-01T10:00:00.123456",
+                                           "2023-12-01 10:00:00.123456789"]))
+    assert fast.all()
+    assert list(res) == [ns("2023-12-01T10:00:00"), ns("2023-12-01T10:00:00.123456"),
+                         ns("2023-12-01T10:00:00.123456789")]
+
+
+# 跨越多个解析块、各种格式混在一起的整列与逐个解析的结果一致
+def test_mixed_column_matches_scalar():
+    rng = np.random.default_rng(0)
+    texts = [text for text, _ in CASES]
+    column = [texts[i] for i in rng.integers(0, len(texts), 150000)]
+    expected = np.array([dict(CASES)[text] for text in column])
+    assert (parse_time_ns(column) == expected).all()
+    assert (parse_time_ns(np.array(column, dtype=object).astype("S")) == expected).all()
+
+
+def test_non_text_values():
+    assert list(parse_time_ns([None, np.nan, "2023-12-01 10:00:00"])) == [NAT, NAT, ns("2023-12-01T10:00:00")]
+    assert parse_time_ns([]).tolist() == []
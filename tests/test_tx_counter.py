@@ -0,0 +1,124 @@
+# coding=utf-8
+import pytest
+
+from tx_counter import REORG_DEPTH, TxCounter
+
+
+# 按脚本构造的链：blocks[i] = (哈希, 交易数)；fork用来给重组后的区块换一个哈希
+class ScriptedChain:
+    def __init__(self, length, fork="a"):
+        self.blocks = []
+        self.grow(length, fork)
+        self.cached_calls = 0
+
+    def grow(self, n, fork="a"):
+        for _ in range(n):
+            height = len(self.blocks)
+            self.blocks.append(("0x%s%x" % (fork, height), height % 7))
+
+    # 把depth个最新区块换成分支fork上的length个区块
+    def reorg(self, depth, length, fork):
+        del self.blocks[len(self.blocks) - depth:]
+        self.grow(length, fork)
+
+    @property
+    def head(self):
+        return len(self.blocks) - 1
+
+    @property
+    def total(self):
+        return sum(count for _, count in self.blocks)
+
+    def block(self, height):
+        if height >= len(self.blocks):
+            return None
+        block_hash, count = self.blocks[height]
+        return {"hash": block_hash, "transactions": ["0x%x" % i for i in range(count)]}
+
+    # 与RpcClient相同的接口
+    def call(self, method, params=None, cache=True):
+        assert method == "eth_getBlockByNumber"
+        if cache:
+            self.cached_calls += 1
+        return self.block(int(params[0], 16))
+
+    def batch(self, method, params_list):
+        if method == "eth_getBlockByNumber":
+            return [self.block(int(params[0], 16)) for params in params_list]
+        assert method == "eth_getBlockTransactionCountByNumber"
+        return [hex(self.blocks[int(params[0], 16)][1]) for params in params_list]
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return str(tmp_path / "tx_counter.json")
+
+
+def test_append(state_path):
+    chain = ScriptedChain(500)
+    counter = TxCounter(chain, state_path, batch_size=64)
+    assert counter.update(chain.head) == chain.total
+    assert len(counter.recent) == REORG_DEPTH
+    chain.grow(10)
+    assert counter.update(chain.head) == chain.total
+    chain.grow(300)
+    assert counter.update(chain.head) == chain.total
+    assert counter.update(chain.head) == chain.total
+    # 校验重组和换链的读取不经过区块缓存
+    assert chain.cached_calls == 0
+
+
+# 重组深度在recent以内：只回退被重组掉的区块
+def test_shallow_reorg(state_path):
+    chain = ScriptedChain(300)
+    counter = TxCounter(chain, state_path)
+    counter.update(chain.head)
+    chain.reorg(5, 8, "b")
+    assert counter.update(chain.head) == chain.total
+    # 新分支比原来短，链头低于已计数的高度
+    chain.reorg(10, 3, "c")
+    assert counter.update(chain.head) == chain.total
+    assert counter.recent[-1] == [chain.head, chain.blocks[-1][0], chain.blocks[-1][1]]
+
+
+# 重组比recent更深：从头计数
+def test_deep_reorg(state_path):
+    chain = ScriptedChain(300)
+    counter = TxCounter(chain, state_path)
+    counter.update(chain.head)
+    chain.reorg(REORG_DEPTH + 20, REORG_DEPTH + 30, "b")
+    assert not counter.rollback(chain.head)
+    assert counter.update(chain.head) == chain.total
+
+
+def test_reload_state(state_path):
+    chain = ScriptedChain(300)
+    TxCounter(chain, state_path).update(chain.head)
+    counter = TxCounter(chain, state_path)
+    assert counter.total == chain.total
+    chain.grow(20)
+    assert counter.update(chain.head) == chain.total
+    # 进程停止期间发生了重组
+    chain.reorg(10, 12, "b")
+    counter = TxCounter(chain, state_path)
+    assert counter.update(chain.head) == chain.total
+
+
+# 状态文件属于另一条链（创世区块不同）：从头计数
+def test_genesis_change(state_path):
+    chain = ScriptedChain(300)
+    TxCounter(chain, state_path).update(chain.head)
+    other = ScriptedChain(100, "z")
+    counter = TxCounter(other, state_path)
+    assert counter.update(other.head) == other.total
+    assert counter.genesis == other.blocks[0][0]
+    assert TxCounter(other, state_path).total == other.total
+
+
+# 链被重置到更低的高度且创世区块不变
+def test_chain_reset(state_path):
+    chain = ScriptedChain(300)
+    counter = TxCounter(chain, state_path)
+    counter.update(chain.head)
+    chain.reorg(299, 50, "r")
+    assert counter.update(chain.head) == chain.total
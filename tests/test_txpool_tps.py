@@ -0,0 +1,136 @@
+# coding=utf-8
+import os
+
+import numpy as np
+import pytest
+
+from timeutil import parse_time_ns
+from txpool_tps import ArrivalRing, TxpoolTpsWindow
+
+HEADER = "measure_time,tx_id,source\n"
+START_NS = int(parse_time_ns(["2023-12-01 10:00:00.000000"])[0])
+
+
+# 第i笔交易在10:00:00之后i*step_ms毫秒到达
+def lines(start, stop, step_ms=10):
+    return "".join("2023-12-01 10:%02d:%02d.%06d,%064x,1\n" % (i * step_ms // 60000, i * step_ms // 1000 % 60,
+                                                                 i * step_ms % 1000 * 1000, i)
+                   for i in range(start, stop))
+
+
+def arrival(i, step_ms=10):
+    return START_NS + i * step_ms * 1000000
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "transaction_pool_input_throughput.csv")
+
+
+def write(path, text, mode="w"):
+    with open(path, mode) as f:
+        f.write(text)
+
+
+def test_ring_wrap_around():
+    ring = ArrivalRing(5)
+    ring.extend(np.array([1, 2, 3]))
+    ring.extend(np.array([4, 5, 6, 7]))
+    assert ring.size == 5 and ring.pos == 2
+    assert sorted(ring.buf) == [3, 4, 5, 6, 7]
+    assert (ring.oldest(), ring.newest()) == (3, 7)
+    # 一次追加超过容量时只保留最后capacity个
+    ring.extend(np.arange(100, 112))
+    assert sorted(ring.buf) == list(range(107, 112))
+    assert ring.count_after(108) == 3
+    ring.clear()
+    ring.extend(np.array([9]))
+    assert (ring.size, ring.oldest(), ring.newest()) == (1, 9, 9)
+
+
+# 前后两次追加的时间交错时，最早、最晚和计数仍按全部记录计算
+def test_ring_interleaved_appends():
+    ring = ArrivalRing(4)
+    ring.extend(np.array([10, 20, 30]))
+    ring.extend(np.array([15, 25]))
+    assert (ring.oldest(), ring.newest()) == (15, 30)
+    assert ring.count_after(18) == 3
+    ring = ArrivalRing(8)
+    ring.extend(np.array([10, 20, 30]))
+    ring.extend(np.array([5, 25]))
+    assert (ring.oldest(), ring.newest()) == (5, 30)
+    assert ring.count_after(10) == 3
+
+
+# 每次只读新追加的完整行，不完整的最后一行等写完后再读
+def test_poll_appends(path):
+    write(path, HEADER + lines(0, 10))
+    window = TxpoolTpsWindow(path)
+    window.poll()
+    assert window.ring.size == 10
+    partial = lines(10, 11)
+    write(path, partial[:8], "a")
+    window.poll()
+    assert window.ring.size == 10
+    write(path, partial[8:] + lines(11, 20), "a")
+    window.poll()
+    assert window.ring.size == 20
+    assert window.ring.newest() == arrival(19)
+    assert window.ring.oldest() == arrival(0)
+
+
+# 从文件中间开始读时跳过不完整的第一行；起点恰好在行首时这一行要保留
+def test_bootstrap_from_middle(path):
+    write(path, HEADER + lines(0, 100))
+    line_bytes = len(lines(0, 1))
+    size = os.path.getsize(path)
+    window = TxpoolTpsWindow(path, bootstrap_bytes=10 * line_bytes + 5)
+    window.poll()
+    assert window.ring.size == 10
+    assert window.ring.oldest() == arrival(90)
+    window = TxpoolTpsWindow(path, bootstrap_bytes=10 * line_bytes)
+    window.poll()
+    assert window.ring.size == 10
+    assert window.ring.oldest() == arrival(90)
+    # 末尾一段覆盖整个文件时从头读，表头丢弃
+    window = TxpoolTpsWindow(path, bootstrap_bytes=size)
+    window.poll()
+    assert window.ring.size == 100
+
+
+# 文件被截断或被新文件替换时清空缓冲区重新读取
+def test_truncate_and_replace(path):
+    write(path, HEADER + lines(0, 50))
+    window = TxpoolTpsWindow(path)
+    window.poll()
+    assert window.ring.size == 50
+    write(path, HEADER + lines(200, 210))
+    window.poll()
+    assert window.ring.size == 10
+    assert window.ring.oldest() == arrival(200)
+    # 新文件比已读的位置更长，只能通过inode发现被替换
+    with open(path):
+        write(path + ".new", HEADER + lines(300, 400))
+        os.replace(path + ".new", path)
+        window.poll()
+    assert window.ring.size == 100
+    assert window.ring.oldest() == arrival(300)
+
+
+# 窗口比已有记录的时长更长时按实际覆盖的时长计算
+def test_tps_window_longer_than_data(path):
+    write(path, HEADER + lines(0, 100))
+    window = TxpoolTpsWindow(path)
+    assert window.tps(60) == pytest.approx(100.0)
+    assert window.tps(0.5) == pytest.approx(100.0)
+    # 缓冲区装不下整个窗口时按缓冲区覆盖的时长计算
+    window = TxpoolTpsWindow(path, capacity=20)
+    assert window.tps(60) == pytest.approx(100.0)
+    assert window.ring.size == 20
+
+
+def test_tps_too_few_records(path):
+    write(path, HEADER + lines(0, 1))
+    assert TxpoolTpsWindow(path).tps(10) == 0.0
+    write(path, HEADER)
+    assert TxpoolTpsWindow(path).tps(10) == 0.0
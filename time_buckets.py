@@ -0,0 +1,60 @@
+# coding=utf-8
+import numpy as np
+import pandas as pd
+
+from timeutil import NAT
+
+
+# 把int64纳秒时间戳按纪元对齐的定宽时间桶聚合，一次bincount同时算出计数、求和、均值和按类别拆分的计数/求和
+# values为空时只统计计数；categories不为空时额外输出每个类别的count_<类别>、sum_<类别>两列
+# 结果按桶起点（int64纳秒）索引，从第一个非空桶到最后一个非空桶连续，空桶填0
+def bucket_aggregate(times_ns, values=None, categories=None, bucket_seconds=1):
+    times_ns = np.asarray(times_ns, dtype=np.int64)
+    valid = times_ns != NAT
+    if values is not None:
+        values = np.asarray(values)
+        valid &= ~pd.isna(values)
+    times_ns = times_ns[valid]
+    width = int(round(bucket_seconds * 1e9))
+    if width <= 0:
+        raise Exception("bucket width must be positive")
+    if len(times_ns) == 0:
+        return pd.DataFrame(columns=["count", "sum", "mean"], index=pd.Index([], dtype=np.int64, name="bucket"))
+
+    keys = times_ns // width
+    first = keys.min()
+    keys -= first
+    n = int(keys.max()) + 1
+    weights = None if values is None else values[valid].astype(np.float64)
+
+    counts = np.bincount(keys, minlength=n)
+    sums = counts.astype(np.float64) if weights is None else np.bincount(keys, weights=weights, minlength=n)
+    res = pd.DataFrame({"count": counts, "sum": sums}, index=pd.Index((np.arange(n) + first) * width, name="bucket"))
+    res["mean"] = np.divide(sums, counts, out=np.zeros(n), where=counts > 0)
+
+    if categories is not None:
+        codes, uniques = pd.factorize(np.asarray(categories, dtype=object)[valid], sort=True)
+        # 类别为空值的记录只计入总数
+        has_code = codes >= 0
+        cat_keys = keys[has_code] * len(uniques) + codes[has_code]
+        cat_weights = None if weights is None else weights[has_code]
+        cat_counts = np.bincount(cat_keys, minlength=n * len(uniques)).reshape(n, len(uniques))
+        cat_sums = cat_counts if weights is None else \
+            np.bincount(cat_keys, weights=cat_weights, minlength=n * len(uniques)).reshape(n, len(uniques))
+        for i, name in enumerate(uniques):
+            res["count_%s" % name] = cat_counts[:, i]
+            res["sum_%s" % name] = cat_sums[:, i]
+
+    # 输入是整数时求和结果也保持整数
+    if values is None or np.issubdtype(values.dtype, np.integer):
+        sum_columns = [c for c in res.columns if c == "sum" or c.startswith("sum_")]
+        res[sum_columns] = res[sum_columns].astype(np.int64)
+    return res
+
+
+# 把桶起点格式化成与记录文件一致的时间文本：整秒桶为"%Y-%m-%d %H:%M:%S"，否则带毫秒或微秒
+def bucket_labels(starts_ns, bucket_seconds=1):
+    width = int(round(bucket_seconds * 1e9))
+    unit = "s" if width % 1000000000 == 0 else "ms" if width % 1000000 == 0 else "us"
+    labels = np.datetime_as_string(np.asarray(starts_ns, dtype=np.int64).view("datetime64[ns]"), unit=unit)
+    return pd.Series(labels).str.replace("T", " ", regex=False)
@@ -0,0 +1,299 @@
+# coding=utf-8
+import functools
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+NAT = np.iinfo(np.int64).min
+# Go time.Duration.String()的单位及对应的纳秒数，如"1m30.5s"、"3.28ms"、"90.895µs"
+DURATION_UNITS = {"h": 3600 * 10 ** 9, "m": 60 * 10 ** 9, "s": 10 ** 9, "ms": 10 ** 6, "us": 10 ** 3, "µs": 10 ** 3,
+                  "μs": 10 ** 3, "ns": 1}
+DURATION_PART = r"(\d+(?:\.\d*)?|\.\d+)(ns|us|µs|μs|ms|h|m|s)"
+
+
+# 定宽时间文本"YYYY-MM-DD HH:MM:SS[.fffffffff]"中年、月、日、时、分、秒各字段的字节位置，分隔符的位置和字符
+TIME_FIELDS = [(0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19)]
+TIME_SEPARATORS = [(4, "-"), (7, "-"), (10, " "), (13, ":"), (16, ":")]
+# 小数秒最多取到纳秒（9位），其后的数字舍去
+TIME_WIDTH = 29
+# 纳秒时间戳（int64）能完整表示的年份，超出范围的时间为NAT
+MIN_YEAR = 1678
+MAX_YEAR = 2261
+TIME_RANGE_US = (np.datetime64("%04d-01-01" % MIN_YEAR, "us").astype(np.int64),
+                 np.datetime64("%04d-01-01" % (MAX_YEAR + 1), "us").astype(np.int64))
+# numpy快速路径处理的文本长度：精确到秒（19个字符）到精确到微秒（26个字符）
+NUMPY_TIME_LENGTHS = (19, 26)
+TIME_BLOCK_ROWS = 1 << 16
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+# 0~9999年每年1月1日距1970-01-01的天数、是否闰年，以及平年各月1日在年内的天数
+YEAR_LEAP = np.array([y % 4 == 0 and (y % 100 != 0 or y % 400 == 0) for y in range(10000)])
+YEAR_DAYS = np.concatenate([[0], np.cumsum(365 + YEAR_LEAP[:-1])]) - (1970 * 365 + YEAR_LEAP[:1970].sum())
+MONTH_START_DAYS = np.concatenate([[0], np.cumsum(DAYS_IN_MONTH[:-1])])
+# 时间文本前后允许出现的空白（定长字节串末尾补的是\0）
+TIME_BLANKS = np.zeros(256, dtype=bool)
+TIME_BLANKS[list(b" \t\r\n\0")] = True
+
+
+# 各字节的数字乘以权重后求和，一次矩阵乘法得到年、月、日、时、分、秒和小数秒（纳秒）七个字段
+def _time_field_weights():
+    weights = np.zeros((TIME_WIDTH, len(TIME_FIELDS) + 1))
+    for i, (start, stop) in enumerate(TIME_FIELDS):
+        for j in range(start, stop):
+            weights[j, i] = 10 ** (stop - 1 - j)
+    for k in range(9):
+        weights[20 + k, len(TIME_FIELDS)] = 10 ** (8 - k)
+    return weights
+
+
+TIME_FIELD_WEIGHTS = _time_field_weights()
+TIME_DIGIT_POSITIONS = [j for start, stop in TIME_FIELDS for j in range(start, stop)]
+
+
+# 把整列measure_time一次性解析成int64纳秒时间戳，无法解析的位置为NAT
+def parse_time_ns(values):
+    values = pd.Series(values, copy=False)
+    if pd.api.types.is_datetime64_dtype(values.dtype):
+        return values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    # 已经是纳秒时间戳（如列式缓存按"ns"读出的时间列）
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.to_numpy(dtype=np.int64)
+    values = values.to_numpy()
+    # 文本列先尝试numpy内置的ISO时间解析，整列都符合格式时使用，否则整列按字节解析
+    if values.dtype.kind != "S":
+        res = _parse_time_numpy(values.astype(object))
+        if res is not None:
+            return res
+    return parse_time_bytes(_to_bytes(values))
+
+
+# numpy内置的ISO时间解析（C实现，整列一次完成）比按字节解析快，但接受的格式更宽（只有日期、不带秒、带时区、
+# 带正负号或5位的年份等），超出范围的年份换算成纳秒时还会溢出。只在每行都是以数字开头、长度19~26的文本，
+# 解析时没有告警，且年份在MIN_YEAR~MAX_YEAR之间时采用，结果与按字节解析相同；否则返回None
+def _parse_time_numpy(values):
+    if len(values) == 0:
+        return None
+    try:
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+        if lengths.min() < NUMPY_TIME_LENGTHS[0] or lengths.max() > NUMPY_TIME_LENGTHS[1]:
+            return None
+        if not ((values >= "0") & (values < ":")).all():
+            return None
+        with warnings.catch_warnings():
+            # 带时区、尾部空白等格式numpy只给出DeprecationWarning，按不合格式处理
+            warnings.simplefilter("error")
+            us = values.astype("datetime64[us]").view(np.int64)
+    except (ValueError, TypeError, DeprecationWarning):
+        return None
+    if us.min() < TIME_RANGE_US[0] or us.max() >= TIME_RANGE_US[1]:
+        return None
+    return us * 1000
+
+
+# 在定长字节串数组上按字节位置直接算出各字段，整列一次完成（按块处理以限制中间数组的大小），返回int64纳秒时间戳
+# 兼容两端夹杂的制表符/空格、不带小数秒以及小数位数不定的格式，其它内容为NAT
+def parse_time_bytes(arr):
+    n, width = len(arr), arr.dtype.itemsize
+    res = np.full(n, NAT, dtype=np.int64)
+    if n == 0 or width < 19:
+        return res
+    b = np.ascontiguousarray(arr).view(np.uint8).reshape(n, width)
+    for start in range(0, n, TIME_BLOCK_ROWS):
+        block = b[start:start + TIME_BLOCK_ROWS]
+        fast, ns = _parse_time_words(block)
+        res[start:start + len(block)] = ns
+        if fast.all():
+            continue
+        # 两端有空白的行去掉空白后再走一次快速路径，仍然处理不了的（小数超过9位或格式不对）逐字节列重新解析
+        slow = np.flatnonzero(~fast)
+        trimmed = _strip_blanks(block[slow])
+        fast, ns = _parse_time_words(trimmed)
+        res[start + slow] = ns
+        if not fast.all():
+            res[start + slow[~fast]] = _parse_time_block(trimmed[~fast])
+    return res
+
+
+# 去掉行首的空白，时间文本之后（第19字节起）的空白置为\0
+def _strip_blanks(b):
+    leading = TIME_BLANKS[b[:, 0]]
+    b = _strip_leading(b, leading) if leading.any() else b.copy()
+    tail = b[:, 19:]
+    tail[TIME_BLANKS[tail]] = 0
+    return b
+
+
+def _words(value):
+    return np.uint64(int.from_bytes(bytes([value]) * 8, "little"))
+
+
+# 快速路径：每行补齐到32字节后看成4个小端uint64，8个字节一起判断是否为数字、一起换算成整数
+# 只处理"YYYY-MM-DD HH:MM:SS[.数字]"后面全是\0的行，返回(是否由快速路径处理, 纳秒时间戳)
+def _parse_time_words(b):
+    n, width = b.shape
+    fast = np.ones(n, dtype=bool)
+    if width < 32:
+        b = np.concatenate([b, np.zeros((n, 32 - width), dtype=np.uint8)], axis=1)
+    elif width > 32:
+        fast &= ~b[:, 32:].any(axis=1)
+        b = np.ascontiguousarray(b[:, :32])
+    w0, w1, w2, w3 = np.ascontiguousarray(b.view("<u8").T)
+    u = np.uint64
+    # 年月日、时分秒各拼成8个数字字符：YYYYMMDD、HHMMSS00
+    date = (w0 & u(0xFFFFFFFF)) | ((w0 >> u(8)) & u(0xFFFF00000000)) | (w1 << u(48))
+    hms = ((w1 >> u(24)) & u(0xFFFF)) | ((w1 >> u(32)) & u(0xFFFF0000)) | ((w2 & u(0xFFFF00)) << u(24)) | \
+        u(0x3030000000000000)
+    # 小数秒的前8位和第9位，之后到第32字节必须是\0
+    fraction = (w2 >> u(32)) | (w3 << u(32))
+    ninth = (w3 >> u(32)) & u(0xFF)
+    fast &= (_non_digits(date) | _non_digits(hms)) == 0
+    fast &= (w0 & u(0xFF0000FF00000000)) == u(0x2D00002D00000000)
+    separator = (w1 >> u(16)) & u(0xFF)
+    fast &= ((separator == ord(" ")) | (separator == ord("T"))) & (((w1 >> u(40)) & u(0xFF)) == ord(":")) & \
+        ((w2 & u(0xFF)) == ord(":")) & ((w3 >> u(40)) == 0)
+    dot = (w2 >> u(24)) & u(0xFF)
+    # 小数部分是若干数字后接\0：第一个非数字字节及其后的字节都必须是\0
+    flags = _non_digits(fraction)
+    fast &= (fraction & _bytes_from_first(flags)) == 0
+    fast &= np.where(flags != 0, ninth == 0, (ninth == 0) | ((ninth >= ord("0")) & (ninth <= ord("9"))))
+    fast &= (dot == ord(".")) | ((dot == 0) & (fraction == 0) & (ninth == 0))
+
+    # 两两合并后每个偶数字节是一个两位数：YY YY MM DD、HH MM SS
+    date = _digit_pairs(date)
+    hms = _digit_pairs(hms)
+    year = (date & u(0xFF)) * u(100) + ((date >> u(16)) & u(0xFF))
+    nanos = _parse_digits(fraction | _words(ord("0"))) * 10 + ((ninth | u(ord("0"))) - u(ord("0"))).astype(np.int64)
+    ns, valid = _to_ns(year.astype(np.int64), ((date >> u(32)) & u(0xFF)).astype(np.int64),
+                       (date >> u(48)).astype(np.int64), (hms & u(0xFF)).astype(np.int64),
+                       ((hms >> u(16)) & u(0xFF)).astype(np.int64), ((hms >> u(32)) & u(0xFF)).astype(np.int64), nanos)
+    fast &= valid
+    return fast, np.where(fast, ns, NAT)
+
+
+# 每个字节不是数字字符时该字节的高4位非0
+def _non_digits(words):
+    t = words ^ _words(ord("0"))
+    return (t | ((t & _words(0x0F)) + _words(0x06))) & _words(0xF0)
+
+
+# flags中第一个非0字节及其后的所有字节置为0xFF
+def _bytes_from_first(flags):
+    u = np.uint64
+    flags = flags | (flags << u(8))
+    flags = flags | (flags << u(16))
+    flags = flags | (flags << u(32))
+    return ((((flags >> u(4)) + _words(0x0F)) & _words(0x10)) >> u(4)) * u(0xFF)
+
+
+# 8个数字字符（第一个字符在最低字节）相邻两位合并，每个偶数字节得到一个两位数
+def _digit_pairs(words):
+    v = words - _words(ord("0"))
+    return (v * np.uint64(10) + (v >> np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+
+
+# 8个数字字符换算成整数：相邻两位、四位、八位依次合并
+def _parse_digits(words):
+    u = np.uint64
+    v = _digit_pairs(words)
+    v = (v * u(100) + (v >> u(16))) & u(0x0000FFFF0000FFFF)
+    v = (v * u(10000) + (v >> u(32))) & u(0xFFFFFFFF)
+    return v.astype(np.int64)
+
+
+# 各字段合成纳秒时间戳，同时检查各字段的取值范围（年份为4位数字，查表得到天数，超出MIN_YEAR~MAX_YEAR的无效）
+def _to_ns(year, month, day, hour, minute, second, nanos):
+    valid = (year >= MIN_YEAR) & (year <= MAX_YEAR)
+    year = np.clip(year, MIN_YEAR, MAX_YEAR)
+    month_index = np.clip(month, 1, 12) - 1
+    leap_day = YEAR_LEAP[year] & (month_index >= 2)
+    month_days = DAYS_IN_MONTH[month_index] + (YEAR_LEAP[year] & (month_index == 1))
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) & (hour <= 23) & \
+        (minute <= 59) & (second <= 59)
+    days = YEAR_DAYS[year] + MONTH_START_DAYS[month_index] + leap_day + day - 1
+    return (days * 86400 + hour * 3600 + minute * 60 + second) * 1000000000 + nanos, valid
+
+
+# 通用路径：逐字节列判断和换算，兼容超过9位的小数（行首的空白已经去掉）
+def _parse_time_block(b):
+    n, width = b.shape
+    if width < TIME_WIDTH:
+        b = np.concatenate([b, np.zeros((n, TIME_WIDTH - width), dtype=np.uint8)], axis=1)
+    # 字节减去'0'后不超过9的是数字，其它字节（包括小于'0'的）减法回绕后都大于9
+    digits = b - np.uint8(ord("0"))
+    is_digit = digits <= 9
+    valid = is_digit[:, TIME_DIGIT_POSITIONS].all(axis=1)
+    for j, char in TIME_SEPARATORS:
+        valid &= (b[:, j] == ord(char)) | (j == 10) & (b[:, j] == ord("T"))
+    # 小数秒：'.'之后连续的数字，之后只能是空白
+    dot = b[:, 19] == ord(".")
+    valid &= dot | TIME_BLANKS[b[:, 19]]
+    fraction = np.logical_and.accumulate(is_digit[:, 20:], axis=1) & dot[:, None]
+    valid &= (fraction | TIME_BLANKS[b[:, 20:]]).all(axis=1)
+
+    values = digits[:, :TIME_WIDTH].astype(np.float64)
+    values[:, 20:] *= fraction[:, :TIME_WIDTH - 20]
+    year, month, day, hour, minute, second, nanos = (values @ TIME_FIELD_WEIGHTS).astype(np.int64).T
+    ns, in_range = _to_ns(year, month, day, hour, minute, second, nanos)
+    return np.where(valid & in_range, ns, NAT)
+
+
+# 去掉行首的空白：行首是空白的行整体左移一个字节、右侧补\0，直到行首不再是空白（通常只有一个）
+def _strip_leading(b, leading):
+    b = b.copy()
+    rows = np.flatnonzero(leading)
+    for _ in range(b.shape[1]):
+        if len(rows) == 0:
+            break
+        b[rows, :-1] = b[rows, 1:]
+        b[rows, -1] = 0
+        rows = rows[TIME_BLANKS[b[rows, 0]] & (b[rows, 0] != 0)]
+    return b
+
+
+# 转换成定长字节串数组，空值和非ASCII文本转换后都不是合法的时间
+def _to_bytes(values):
+    if values.dtype.kind == "S":
+        return values
+    try:
+        return values.astype("S")
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return np.array([str(v).encode("ascii", "replace") for v in values], dtype="S")
+
+
+# 解析单个时间文本，返回int64纳秒时间戳（无法解析为NAT），同一文本的结果会被缓存
+@functools.lru_cache(maxsize=1 << 16)
+def parse_time_scalar(text):
+    return int(parse_time_bytes(_to_bytes(np.array([str(text)], dtype=object)))[0])
+
+
+# 纳秒时间戳转换成datetime（不带时区）
+def ns_to_datetime(ns):
+    return datetime(1970, 1, 1) + timedelta(microseconds=ns // 1000)
+
+
+# 计算两列时间之差（end - start），返回以秒为单位的float64数组，任一端无法解析则为NaN
+def duration_seconds(end_times, start_times):
+    end_ns = parse_time_ns(end_times)
+    start_ns = parse_time_ns(start_times)
+    res = (end_ns - start_ns) / 1e9
+    res[(end_ns == NAT) | (start_ns == NAT)] = np.nan
+    return res
+
+
+# 把整列duration文本换算成unit单位的float64（默认秒），数值列原样返回，无法解析的位置为NaN
+def parse_duration(values, unit="s"):
+    values = pd.Series(values, copy=False).reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.to_numpy(dtype=np.float64)
+    text = values.astype(str).str.strip()
+    res = np.full(len(text), np.nan)
+    valid = text.str.fullmatch(r"-?(?:%s)+" % DURATION_PART).to_numpy(dtype=bool)
+    if valid.any():
+        parts = text[valid].str.extractall(DURATION_PART)
+        # 单位换算系数由整数纳秒相除得到，同单位时系数恰好为1，不引入舍入误差
+        factors = {name: ns / DURATION_UNITS[unit] for name, ns in DURATION_UNITS.items()}
+        total = (parts[0].astype(float) * parts[1].map(factors)).groupby(level=0).sum()
+        sign = np.where(text[total.index].str.startswith("-"), -1.0, 1.0)
+        res[total.index.to_numpy()] = total.to_numpy() * sign
+    return res
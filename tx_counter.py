@@ -0,0 +1,123 @@
+# coding=utf-8
+import json
+import os
+import threading
+
+# 记住最近计数的多少个区块的哈希和交易数，链重组深度不超过它时只回退被重组掉的区块，否则从头计数
+REORG_DEPTH = 64
+
+
+# 链上交易总数的增量计数器：只拉取上次计数高度之后的新区块，状态落盘，进程重启后接着数
+# rpc为RpcClient，新区块的交易数按batch_size个一批批量请求
+class TxCounter:
+    def __init__(self, rpc, state_path, batch_size=200):
+        self.rpc = rpc
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.genesis = None
+        # 本进程内是否已确认状态文件和当前连接的链一致
+        self.checked = False
+        self.height = -1
+        self.total = 0
+        # 最近计数的区块[[高度, 哈希, 交易数], ...]，按高度递增且连续，最后一个是height
+        self.recent = []
+        self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            self.genesis = state["genesis"]
+            self.height = int(state["height"])
+            self.total = int(state["total"])
+            # 旧版本的状态文件没有recent，从之后计数的区块开始记录
+            self.recent = state.get("recent", [])
+        except (OSError, ValueError, KeyError):
+            self.genesis, self.height, self.total, self.recent = None, -1, 0, []
+
+    # 先写临时文件再替换，避免写到一半时进程退出导致状态文件损坏
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"genesis": self.genesis, "height": self.height, "total": self.total, "recent": self.recent}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def reset(self, genesis):
+        self.genesis, self.height, self.total, self.recent = genesis, -1, 0, []
+
+    # 校验是否换链、是否重组的读取都不经过RpcClient的区块缓存
+    def get_genesis_hash(self):
+        return self.rpc.call("eth_getBlockByNumber", ["0x0", False], cache=False)["hash"]
+
+    def get_blocks(self, heights):
+        return self.rpc.batch("eth_getBlockByNumber", [[hex(h), False] for h in heights]) if heights else []
+
+    # 最后计数的区块是否还在当前链上（同一高度或更高处发生重组时它的哈希会变）
+    def on_chain(self, head):
+        if self.height > head:
+            return False
+        if not self.recent:
+            return True
+        block = self.rpc.call("eth_getBlockByNumber", [hex(self.height), False], cache=False)
+        return block is not None and block["hash"] == self.recent[-1][1]
+
+    # 回退到最近计数的区块中仍在当前链上的最高一个，减去被重组掉的区块的交易数
+    # 分叉点早于recent中最早的区块时返回False
+    def rollback(self, head):
+        recent = [entry for entry in self.recent if entry[0] <= head]
+        blocks = self.get_blocks([entry[0] for entry in recent])
+        for entry, block in reversed(list(zip(recent, blocks))):
+            if block is not None and block["hash"] == entry[1]:
+                keep = self.recent.index(entry) + 1
+                self.total -= sum(count for _, _, count in self.recent[keep:])
+                self.recent = self.recent[:keep]
+                self.height = entry[0]
+                return True
+        return False
+
+    # 统计(height, head]区间内区块的交易数，每批处理完都落盘
+    # 离链头REORG_DEPTH个块以内的区块按块取，同时记下哈希；更早的区块只取交易数
+    def update(self, head):
+        # 已有请求在追赶新区块时不排队等待，直接返回当前计数
+        if not self.lock.acquire(blocking=False):
+            return self.total
+        try:
+            if not self.checked:
+                genesis = self.get_genesis_hash()
+                if genesis != self.genesis:
+                    # 节点换链，从头开始计数
+                    self.reset(genesis)
+                self.checked = True
+            if self.height >= 0 and not self.on_chain(head):
+                if not self.rollback(head):
+                    # 重组太深或链被重置，从头开始计数
+                    self.reset(self.get_genesis_hash())
+                self.save_state()
+            while self.height < head:
+                start = self.height + 1
+                end = min(head, start + self.batch_size - 1)
+                tail = max(start, head - REORG_DEPTH + 1)
+                if start < tail:
+                    counts = self.rpc.batch("eth_getBlockTransactionCountByNumber",
+                                            [[hex(i)] for i in range(start, min(end + 1, tail))])
+                    self.total += sum(int(c, 16) for c in counts)
+                    self.height = start + len(counts) - 1
+                    # 这些区块没有记哈希，recent不再连续，之前的记录作废
+                    self.recent = []
+                heights = list(range(tail, end + 1))
+                for height, block in zip(heights, self.get_blocks(heights)):
+                    # 取块期间链变短了：剩下的区块等下次再数
+                    if block is None:
+                        break
+                    count = len(block["transactions"])
+                    self.total += count
+                    self.height = height
+                    self.recent.append([height, block["hash"], count])
+                self.recent = self.recent[-REORG_DEPTH:]
+                self.save_state()
+                if self.height < end:
+                    break
+            return self.total
+        finally:
+            self.lock.release()
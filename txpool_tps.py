@@ -0,0 +1,125 @@
+# coding=utf-8
+import os
+import threading
+
+import numpy as np
+
+from timeutil import NAT, parse_time_ns
+
+
+# 定长环形缓冲区，按到达顺序保存最近的交易到达时间戳（纳秒）
+class ArrivalRing:
+    def __init__(self, capacity):
+        self.buf = np.zeros(capacity, dtype=np.int64)
+        self.capacity = capacity
+        self.size = 0
+        self.pos = 0
+
+    def clear(self):
+        self.size = 0
+        self.pos = 0
+
+    def extend(self, timestamps):
+        timestamps = timestamps[-self.capacity:]
+        n = len(timestamps)
+        first = min(n, self.capacity - self.pos)
+        self.buf[self.pos:self.pos + first] = timestamps[:first]
+        self.buf[:n - first] = timestamps[first:]
+        self.pos = (self.pos + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    # 每次追加的时间戳各自有序，但前后两次追加之间可能交错（记录文件中的时间不严格递增），
+    # 所以最早、最晚和计数都按整个缓冲区计算，不假定各段有序
+    def oldest(self):
+        return self.buf[:self.size].min()
+
+    def newest(self):
+        return self.buf[:self.size].max()
+
+    # 统计时间戳大于t的记录数
+    def count_after(self, t):
+        return int(np.count_nonzero(self.buf[:self.size] > t))
+
+
+# 跟踪transaction_pool_input_throughput.csv的尾部，按时间窗口计算交易池TPS
+class TxpoolTpsWindow:
+    def __init__(self, path, capacity=1 << 20, bootstrap_bytes=4 << 20):
+        self.path = path
+        self.ring = ArrivalRing(capacity)
+        self.bootstrap_bytes = bootstrap_bytes
+        self.lock = threading.Lock()
+        self.offset = None
+        self.inode = None
+
+    # 读取文件新追加的完整行，把其中的measure_time放入环形缓冲区
+    def poll(self):
+        st = os.stat(self.path)
+        if self.offset is None or st.st_size < self.offset or st.st_ino != self.inode:
+            # 第一次打开或文件被重建：只读末尾一段，不解析整个文件
+            self.ring.clear()
+            self.offset = max(0, st.st_size - self.bootstrap_bytes)
+            self.inode = st.st_ino
+            bootstrap = self.offset > 0
+        else:
+            bootstrap = False
+        if st.st_size == self.offset:
+            return
+        with open(self.path, "rb") as f:
+            # 从文件中间开始读时，只有起点前一个字节不是换行符才说明第一行不完整
+            skip_partial = False
+            if bootstrap:
+                f.seek(self.offset - 1)
+                skip_partial = f.read(1) != b"\n"
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        end = chunk.rfind(b"\n") + 1
+        self.offset += end
+        chunk = chunk[:end]
+        if skip_partial:
+            chunk = chunk[chunk.find(b"\n") + 1:]
+        if not chunk:
+            return
+        # 表头行解析失败会得到NAT，直接丢弃
+        times = [line.split(b",", 1)[0].decode("utf-8", "replace") for line in chunk.splitlines()]
+        timestamps = parse_time_ns(times)
+        timestamps = np.sort(timestamps[timestamps != NAT])
+        if len(timestamps):
+            self.ring.extend(timestamps)
+
+    # 以最后一条记录的时间为终点，计算最近window秒内的TPS
+    def tps(self, window):
+        with self.lock:
+            self.poll()
+            if self.ring.size < 2:
+                return 0.0
+            end = self.ring.newest()
+            start = end - int(window * 1e9)
+            # 缓冲区装不下整个窗口或记录时长不足一个窗口时，按实际覆盖的时长计算
+            span_start = max(start, self.ring.oldest())
+            duration = (end - span_start) / 1e9
+            if duration <= 0:
+                return 0.0
+            return self.ring.count_after(span_start) / duration
+
+
+# 按文件路径维护TPS窗口
+class TxpoolTpsRegistry:
+    def __init__(self):
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def tps(self, path, window):
+        path = os.path.abspath(path)
+        with self.lock:
+            tracker = self.windows.get(path)
+            if tracker is None:
+                tracker = TxpoolTpsWindow(path)
+                self.windows[path] = tracker
+        return tracker.tps(window)
+
+    def clear(self):
+        with self.lock:
+            self.windows = {}
+
+
+txpool_tps_registry = TxpoolTpsRegistry()